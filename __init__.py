@@ -30,6 +30,7 @@ bl_info = {
 #--- ### Imports
 import bpy
 import socket
+import os
 from bpy.utils import register_module,unregister_module
 
 if "init_data" in locals():
@@ -40,6 +41,28 @@ if "init_data" in locals():
     imp.reload(decoder)
     imp.reload(server)
     imp.reload(utils)
+    imp.reload(locks)
+    imp.reload(registry)
+    imp.reload(identity)
+    imp.reload(sequencer)
+    imp.reload(binformat)
+    imp.reload(snapshot)
+    imp.reload(scheduler)
+    imp.reload(streaming)
+    imp.reload(oplog)
+    imp.reload(transformer)
+    imp.reload(interest)
+    imp.reload(preview)
+    imp.reload(workers)
+    imp.reload(membership)
+    imp.reload(transport)
+    imp.reload(reliable)
+    imp.reload(multicast)
+    imp.reload(outbound)
+    imp.reload(priority)
+    imp.reload(threadpool)
+    imp.reload(leases)
+    imp.reload(meshdelta)
 else:
     from . import client
     from . import ui
@@ -47,6 +70,28 @@ else:
     from . import decoder
     from . import server
     from . import utils
+    from . import locks
+    from . import registry
+    from . import identity
+    from . import sequencer
+    from . import binformat
+    from . import snapshot
+    from . import scheduler
+    from . import streaming
+    from . import oplog
+    from . import transformer
+    from . import interest
+    from . import preview
+    from . import workers
+    from . import membership
+    from . import transport
+    from . import reliable
+    from . import multicast
+    from . import outbound
+    from . import priority
+    from . import threadpool
+    from . import leases
+    from . import meshdelta
 
 #--- ### Register
 def register():
@@ -68,11 +113,107 @@ def register():
                                                 ),
                                     default = "CLIENT")
     bpy.types.Scene.selected_internals = bpy.props.StringProperty()
+    #a string property that stores the ids of the last selected objects (a json list, same order as active_obj_name)
+    bpy.types.Scene.active_obj_ids = bpy.props.StringProperty()
     bpy.types.Scene.server_filepath = bpy.props.StringProperty(default = utils.format_file_path(utils.get_file_path())+"/files/server")
     bpy.types.Scene.client_filepath = bpy.props.StringProperty(default = utils.format_file_path(utils.get_file_path())+"/files/client")
     bpy.types.Scene.session_name = bpy.props.StringProperty(default = "sample")
     bpy.types.Scene.encode_flag = bpy.props.BoolProperty(default=False)
     bpy.types.Scene.last_op = bpy.props.StringProperty(default= "")
+    #a boolean property that enables ordering of operations by the server, with optimistic local apply on clients
+    bpy.types.Scene.sequencing = bpy.props.BoolProperty(default=False)
+    #a float property that stores the number of seconds between synchronization ticks
+    bpy.types.Scene.sync_interval = bpy.props.FloatProperty(default=1.0,min=0.05)
+    #an enum property that selects how a snapshot is applied to the scene when a session is joined or resynced
+    bpy.types.Scene.load_mode = bpy.props.EnumProperty(
+                                    items = (
+                                                    ("FULL","Full","Clear the scene and import the whole snapshot"),
+                                                    ("DIFF","Diff","Only add, remove or patch the objects that differ from the snapshot")
+                                                ),
+                                    default = "FULL")
+    #an enum property that selects the file format of the session snapshots
+    bpy.types.Scene.snapshot_format = bpy.props.EnumProperty(
+                                    items = (
+                                                    ("DAE","Collada","Collada (.dae) files"),
+                                                    ("BINARY","Binary","Memory-mapped binary (.clb) files")
+                                                ),
+                                    default = "DAE")
+    #float properties that store how long the server waits without changes (quiet) or at most (max) before writing a snapshot
+    bpy.types.Scene.snapshot_quiet = bpy.props.FloatProperty(default=2.0,min=0.0)
+    bpy.types.Scene.snapshot_max_interval = bpy.props.FloatProperty(default=10.0,min=0.0)
+    #an enum property that selects how a client joins a session
+    bpy.types.Scene.join_mode = bpy.props.EnumProperty(
+                                    items = (
+                                                    ("FULL","Full","Download and load the whole snapshot before starting"),
+                                                    ("PROGRESSIVE","Progressive","Start with proxies and stream meshes in the background (binary snapshots only)")
+                                                ),
+                                    default = "FULL")
+    #properties of the interest of a client, the operations on other objects are not sent to it
+    bpy.types.Scene.interest_mode = bpy.props.EnumProperty(
+                                    items = (
+                                                    ("ALL","All","Receive every operation in the session"),
+                                                    ("CUSTOM","Custom","Receive only the operations on the interest objects, groups and region")
+                                                ),
+                                    default = "ALL",
+                                    update = interest.mark_changed)
+    #a string property that stores the ids of the interest objects (a json list)
+    bpy.types.Scene.interest_objects = bpy.props.StringProperty(default="[]",update=interest.mark_changed)
+    #a string property that stores the names of the interest groups separated by commas
+    bpy.types.Scene.interest_collections = bpy.props.StringProperty(default="",update=interest.mark_changed)
+    bpy.types.Scene.interest_use_region = bpy.props.BoolProperty(default=False,update=interest.mark_changed)
+    bpy.types.Scene.interest_min = bpy.props.FloatVectorProperty(default=(-10.0,-10.0,-10.0),subtype='XYZ',update=interest.mark_changed)
+    bpy.types.Scene.interest_max = bpy.props.FloatVectorProperty(default=(10.0,10.0,10.0),subtype='XYZ',update=interest.mark_changed)
+    #a boolean property that tells a running session to send the changed interest to the server
+    bpy.types.Scene.interest_changed = bpy.props.BoolProperty(default=False)
+    #properties of the live preview, the transforms of drags are streamed at preview_rate (per second) and received previews
+    #are undone after preview_timeout seconds without samples if no operation committed them
+    bpy.types.Scene.live_preview = bpy.props.BoolProperty(default=False)
+    bpy.types.Scene.preview_rate = bpy.props.FloatProperty(default=20.0,min=1.0,max=60.0)
+    bpy.types.Scene.preview_timeout = bpy.props.FloatProperty(default=5.0,min=0.5)
+    #an int property that stores the number of worker processes of the server (0 runs the jobs in the server process)
+    bpy.types.Scene.worker_processes = bpy.props.IntProperty(default=max(1,(os.cpu_count() or 2) - 1),min=0,max=64)
+    #an int property that stores the number of threads serving register requests and sending to the clients (server)
+    bpy.types.Scene.worker_threads = bpy.props.IntProperty(default=8,min=1,max=256)
+    #float properties that store the number of seconds between heartbeats and of silence after which a client is evicted
+    bpy.types.Scene.heartbeat_interval = bpy.props.FloatProperty(default=2.0,min=0.1)
+    bpy.types.Scene.heartbeat_timeout = bpy.props.FloatProperty(default=30.0,min=1.0)
+    #an int property that stores the number of messages queued for a client after which it must reload the snapshot (server)
+    bpy.types.Scene.outbound_length = bpy.props.IntProperty(default=256,min=16)
+    #a float property that stores the number of seconds a message may wait in a client's queue before it must reload the snapshot (server)
+    bpy.types.Scene.outbound_lag = bpy.props.FloatProperty(default=5.0,min=0.5)
+    #a string property that stores the classes of operation types that differ from the defaults, e.g. {"rotate": "EDIT"} (server)
+    bpy.types.Scene.priority_classes = bpy.props.StringProperty(default="{}")
+    #a float property that stores the number of seconds an operation may wait before it is processed whatever its class (server)
+    bpy.types.Scene.priority_max_wait = bpy.props.FloatProperty(default=1.0,min=0.01)
+    #a float property that stores the number of milliseconds of a timer tick spent processing operations (server)
+    bpy.types.Scene.process_budget = bpy.props.FloatProperty(default=10.0,min=0.0)
+    #an int property that stores the largest number of operations on disjoint objects applied as one wave (server)
+    bpy.types.Scene.wave_size = bpy.props.IntProperty(default=64,min=1,max=4096)
+    #a string property that stores the queue metrics of every operation class (a json list, shown in the panel)
+    bpy.types.Scene.queue_metrics = bpy.props.StringProperty(default="[]")
+    #a float property that stores the number of seconds an edit lease lasts without being renewed (server)
+    bpy.types.Scene.lease_duration = bpy.props.FloatProperty(default=3.0,min=0.5)
+    #a float property that stores the number of seconds between renewals of the leases of the selected objects (client)
+    bpy.types.Scene.lease_renew = bpy.props.FloatProperty(default=1.0,min=0.1)
+    #a string property that stores the objects with an edit lease and their holders (a json list, shown in the panel)
+    bpy.types.Scene.leases = bpy.props.StringProperty(default="[]")
+    #a string property that stores the members of the session with their round trip times (a json list, shown in the panel)
+    bpy.types.Scene.members = bpy.props.StringProperty(default="[]")
+    #an enum property that selects how a client exchanges data with the server
+    bpy.types.Scene.transport = bpy.props.EnumProperty(
+                                    items = (
+                                                    ("UDP","UDP","Datagrams for operations, a new connection for every request"),
+                                                    ("TCP","TCP","One persistent connection with framed, ordered and reliable delivery"),
+                                                    ("RUDP","Reliable UDP","Acknowledged datagrams, lost operations are retransmitted without stalling the ones behind them"),
+                                                    ("MULTICAST","Multicast","Operations published once to the session's multicast group, missed ones are repaired over unicast (LAN only)")
+                                                ),
+                                    default = "UDP")
+    #a string property that stores the multicast address of the session's group (server)
+    bpy.types.Scene.multicast_group = bpy.props.StringProperty(default="239.255.77.77")
+    #an int property that stores the port the group datagrams are sent to (server)
+    bpy.types.Scene.multicast_port = bpy.props.IntProperty(default=5150,min=1024,max=65535)
+    #a string property that stores the address of the interface to publish on, empty for the default one (127.0.0.1 to test locally)
+    bpy.types.Scene.multicast_interface = bpy.props.StringProperty(default="")
 
 def unregister():
     '''unregisters all classes in this module'''
@@ -84,10 +225,47 @@ def unregister():
     del bpy.types.Scene.server_port
     del bpy.types.Scene.mode
     del bpy.types.Scene.selected_internals
+    del bpy.types.Scene.active_obj_ids
     del bpy.types.Scene.server_filepath
     del bpy.types.Scene.session_name
     del bpy.types.Scene.encode_flag
     del bpy.types.Scene.last_op
+    del bpy.types.Scene.sequencing
+    del bpy.types.Scene.sync_interval
+    del bpy.types.Scene.load_mode
+    del bpy.types.Scene.snapshot_format
+    del bpy.types.Scene.snapshot_quiet
+    del bpy.types.Scene.snapshot_max_interval
+    del bpy.types.Scene.join_mode
+    del bpy.types.Scene.interest_mode
+    del bpy.types.Scene.interest_objects
+    del bpy.types.Scene.interest_collections
+    del bpy.types.Scene.interest_use_region
+    del bpy.types.Scene.interest_min
+    del bpy.types.Scene.interest_max
+    del bpy.types.Scene.interest_changed
+    del bpy.types.Scene.live_preview
+    del bpy.types.Scene.preview_rate
+    del bpy.types.Scene.preview_timeout
+    del bpy.types.Scene.worker_processes
+    del bpy.types.Scene.worker_threads
+    del bpy.types.Scene.heartbeat_interval
+    del bpy.types.Scene.heartbeat_timeout
+    del bpy.types.Scene.outbound_length
+    del bpy.types.Scene.outbound_lag
+    del bpy.types.Scene.priority_classes
+    del bpy.types.Scene.priority_max_wait
+    del bpy.types.Scene.process_budget
+    del bpy.types.Scene.wave_size
+    del bpy.types.Scene.queue_metrics
+    del bpy.types.Scene.lease_duration
+    del bpy.types.Scene.lease_renew
+    del bpy.types.Scene.leases
+    del bpy.types.Scene.members
+    del bpy.types.Scene.transport
+    del bpy.types.Scene.multicast_group
+    del bpy.types.Scene.multicast_port
+    del bpy.types.Scene.multicast_interface
     
 #--- ### Main code
 if __name__ == '__main__':
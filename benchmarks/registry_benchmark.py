@@ -0,0 +1,86 @@
+'''benchmarks the name registry of the server against probing names one at a time
+
+This script does not depend on bpy or on the add-on package, it loads registry.py by path. It is not part of the
+add-on, run it from the add-on folder:
+
+    python benchmarks/registry_benchmark.py [objects...]
+
+Every count is measured allocating names for that many objects of the same type, then deleting every other object
+and allocating their names again (the registry hands out the freed suffixes first). Probing is quadratic, so it is
+only measured up to PROBE_LIMIT objects.
+'''
+
+import os
+import sys
+import time
+import importlib.util
+
+#the add-on folder, registry.py is loaded from it
+ADDON_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#the largest count that is also measured with linear probing
+PROBE_LIMIT = 5000
+
+def load_registry():
+    '''loads the registry module of the add-on by path, under a name that does not shadow other modules'''
+
+    spec = importlib.util.spec_from_file_location("registry_benchmark_registry",os.path.join(ADDON_FOLDER,"registry.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+registry = load_registry()
+
+def run_registry(size):
+    '''allocates, frees and allocates again names with the registry
+
+    Return Value
+    elapsed     -- the number of seconds it took
+    '''
+
+    names = registry.NameRegistry()
+    start = time.perf_counter()
+    allocated = [names.allocate("Cube") for i in range(size)]
+    for name in allocated[::2]:
+        names.remove(name)
+    for i in range(0,size,2):
+        names.allocate("Cube")
+    return time.perf_counter() - start
+
+def run_probing(size):
+    '''allocates, frees and allocates again names by probing "Cube", "Cube.001"... until one is free
+
+    Return Value
+    elapsed     -- the number of seconds it took
+    '''
+
+    existing = set()
+    def allocate():
+        new_name = "Cube"
+        num_id = 1
+        while new_name in existing:
+            new_name = "Cube." + str(num_id).zfill(3)
+            num_id += 1
+        existing.add(new_name)
+        return new_name
+
+    start = time.perf_counter()
+    allocated = [allocate() for i in range(size)]
+    for name in allocated[::2]:
+        existing.discard(name)
+    for i in range(0,size,2):
+        allocate()
+    return time.perf_counter() - start
+
+def benchmark(sizes=(1000,10000,100000)):
+    '''prints the time the registry and probing take for growing numbers of objects'''
+
+    for size in sizes:
+        indexed_time = run_registry(size)
+        if size <= PROBE_LIMIT:
+            probe_time = "{0:.3f}s".format(run_probing(size))
+        else:
+            probe_time = "skipped"
+        print("{0:>7} objects: registry {1:.3f}s, probing {2}".format(size,indexed_time,probe_time))
+
+if __name__ == '__main__':
+    benchmark(tuple(int(arg) for arg in sys.argv[1:]) or (1000,10000,100000))
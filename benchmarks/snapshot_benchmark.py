@@ -0,0 +1,70 @@
+'''benchmarks saving and loading binary snapshots against collada files, on grids of increasing size
+
+This script needs blender, it imports the add-on package from the folder it is in. It is not part of the add-on, run
+it from the add-on folder in an empty blend file (it replaces the objects of the scene):
+
+    blender --background --factory-startup --python benchmarks/snapshot_benchmark.py -- folder [vertices...]
+
+The files are written to the given folder, under the name "benchmark".
+'''
+
+import os
+import sys
+import time
+import importlib
+
+import bpy
+
+#the add-on folder, the package is imported from its parent under the name of the folder
+ADDON_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_snapshot():
+    '''imports the snapshot module of the add-on package'''
+
+    sys.path.insert(0,os.path.dirname(ADDON_FOLDER))
+    return importlib.import_module(os.path.basename(ADDON_FOLDER) + ".snapshot")
+
+snapshot = load_snapshot()
+
+def clear_scene():
+    for obj in list(bpy.context.scene.objects):
+        snapshot.remove_object(obj)
+
+def benchmark(path,vertex_counts=(1000,10000,100000,1000000)):
+    '''prints the time it takes to save and load each grid in both formats
+
+    Parameters
+    path           -- a string containing the filepath of a folder for the temporary files
+    vertex_counts  -- a tuple of the approximate number of vertices of each measured scene
+    '''
+
+    for count in vertex_counts:
+        clear_scene()
+        side = int(round(count ** 0.5))
+        bpy.ops.mesh.primitive_grid_add(x_subdivisions=side,y_subdivisions=side)
+
+        start = time.perf_counter()
+        snapshot.save(path,"benchmark")
+        binary_save = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.load(path,"benchmark")
+        binary_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bpy.ops.wm.collada_export(filepath=path + "/benchmark.dae",triangulate=False)
+        collada_save = time.perf_counter() - start
+        clear_scene()
+        start = time.perf_counter()
+        bpy.ops.wm.collada_import(filepath=path + "/benchmark.dae")
+        collada_load = time.perf_counter() - start
+
+        print("{0:>8} vertices: binary save {1:.3f}s load {2:.3f}s, collada save {3:.3f}s load {4:.3f}s".format(
+            side * side,binary_save,binary_load,collada_save,collada_load))
+
+if __name__ == '__main__':
+    #blender passes the arguments after '--' on to the script
+    args = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    if args == []:
+        print("usage: blender --background --python benchmarks/snapshot_benchmark.py -- folder [vertices...]")
+    else:
+        benchmark(args[0],tuple(int(arg) for arg in args[1:]) or (1000,10000,100000,1000000))
@@ -0,0 +1,281 @@
+'''benchmarks the wave partitioning of the server on a headless model of the scene
+
+This script does not depend on bpy or on the add-on package, it loads priority.py by path. It is not part of the
+add-on, run it from the add-on folder:
+
+    python benchmarks/wave_benchmark.py [clients] [operations] [vertices]
+
+process_wave applies the waves one after the other on the main thread, since blender's data cannot be changed from
+other threads. Within a wave, the transforms are written as one batch and only the vertices of the mesh deltas are
+moved in the worker pool, operators still run one at a time. This script measures what applying every operation of
+a wave in parallel would gain at most, on a model of the scene made of object matrices and vertex coordinates in
+plain lists. The operations are routed by the output of
+OperationScheduler.get_wave alone: the operations of a wave are spread over worker processes along with the objects
+they address, and a wave is only started once the previous one is back. The results are checked against the
+operations applied one at a time in the order they were received.
+'''
+
+import os
+import sys
+import math
+import time
+import random
+import importlib.util
+import multiprocessing
+
+#the add-on folder, priority.py is loaded from it
+ADDON_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_priority():
+    '''loads the priority module of the add-on by path, under a name that does not shadow other modules'''
+
+    spec = importlib.util.spec_from_file_location("wave_benchmark_priority",os.path.join(ADDON_FOLDER,"priority.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+priority = load_priority()
+
+def multiply(a,b):
+    '''multiplies two 4x4 matrices given as lists of rows'''
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+def translation(x,y,z):
+    return [[1.0,0.0,0.0,x],[0.0,1.0,0.0,y],[0.0,0.0,1.0,z],[0.0,0.0,0.0,1.0]]
+
+def delta_matrix(op,pivot):
+    '''gets the matrix of a translate, rotate or resize about a pivot, the same way Decoder.compose_transform does'''
+
+    kind = priority.op_kind(op)
+    if kind == 'translate':
+        return translation(op['x'],op['y'],op['z'])
+    if kind == 'rotate':
+        #the rotate operator turns the selection by the negative of its value about the given axis
+        x,y,z = op['axis_x'],op['axis_y'],op['axis_z']
+        length = math.sqrt(x * x + y * y + z * z) or 1.0
+        x,y,z = x / length,y / length,z / length
+        c,s = math.cos(-op['value']),math.sin(-op['value'])
+        t = 1.0 - c
+        middle = [[t * x * x + c,t * x * y - s * z,t * x * z + s * y,0.0],
+                  [t * x * y + s * z,t * y * y + c,t * y * z - s * x,0.0],
+                  [t * x * z - s * y,t * y * z + s * x,t * z * z + c,0.0],
+                  [0.0,0.0,0.0,1.0]]
+    else:
+        middle = [[op['x'],0.0,0.0,0.0],[0.0,op['y'],0.0,0.0],[0.0,0.0,op['z'],0.0],[0.0,0.0,0.0,1.0]]
+    return multiply(multiply(translation(*pivot),middle),translation(-pivot[0],-pivot[1],-pivot[2]))
+
+def apply_operation(shard,op):
+    '''applies a transform to a shard of the headless scene
+
+    Parameters
+    shard       -- a dict object mapping object ids to dict objects with a 'matrix' (4x4 list of rows) and 'coords' (a
+                   flat list of the local vertex coordinates)
+    op          -- a dict object representing a translate, rotate or resize operation, objects are addressed by id
+
+    Object mode transforms change the matrices of the targets about their median point, edit mode transforms move the
+    selected vertices of the active object about their median point.
+    '''
+
+    if op['mode'] == 'OBJECT':
+        targets = [obj_id for obj_id in op['target_ids'] if obj_id in shard]
+        if targets == []:
+            return
+        pivot = [sum(shard[obj_id]['matrix'][axis][3] for obj_id in targets) / len(targets) for axis in range(3)]
+        delta = delta_matrix(op,pivot)
+        for obj_id in targets:
+            shard[obj_id]['matrix'] = multiply(delta,shard[obj_id]['matrix'])
+        return
+
+    obj = shard.get(op['active_id'])
+    if obj is None or op['verts'] == []:
+        return
+    coords = obj['coords']
+    pivot = [sum(coords[3 * index + axis] for index in op['verts']) / len(op['verts']) for axis in range(3)]
+    delta = delta_matrix(op,pivot)
+    for index in op['verts']:
+        x,y,z = coords[3 * index],coords[3 * index + 1],coords[3 * index + 2]
+        for axis in range(3):
+            row = delta[axis]
+            coords[3 * index + axis] = row[0] * x + row[1] * y + row[2] * z + row[3]
+
+def checksum(shard):
+    '''sums the matrices and coordinates of a shard, equal results mean the operations were applied the same way'''
+    total = 0.0
+    for obj in shard.values():
+        total += sum(sum(row) for row in obj['matrix']) + sum(obj['coords'])
+    return total
+
+def make_workload(clients,count,objects=4,verts=2000,shared=8,seed=1):
+    '''builds a headless scene and a stream of operations from many users
+
+    Parameters
+    clients     -- the number of users, each one edits objects of its own
+    count       -- the number of operations
+    objects     -- the number of objects of each user
+    verts       -- the number of vertices of each object
+    shared      -- the number of objects all users edit, their operations conflict
+    seed        -- the seed of the random choices, so every run gets the same workload
+
+    Return Value
+    scene       -- a dict object mapping object ids to their headless state (see apply_operation)
+    ops         -- a list of dict objects representing the operations, in the order they are received
+    '''
+
+    rng = random.Random(seed)
+    scene = {}
+    for owner in range(clients + shared):
+        ids = ['o{0}.{1}'.format(owner,k) for k in range(objects)] if owner < clients else ['s{0}'.format(owner - clients)]
+        for obj_id in ids:
+            scene[obj_id] = {
+                'matrix' : translation(rng.uniform(-10,10),rng.uniform(-10,10),rng.uniform(-10,10)),
+                'coords' : [rng.uniform(-1,1) for i in range(3 * verts)]
+            }
+
+    ops = []
+    for i in range(count):
+        client = rng.randrange(clients)
+        chance = rng.random()
+        kind = rng.choice(('Translate','Rotate','Resize'))
+        op = {
+            'name' : kind,
+            'x' : rng.uniform(-0.1,0.1),'y' : rng.uniform(-0.1,0.1),'z' : rng.uniform(-0.1,0.1),
+            'value' : rng.uniform(-0.5,0.5),'axis_x' : 0.0,'axis_y' : 0.0,'axis_z' : 1.0
+        }
+        if kind == 'Resize':
+            op['x'],op['y'],op['z'] = 1.0 + op['x'],1.0 + op['y'],1.0 + op['z']
+        if chance < 0.01:
+            #an operation that addresses no object is a barrier, it is applied alone
+            op = {'name' : 'Select All','mode' : 'NONE','targets' : [],'target_ids' : [],'active_object' : '','active_id' : ''}
+        elif chance < 0.3:
+            own = ['o{0}.{1}'.format(client,k) for k in rng.sample(range(objects),rng.randint(1,objects))]
+            op.update({'mode' : 'OBJECT','targets' : own,'target_ids' : own,'active_object' : own[0],'active_id' : own[0]})
+        else:
+            if chance < 0.4:
+                obj_id = 's{0}'.format(rng.randrange(shared))
+            else:
+                obj_id = 'o{0}.{1}'.format(client,rng.randrange(objects))
+            selected = sorted(rng.sample(range(verts),verts // 4))
+            op.update({'mode' : 'EDIT_MESH','targets' : [obj_id],'target_ids' : [obj_id],'active_object' : obj_id,
+                       'active_id' : obj_id,'verts' : selected,'edges' : [],'faces' : []})
+        ops.append(op)
+    return scene,ops
+
+def run_sequential(scene,ops):
+    '''applies the operations one at a time in the order they were received
+
+    Return Value
+    elapsed     -- the number of seconds it took
+    total       -- the checksum of the scene afterwards
+    '''
+
+    scene = dict((obj_id,{'matrix' : obj['matrix'],'coords' : list(obj['coords'])}) for obj_id,obj in scene.items())
+    start = time.perf_counter()
+    for op in ops:
+        apply_operation(scene,op)
+    return time.perf_counter() - start,checksum(scene)
+
+def keys_of(op):
+    '''gets the ids of the objects an operation addresses'''
+    return (set(op.get('target_ids') or []) | set([op.get('active_id','')])) - set([''])
+
+def wave_worker(conn):
+    '''applies the operations sent over a pipe to the objects sent along with them (process function)
+
+    Every message is a tuple (objects, operations) and is answered with the changed objects. None ends the worker.
+    '''
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            conn.close()
+            return
+        objects,ops = message
+        for op in ops:
+            apply_operation(objects,op)
+        conn.send(objects)
+
+def run_waves(scene,ops,workers,wave_size=64):
+    '''applies the operations in waves, spreading the operations of each wave over worker processes
+
+    Parameters
+    scene       -- a dict object mapping object ids to their headless state
+    ops         -- a list of dict objects representing the operations, in the order they are received
+    workers     -- the number of worker processes
+    wave_size   -- the largest number of operations of a wave
+
+    Return Value
+    elapsed     -- the number of seconds it took
+    total       -- the checksum of the scene afterwards
+
+    The operations of a wave address disjoint objects (see OperationScheduler.get_wave), so each worker gets a slice
+    of the wave and a copy of the objects the slice addresses, whatever worker had them before. Nothing else keeps
+    conflicting operations apart, a wave that breaks the guarantee shows up as a differing checksum.
+    '''
+
+    scene = dict((obj_id,{'matrix' : obj['matrix'],'coords' : list(obj['coords'])}) for obj_id,obj in scene.items())
+    conns = []
+    processes = []
+    for i in range(workers):
+        parent,child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=wave_worker,args=(child,),daemon=True)
+        process.start()
+        conns.append(parent)
+        processes.append(process)
+
+    scheduler = priority.OperationScheduler(max_wait=float('inf'))
+    for op in ops:
+        scheduler.put({'operation' : op})
+
+    start = time.perf_counter()
+    while not scheduler.empty():
+        wave = [data['operation'] for data in scheduler.get_wave(wave_size)]
+        #a barrier changes nothing in the headless scene, it only has to wait for the waves before it
+        wave = [op for op in wave if keys_of(op) != set()]
+        size = (len(wave) + workers - 1) // workers
+        sent = []
+        for index in range(workers):
+            batch = wave[index * size:(index + 1) * size]
+            if batch == []:
+                break
+            objects = {}
+            for op in batch:
+                for obj_id in keys_of(op):
+                    objects[obj_id] = scene[obj_id]
+            conns[index].send((objects,batch))
+            sent.append(conns[index])
+        for conn in sent:
+            scene.update(conn.recv())
+    elapsed = time.perf_counter() - start
+
+    for conn,process in zip(conns,processes):
+        conn.send(None)
+        process.join()
+    return elapsed,checksum(scene)
+
+def benchmark(clients=32,count=2000,verts=2000,worker_counts=None):
+    '''prints the throughput of the wave partitioning for growing numbers of worker processes
+
+    Return Value
+    results     -- a list of (workers, operations per second) tuples, 0 workers is the one at a time baseline
+    '''
+
+    if worker_counts is None:
+        cores = os.cpu_count() or 1
+        worker_counts = sorted(set([1,2,4,8,cores]) & set(range(1,cores + 1)))
+    scene,ops = make_workload(clients,count,verts=verts)
+    elapsed,expected = run_sequential(scene,ops)
+    baseline = count / elapsed
+    print("{0} clients, {1} operations, {2} vertices per object".format(clients,count,verts))
+    print("sequential     {0:10.1f} ops/s".format(baseline))
+    results = [(0,baseline)]
+    for workers in worker_counts:
+        elapsed,total = run_waves(scene,ops,workers)
+        throughput = count / elapsed
+        matching = abs(total - expected) <= 1e-6 * max(1.0,abs(expected))
+        print("{0:3d} workers    {1:10.1f} ops/s  x{2:.2f}{3}".format(workers,throughput,throughput / baseline,
+                                                                       '' if matching else '  RESULT DIFFERS'))
+        results.append((workers,throughput))
+    return results
+
+if __name__ == '__main__':
+    benchmark(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,223 @@
+'''reading and writing of the binary session snapshot format
+
+This module does not depend on bpy, so it can be used (and benchmarked) outside of blender.
+
+Layout (little-endian)
+header     -- magic (4 bytes), version (uint32), object count (uint32), toc offset (uint64), toc length (uint64),
+              reserved (uint32), 32 bytes in total
+records    -- one record per mesh object: vertex count, edge count, loop count and polygon count (uint32 each),
+              followed by contiguous arrays of vertex coordinates (float32 x 3), edge vertex indices (int32 x 2),
+              loop vertex indices (int32), polygon loop starts (int32) and polygon loop totals (int32)
+toc        -- a utf-8 json list with one entry per object: id, name, type, matrix (16 floats, row major),
+              bbox (local min and max corners), hash, and the offset and length of its record (0 if it has none)
+'''
+
+import struct
+import json
+import mmap
+import array
+import hashlib
+
+MAGIC = b'CLBS'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQQI')
+COUNTS = struct.Struct('<IIII')
+#the lengths of the json entry and the record of an object sent on its own (e.g. when streaming to a client)
+OBJECT_HEADER = struct.Struct('<II')
+
+def content_hash(obj_type,matrix,coords=None,loops=None,totals=None):
+    '''computes a hash of the content of an object
+    
+    Parameters
+    obj_type    -- a string containing the type of the object (e.g. 'MESH')
+    matrix      -- a flat sequence of the 16 values of the world matrix
+    coords      -- a flat sequence of vertex coordinates (None if the object has no mesh)
+    loops       -- a sequence of loop vertex indices
+    totals      -- a sequence of polygon loop totals
+    
+    Return Value
+    digest      -- a string containing the hex digest of the content
+    
+    Floats are rounded to 4 decimal places, so that a scene that went through a collada round trip hashes the same.
+    '''
+    
+    digest = hashlib.sha1()
+    digest.update(obj_type.encode('utf-8'))
+    digest.update(array.array('i',[int(round(value * 10000)) for value in matrix]).tobytes())
+    if coords is not None:
+        digest.update(array.array('i',[int(round(value * 10000)) for value in coords]).tobytes())
+        digest.update(array.array('i',loops).tobytes())
+        digest.update(array.array('i',totals).tobytes())
+    return digest.hexdigest()
+
+def pack_mesh(verts,edges,loops,loop_starts,loop_totals):
+    '''packs the arrays of a mesh into a record
+    
+    Parameters
+    verts        -- an array('f') of vertex coordinates (3 per vertex)
+    edges        -- an array('i') of edge vertex indices (2 per edge)
+    loops        -- an array('i') of loop vertex indices
+    loop_starts  -- an array('i') of the first loop of each polygon
+    loop_totals  -- an array('i') of the number of loops of each polygon
+    
+    Return Value
+    record       -- a bytes object containing the packed record
+    '''
+    
+    counts = COUNTS.pack(len(verts) // 3,len(edges) // 2,len(loops),len(loop_starts))
+    return b''.join([counts,verts.tobytes(),edges.tobytes(),loops.tobytes(),loop_starts.tobytes(),loop_totals.tobytes()])
+
+def unpack_mesh(buffer):
+    '''gets the arrays of a packed mesh record without copying them
+    
+    Parameters
+    buffer       -- a bytes-like object containing exactly one record
+    
+    Return Value
+    arrays       -- a dict object with memoryviews of 'verts', 'edges', 'loops', 'loop_starts' and 'loop_totals'
+    '''
+    
+    view = memoryview(buffer)
+    vert_count,edge_count,loop_count,poly_count = COUNTS.unpack_from(view,0)
+    offset = COUNTS.size
+    arrays = {}
+    for key,size in (('verts',vert_count * 3),('edges',edge_count * 2),('loops',loop_count),
+                     ('loop_starts',poly_count),('loop_totals',poly_count)):
+        if key == 'verts':
+            arrays[key] = view[offset:offset + size * 4].cast('f')
+        else:
+            arrays[key] = view[offset:offset + size * 4].cast('i')
+        offset += size * 4
+    view.release()
+    return arrays
+
+def pack_object(entry,record):
+    '''packs the entry and record of a single object so it can be sent on its own
+    
+    Parameters
+    entry        -- a dict object describing the object
+    record       -- a bytes-like object containing the mesh record (None if the object has no mesh)
+    
+    Return Value
+    packed       -- a bytes object
+    '''
+    
+    entry_bytes = json.dumps(entry).encode('utf-8')
+    if record is None:
+        record = b''
+    return OBJECT_HEADER.pack(len(entry_bytes),len(record)) + entry_bytes + bytes(record)
+
+def unpack_objects(buffer):
+    '''splits a buffer of objects packed with pack_object
+    
+    Parameters
+    buffer       -- a bytes object containing zero or more packed objects (a truncated object at the end is ignored)
+    
+    Return Value
+    objects      -- a list of (entry, record) tuples, record being a bytes object (empty if the object has no mesh)
+    '''
+    
+    objects = []
+    offset = 0
+    while offset + OBJECT_HEADER.size <= len(buffer):
+        entry_length,record_length = OBJECT_HEADER.unpack_from(buffer,offset)
+        offset += OBJECT_HEADER.size
+        if offset + entry_length + record_length > len(buffer):
+            break
+        entry = json.loads(buffer[offset:offset + entry_length].decode('utf-8'))
+        offset += entry_length
+        objects.append((entry,buffer[offset:offset + record_length]))
+        offset += record_length
+    return objects
+
+def write_snapshot(output_file,entries,records):
+    '''writes a snapshot to a file object opened for binary writing
+    
+    Parameters
+    output_file  -- a file object
+    entries      -- a list of dict objects describing each object (id, name, type, matrix, bbox, hash)
+    records      -- a list of packed mesh records (or None for objects without a mesh), same order as entries
+    '''
+    
+    output_file.write(HEADER.pack(MAGIC,VERSION,len(entries),0,0,0))
+    offset = HEADER.size
+    for entry,record in zip(entries,records):
+        if record is None:
+            entry['offset'] = 0
+            entry['length'] = 0
+        else:
+            entry['offset'] = offset
+            entry['length'] = len(record)
+            output_file.write(record)
+            offset += len(record)
+            
+    toc = json.dumps(entries).encode('utf-8')
+    output_file.write(toc)
+    #the header is written again now that the position of the toc is known
+    output_file.seek(0)
+    output_file.write(HEADER.pack(MAGIC,VERSION,len(entries),offset,len(toc),0))
+
+class SnapshotReader:
+    '''reads a snapshot by memory-mapping its file
+    
+    Attributes
+    file      -- the file object of the snapshot
+    map       -- an mmap object of the whole file
+    entries   -- a list of dict objects read from the toc
+    
+    The arrays returned by mesh are views into the mapped file (no copy). They assume a little-endian machine and
+    must be released before the reader is closed.
+    '''
+    
+    def __init__(self,filename):
+        self.file = open(filename,'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+            magic,version,count,toc_offset,toc_length,reserved = HEADER.unpack_from(self.map,0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a snapshot file")
+            self.entries = json.loads(self.map[toc_offset:toc_offset + toc_length].decode('utf-8'))
+        except Exception:
+            self.close()
+            raise
+        
+    def mesh(self,entry):
+        '''gets the arrays of the mesh record of an object
+        
+        Parameters
+        entry     -- a dict object from the toc
+        
+        Return Value
+        arrays    -- a dict object with memoryviews of 'verts', 'edges', 'loops', 'loop_starts' and 'loop_totals'
+                     (None if the object has no mesh record)
+        '''
+        
+        if entry['length'] == 0:
+            return None
+        
+        view = memoryview(self.map)
+        arrays = unpack_mesh(view[entry['offset']:entry['offset'] + entry['length']])
+        view.release()
+        return arrays
+    
+    def record(self,entry):
+        '''gets a copy of the packed mesh record of an object
+        
+        Parameters
+        entry     -- a dict object from the toc
+        
+        Return Value
+        record    -- a bytes object (None if the object has no mesh record)
+        '''
+        
+        if entry['length'] == 0:
+            return None
+        return self.map[entry['offset']:entry['offset'] + entry['length']]
+    
+    def close(self):
+        '''unmaps and closes the snapshot file'''
+        
+        if getattr(self,'map',None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
@@ -7,6 +7,19 @@ import time
 from . import encoder
 from . import decoder
 from . import utils
+from . import snapshot
+from . import identity
+from . import registry
+from . import sequencer
+from . import streaming
+from . import interest
+from . import preview
+from . import transport
+from . import reliable
+from . import multicast
+from . import leases
+from . import transformer
+from . import meshdelta
     
 class StartSession(bpy.types.Operator):
     ''' initiates a persistent collaborative session ''' 
@@ -21,9 +34,39 @@ class StartSession(bpy.types.Operator):
     outqueue --  a queue object used as temporary storage for outgoing operations
     sock     --  a socket object used to listen to the server
     address  --  a tuple containing the ip address and port of the socket listener
+    ids      --  an IdMap object shared by the encoder and decoder to address objects by persistent ids
+    names    --  a NameRegistry object shared by the encoder and decoder to look up objects by type and number
     dec      --  a decoder object used to decode and execute a received operation
     enc      --  an encoder object used to encode an operation 
     last_op  --  a dict object representing the last encoded operation
+    sequencing -- a boolean value indicating if the server orders operations (True) or not (False)
+    pending  --  a PendingBuffer object that keeps unacknowledged operations and orders received ones
+    loader   --  a StreamLoader object that replaces proxies with full objects after a progressive join (None otherwise)
+    preview  --  a PreviewReceiver object that interpolates the transforms other clients are dragging
+    sampler  --  a PreviewSampler object that streams the transforms of the local drags (None if live preview is off)
+    last_sync -- the time of the last synchronization, the timer runs faster than the sync interval during live previews
+    connection -- a Connection object to the server when the TCP transport is used (None for UDP)
+    backlog  --  a list of messages received over the connection while a file was downloaded, handled when the listener starts
+    endpoint --  an Endpoint object that delivers operations reliably over the listener socket (None unless reliable UDP is used)
+    server_peer -- a tuple containing the resolved address of the server, reliable datagrams are matched against it
+    group    --  a list containing the multicast address and port announced by the server (None unless the multicast transport is used)
+    group_sock -- a socket object that receives the operations published to the group (None if the group is not joined)
+    group_receiver -- a GroupReceiver object that orders the group datagrams and finds the ones to ask for again
+    snapshot_format -- a string containing the snapshot format of the session ('DAE','BINARY')
+    resync_requested -- a boolean value indicating that the server dropped operations for this client and the snapshot must be reloaded
+    holders  --  a dict object mapping object ids to the clients holding their edit leases (as "ip:port")
+    leases_changed -- a boolean value indicating that new lease holders arrived and the selection locks must be updated
+    lease_ids -- a list of the ids of the objects whose leases were last requested (None before the first request)
+    last_lease -- the time the leases were last requested, they are renewed before the server lets them run out
+    lease_locked -- a set containing the ids of the objects locked from selection because another client holds them
+    index_tag --  a tuple (object name, element counts) of the mesh whose elements were last numbered in edit mode (None if none is)
+    coords   --  a tuple (object name, array of vertex coordinates) of the mesh being edited as of the last sync (None if none is)
+    encoded  --  a boolean value indicating that an operation was encoded in the current tick
+    rejoin_requested -- a boolean value indicating that the server no longer counts this client as a member and it must subscribe again
+    refused  --  a list of the op ids of the operations the server refused because this client was not a member
+    snapshot_seq -- the sequence number of the last operation included in the loaded snapshot (the server's sequence
+                number at the subscription for a progressive join, None if unknown), the operations up to it are
+                dropped when they arrive and the pending buffer starts ordering after it
     '''
     def invoke(self,context, event):
         
@@ -39,21 +82,47 @@ class StartSession(bpy.types.Operator):
                 #initialize flags and storage objects
                 context.scene.thread_flag = True
                 context.scene.modal_flag = True
-                self.inqueue = queue.Queue(20)
+                #received operations are never dropped, the queue grows until the timer catches up
+                self.inqueue = queue.Queue()
                 self.outqueue = queue.Queue(20)
-                self.dec = decoder.Decoder()
-                self.enc = encoder.Encoder()
+                self.ids = identity.IdMap()
+                self.names = registry.NameRegistry(bpy.data.objects.keys())
+                self.dec = decoder.Decoder(self.ids,self.names)
+                self.enc = encoder.Encoder(self.ids,self.names)
+                self.pending = sequencer.PendingBuffer(self.ids,self.names)
+                self.pending.restart(self.snapshot_seq)
+                self.preview = preview.PreviewReceiver(self.ids,context.scene.preview_timeout)
+                self.sampler = None
                 self.last_op = {}
+                self.last_sync = 0.0
+                self.resync_requested = False
+                self.leases_changed = True
+                self.lease_ids = None
+                self.last_lease = 0.0
+                self.lease_locked = set()
+                self.index_tag = None
+                self.coords = None
+                self.edit_changed = True
+                self.encoded = False
+                self.rejoin_requested = False
+                self.refused = []
                 
                 
                 #bind the listener to the address received from the subscribe function
-                self.bind_listener(self.address)
-                #create and start the thread for the listener
-                listening_thread = threading.Thread(target=self.listener,args=())
-                listening_thread.start()
+                self.start_listening()
                 wm = context.window_manager
+                interval = context.scene.sync_interval
+                if context.scene.live_preview == True:
+                    #the samples are taken on scene updates, so drags are streamed while the transform operator runs
+                    self.sampler = preview.PreviewSampler((context.scene.server_ip_address,context.scene.server_port),
+                                                          self.address,self.ids,self.preview,context.scene.preview_rate)
+                    bpy.app.handlers.scene_update_post.append(self.sampler.sample)
+                    #received previews are interpolated at display rate, synchronization still happens every sync interval
+                    interval = min(interval,1.0/60.0)
+                #the mesh being edited is only read again after an update changed it
+                bpy.app.handlers.scene_update_post.append(self.watch_edits)
                 #add an event timer that triggers every n seconds
-                self._timer = wm.event_timer_add(1.0,context.window)
+                self._timer = wm.event_timer_add(interval,context.window)
                 #add a modal handler that will allow the plugin to listen for events
                 context.window_manager.modal_handler_add(self)
                 self.execute(context)
@@ -69,6 +138,15 @@ class StartSession(bpy.types.Operator):
         
         #if the modal is no longer active, stop the operation of the thread and finish the operator
         if bpy.context.scene.modal_flag == False:
+            if self.loader is not None:
+                self.loader.stop()
+            if self.sampler is not None:
+                bpy.app.handlers.scene_update_post.remove(self.sampler.sample)
+                self.sampler.close()
+            bpy.app.handlers.scene_update_post.remove(self.watch_edits)
+            #the leases run out on the server once they are no longer renewed
+            self.holders = {}
+            self.apply_leases()
             self.unbind_listener()
             bpy.context.scene.thread_flag = False
             #get the last operator and encode it using the appropriate encode function
@@ -88,6 +166,20 @@ class StartSession(bpy.types.Operator):
             pass
             
         if event.type in ('TIMER'):
+           self.preview.tick()
+           if time.time() - self.last_sync < bpy.context.scene.sync_interval:
+               return {'PASS_THROUGH'}
+           self.last_sync = time.time()
+           if self.loader is not None and self.loader.tick():
+               self.loader = None
+           if bpy.context.scene.interest_changed == True:
+               bpy.context.scene.interest_changed = False
+               self.set_interest((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
+           if self.group_receiver is not None:
+               self.request_repairs((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
+           self.update_leases()
+           if self.leases_changed == True:
+               self.apply_leases()
            encode_caller = threading.Thread(target=self.call_encoder(),args=())
            encode_caller.start() 
            op_sender = threading.Thread(target=self.send_operation,args=())
@@ -96,44 +188,208 @@ class StartSession(bpy.types.Operator):
            
         return {'PASS_THROUGH'}
     
+    def start_listening(self):
+        '''binds the listener to the address assigned by the server and starts the threads that receive its data'''
+        
+        self.bind_listener(self.address)
+        self.endpoint = None
+        if bpy.context.scene.transport == 'RUDP':
+            #operations go out from the listener socket, so acks and retransmissions share one address
+            self.server_peer = (socket.gethostbyname(bpy.context.scene.server_ip_address),bpy.context.scene.server_port)
+            self.endpoint = reliable.Endpoint(self.sock)
+            self.endpoint.add_peer(self.server_peer)
+            self.endpoint.start()
+        #create and start the thread for the listener
+        listening_thread = threading.Thread(target=self.listener,args=())
+        listening_thread.start()
+        if self.group_sock is not None:
+            group_thread = threading.Thread(target=self.group_listener,args=())
+            group_thread.start()
+    
     def bind_listener(self,address):
         ''' sets up a server listener
         
         Parameters
         address -- a tuple containing the ip address and port to bind to
         '''
+        self.group_sock = None
+        self.group_receiver = None
+        #with the TCP transport everything arrives over the connection
+        if self.connection is not None:
+            self.sock = None
+            return
         self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
         try:
             self.sock.bind(address)
         except OSError:
             pass
         
+        #the group is joined on the interface the server reached this client through, repairs and pings still arrive on self.sock
+        if self.group is not None:
+            self.group_receiver = multicast.GroupReceiver(self.group_seq)
+            try:
+                self.group_sock = multicast.join(self.group[0],self.group[1],address[0])
+            except OSError:
+                print("Could not join the multicast group, operations arrive as repairs only")
+        
     def unbind_listener(self):
         '''removes the server listener'''
         self.unsubscribe((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
-        self.sock.close()
+        self.close_listener()
         #remove the timer to prevent redundancy when the listener is re-initialized
         bpy.context.window_manager.event_timer_remove(self._timer)
     
+    def close_listener(self):
+        '''closes the sockets the listener threads read from, the threads stop on their own'''
+        if self.endpoint is not None:
+            self.endpoint.stop()
+        if self.group_sock is not None:
+            multicast.leave(self.group_sock)
+        if self.sock is not None:
+            self.sock.close()
+    
     def listener(self):
         '''listens for incoming data from the server'''
         
+        for data in self.backlog:
+            self.dispatch(data,None)
+        self.backlog = []
+        #the sockets are replaced when the client subscribes again, this thread only reads the ones it started with
+        connection = self.connection
+        sock = self.sock
+        endpoint = self.endpoint
+        
         #continue the loop only if the thread is clear to run
         while bpy.context.scene.thread_flag == True:
             try:
                 print("Listening for requests...")
-                data_bytes,addr = self.sock.recvfrom(4096)
-                #add the received operation to the in queue if the queue still has space
-                if not self.inqueue.full():
+                if connection is not None:
+                    data = connection.receive_message()
+                    if data is None:
+                        print("Connection closed by the server")
+                        #the server closes the connection of a client it evicted
+                        if connection is self.connection:
+                            self.rejoin_requested = True
+                        break
+                    self.dispatch(data,None)
+                else:
+                    data_bytes,addr = sock.recvfrom(65536)
+                    if reliable.is_reliable(data_bytes):
+                        if endpoint is not None:
+                            for payload in endpoint.receive(data_bytes,addr):
+                                self.dispatch(json.loads(payload.decode('utf-8')),addr)
+                        continue
+                    if multicast.is_group_datagram(data_bytes):
+                        self.receive_group(data_bytes)
+                        continue
                     #convert the byte array (data) to a json string then to a dict
                     data = json.loads(data_bytes.decode('utf-8'))
-                    #put the received operation in the in queue
-                    self.inqueue.put(data['operation'])
-                print(data_bytes)
+                    self.dispatch(data,addr)
+                    print(data_bytes)
             except OSError:
                 #a sample exception is when the socket is closed while waiting for data
                 break
             
+    def group_listener(self):
+        '''listens for the operations published to the multicast group'''
+        group_sock = self.group_sock
+        while bpy.context.scene.thread_flag == True:
+            try:
+                data_bytes,addr = group_sock.recvfrom(65536)
+            except OSError:
+                break
+            if multicast.is_group_datagram(data_bytes):
+                self.receive_group(data_bytes)
+                
+    def receive_group(self,datagram):
+        '''handles a group datagram (published or repaired), delivering the operations it completes in group order
+        
+        Parameters
+        datagram -- a bytes object received from the group or from the server
+        '''
+        
+        for payload in self.group_receiver.receive(datagram):
+            data = json.loads(payload.decode('utf-8'))
+            #the group also carries this client's own operations and the ones outside of its interest
+            own_flag = [data['ip_addr'],data['port']] == list(self.address)
+            if own_flag or list(self.address) in data.get('excluded',[]):
+                if self.sequencing == False:
+                    continue
+                if own_flag:
+                    data['action'] = 'ACK'
+                else:
+                    data = {'action' : 'SKIP','seq' : data['seq']}
+            self.dispatch(data,None)
+            
+    def request_repairs(self,server_address):
+        '''asks the server for the group datagrams that did not arrive
+        
+        Parameters
+        server_address -- a tuple containing the server's ip address and port
+        '''
+        
+        for first,last in self.group_receiver.missing():
+            nack = {
+                'action' : 'NACK',
+                'ip_addr' : self.address[0],
+                'port' : self.address[1],
+                'first' : first,
+                'last' : last
+            }
+            try:
+                self.sock.sendto(bytes(json.dumps(nack),'utf-8'),server_address)
+            except OSError:
+                pass
+            
+    def dispatch(self,data,addr):
+        '''handles data received from the server
+        
+        Parameters
+        data    -- a dict object containing the received data
+        addr    -- a tuple containing the address the data came from (None if it came over the connection)
+        '''
+        
+        if data['action'] == 'PING':
+            if 'group_seq' in data and self.group_receiver is not None:
+                self.group_receiver.announce(data['group_seq'])
+            #answer heartbeats right away, the server measures the round trip time with them
+            pong = {
+                'action' : 'PONG',
+                'ip_addr' : self.address[0],
+                'port' : self.address[1],
+                'time' : data['time']
+            }
+            if self.connection is not None:
+                self.connection.send_message(pong)
+            else:
+                self.sock.sendto(bytes(json.dumps(pong),'utf-8'),addr)
+        elif data['action'] == 'LEASES':
+            self.holders = data['holders']
+            self.leases_changed = True
+        elif data['action'] == 'REJECT':
+            #an operation touched objects leased by other clients (or was too old to transform), the server did not apply that part of it
+            if data.get('reason') in ('STALE'):
+                print("Operation rejected, it was made on a version the server no longer transforms")
+            elif data.get('reason') in ('MISMATCH'):
+                print("Mesh changes rejected, the mesh has other vertices on the server")
+            else:
+                print("Operation rejected on objects edited by other clients: {0}".format(data['ids']))
+            self.resync_requested = True
+        elif data['action'] == 'RESUBSCRIBE':
+            #the server evicted this client (e.g. after a long stall) and refuses what it sends until it subscribes again
+            if data.get('op_id') is not None:
+                self.refused.append(data['op_id'])
+            self.rejoin_requested = True
+        elif data['action'] == 'RESYNC':
+            #the snapshot is reloaded on the main thread, the operations queued until then are in it
+            self.resync_requested = True
+        elif data['action'] == 'PREVIEW':
+            #previews are only interpolated, they never go through the decoder
+            self.preview.receive(data)
+        else:
+            #put the received data in the in queue, it is sorted into operations and acknowledgements when decoded
+            self.inqueue.put(data)
+            
     def subscribe(self,server_address):
         '''subscribe to a server's updates
         
@@ -146,6 +402,10 @@ class StartSession(bpy.types.Operator):
             ip_addr      -- an arbitrary ip address string assigned by the server
             port         -- an arbitrary port number assigned by the server
         '''
+        self.connection = None
+        self.backlog = []
+        self.group = None
+        self.snapshot_seq = None
         try:
             s = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
             s.connect(server_address)
@@ -153,17 +413,29 @@ class StartSession(bpy.types.Operator):
                 'action' : 'SUBSCRIBE',
                 'ip_addr': '',
                 'port' : '',
-                'filename' : bpy.context.scene.session_name
+                'filename' : bpy.context.scene.session_name,
+                'interest' : interest.scene_interest(bpy.context.scene),
+                'transport' : bpy.context.scene.transport
             }
+            bpy.context.scene.interest_changed = False
             
-            #send a request to register the user to the list of clients in the server
-            s.sendall(bytes(json.dumps(request),'utf-8'))
-            s.settimeout(5.0)
-        
-            #wait for an acknowledgement from the server
-            reply_bytes = s.recv(4096)
-            s.close()
-            reply = json.loads(reply_bytes.decode('utf-8'))
+            if bpy.context.scene.transport == 'TCP':
+                #the connection stays open for the whole session and carries everything after the subscription
+                self.connection = transport.Connection(s,initiate=True)
+                s.settimeout(5.0)
+                self.connection.send_message(request)
+                reply = self.connection.receive_message()
+                if reply is None:
+                    reply = {'success' : False,'ip' : '','port' : ''}
+            else:
+                #send a request to register the user to the list of clients in the server
+                s.sendall(bytes(json.dumps(request),'utf-8'))
+                s.settimeout(5.0)
+            
+                #wait for an acknowledgement from the server
+                reply_bytes = s.recv(4096)
+                s.close()
+                reply = json.loads(reply_bytes.decode('utf-8'))
             print(reply)
             
             result = {
@@ -175,9 +447,40 @@ class StartSession(bpy.types.Operator):
             
             if reply['success'] == True:
                 self.address = (result['ip_addr'],result['port'])
-                self.request_file(server_address)
-                utils.load_state(bpy.context.scene.client_filepath,bpy.context.scene.session_name)
-                #utils.format_obj_names("_",".")
+                #the server announces whether it orders operations
+                self.sequencing = reply.get('sequencing',False)
+                #the operations this client is sent are numbered after the acknowledgement, a loaded snapshot moves it on
+                self.snapshot_seq = reply.get('seq')
+                #a multicast group is announced if the server could open it
+                self.group = reply.get('group')
+                self.group_seq = reply.get('group_seq',0)
+                self.holders = reply.get('leases',{})
+                #the snapshot format is chosen per session by the server
+                snapshot_format = reply.get('snapshot_format','DAE')
+                self.snapshot_format = snapshot_format
+                self.loader = None
+                #a progressive join needs the table of contents of a binary snapshot
+                if bpy.context.scene.join_mode == 'PROGRESSIVE' and snapshot_format == 'BINARY':
+                    self.loader = streaming.StreamLoader(server_address,self.address,bpy.context.scene.session_name)
+                    if self.loader.build_proxies():
+                        self.loader.start()
+                    else:
+                        self.loader = None
+                        
+                if self.loader is None:
+                    file_seq = self.request_file(server_address,utils.snapshot_extension(snapshot_format))
+                    if file_seq is not None:
+                        self.snapshot_seq = file_seq
+                    if snapshot_format == 'DAE':
+                        self.request_file(server_address,utils.MANIFEST_EXTENSION)
+                        #a diff load builds the changed objects from the binary records of the snapshot
+                        if bpy.context.scene.load_mode == 'DIFF':
+                            self.request_file(server_address,snapshot.EXTENSION)
+                    utils.load_state(bpy.context.scene.client_filepath,bpy.context.scene.session_name,fmt=snapshot_format)
+                if self.connection is not None:
+                    #the listener blocks on the connection until the server sends something
+                    self.connection.sock.settimeout(None)
+                    
                 
         except TimeoutError:
             result = {
@@ -196,6 +499,9 @@ class StartSession(bpy.types.Operator):
             }
             print("Connection refused!")
             
+        if result['success'] == False and self.connection is not None:
+            self.connection.close()
+            self.connection = None
         
         return result
     
@@ -206,14 +512,21 @@ class StartSession(bpy.types.Operator):
         server_address -- a tuple containing the server's ip address and port
         
         '''
+        request = {
+            'action' : 'UNSUBSCRIBE',
+            'ip_addr' : self.address[0],
+            'port' : self.address[1]
+        }
+        if self.connection is not None:
+            #the server drops the client when the connection closes, the message only makes it explicit
+            self.connection.send_message(request)
+            self.connection.flush()
+            self.connection.close()
+            return
+        
         s = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
         try:
             s.connect(server_address)
-            request = {
-                'action' : 'UNSUBSCRIBE',
-                'ip_addr' : self.address[0],
-                'port' : self.address[1]
-            }
             s.settimeout(5.0)
             s.sendall(bytes(json.dumps(request),'utf-8'))
             reply_bytes = s.recv(4096)
@@ -223,36 +536,98 @@ class StartSession(bpy.types.Operator):
             print("Connection refused!")
         s.close()
         
-    def request_file(self,server_address):
-        '''request a collada file from the server
+    def set_interest(self,server_address):
+        ''' replaces the interest declared to the server with the one in the scene properties
         
         Parameters
-        server_address     -- a tuple containing the ip address and port of the server to connect to
+        server_address -- a tuple containing the server's ip address and port
+        
+        Objects outside the interest are not kept up to date, so widening it only affects the operations that follow.
         '''
+        request = {
+            'action' : 'SET_INTEREST',
+            'ip_addr' : self.address[0],
+            'port' : self.address[1],
+            'interest' : interest.scene_interest(bpy.context.scene)
+        }
+        if self.connection is not None:
+            self.connection.send_message(request)
+            return
         
-        requester = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-        requester.connect(server_address)
+        s = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        try:
+            s.connect(server_address)
+            s.settimeout(5.0)
+            s.sendall(bytes(json.dumps(request),'utf-8'))
+            reply_bytes = s.recv(4096)
+        except TimeoutError:
+            print("Connection timed out!")
+        except ConnectionRefusedError:
+            print("Connection refused!")
+        s.close()
+        
+    def request_file(self,server_address,extension='.dae',one_shot=False):
+        '''request a collada file (or one of its companion files) from the server
+        
+        Parameters
+        server_address     -- a tuple containing the ip address and port of the server to connect to
+        extension          -- a string containing the extension of the file to request (e.g. '.dae')
+        one_shot           -- a boolean value indicating if the file is requested over a new connection even with the TCP
+                              transport (True when the listener is already reading the persistent connection)
+        
+        Return Value
+        seq                -- the sequence number of the last operation included in the file (None if unknown)
+        '''
         
         request = {
             'action' : 'REQUEST_FILE',
             'ip_addr' : self.address[0],
             'port' : self.address[1],
-            'filename' : bpy.context.scene.session_name
+            'filename' : bpy.context.scene.session_name,
+            'extension' : extension
         }
         
-        #send a request for the specified file
-        requester.sendall(bytes(json.dumps(request),'utf-8'))
-        
         #filepath -- the folder where the file will be saved once received
         filepath = bpy.context.scene.client_filepath
         #if the directory/folder does not exist, create it
         if not utils.check_dir(filepath):
             utils.create_directory(filepath)
         
-        filename = filepath + "/" + bpy.context.scene.session_name + ".dae"
+        filename = filepath + "/" + bpy.context.scene.session_name + extension
         #open the file for writing in binary
         output_file = open(filename,'wb')
+        seq = None
         
+        if self.connection is not None and not one_shot:
+            #the file comes as binary frames between FILE_BEGIN and FILE_END, operations sent meanwhile are kept for later
+            self.connection.send_message(request)
+            while True:
+                frame = self.connection.receive()
+                if frame is None:
+                    break
+                kind,payload = frame
+                if kind == transport.BINARY:
+                    output_file.write(payload)
+                    continue
+                data = json.loads(payload.decode('utf-8'))
+                if data['action'] == 'FILE_END':
+                    break
+                elif data['action'] == 'FILE_BEGIN':
+                    seq = data.get('seq')
+                else:
+                    self.backlog.append(data)
+            output_file.close()
+            return seq
+        
+        requester = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        requester.connect(server_address)
+        #send a request for the specified file
+        requester.sendall(bytes(json.dumps(request),'utf-8'))
+        
+        #the file follows a header line, the part of it received along with the header is written first
+        header,server_reply = transport.read_header(requester)
+        seq = header.get('seq')
+        output_file.write(server_reply)
         #receive a fragment of the file
         server_reply = requester.recv(4096)
         #keep waiting for fragments while the file is not complete
@@ -266,6 +641,7 @@ class StartSession(bpy.types.Operator):
         #close the file stream
         output_file.close()
         requester.close()
+        return seq
             
         
     def encode_operation(self):
@@ -282,8 +658,11 @@ class StartSession(bpy.types.Operator):
                 if latest_op != self.last_op:
                     #if the operation is different from the last one, update the last operation
                     self.last_op = latest_op
+                    #proportional editing also moves unselected vertices by a falloff the operation does not carry,
+                    #so the operator is not sent and sync_vertices sends the moved coordinates instead
+                    if bpy.context.mode in ('EDIT_MESH') and getattr(latest_op.properties,'proportional','DISABLED') != 'DISABLED':
+                        return
                     try:
-                        #utils.format_obj_names(".","_")
                         #get the method that matches the name of the last operator
                         encode_function = getattr(self.enc,utils.format_op_name(latest_op.name))
                         mode = bpy.context.mode
@@ -305,8 +684,12 @@ class StartSession(bpy.types.Operator):
                         
                         #execute the method to get an encoded operation
                         operation = encode_function(latest_op,selected,active_object,mode)
+                        if mode in ('EDIT_MESH') and utils.format_op_name(latest_op.name) == 'delete':
+                            #the elements were numbered before the delete, the missing numbers are the removed elements
+                            operation['removed'] = self.removed_indices(active_object)
                         if not self.outqueue.full():
                             self.outqueue.put(operation)
+                            self.encoded = True
                             #bpy.context.scene.last_op = json.dumps(operation)
                         print(operation)
                     except AttributeError:
@@ -338,42 +721,320 @@ class StartSession(bpy.types.Operator):
         if bpy.context.selected_objects != []:
             selected_objects = utils.get_obj_names(bpy.context.selected_objects)
             bpy.context.scene.active_obj_name = json.dumps(selected_objects)
+            bpy.context.scene.active_obj_ids = json.dumps(self.ids.ids_of(selected_objects))
             if bpy.context.mode in ('EDIT_MESH'):
                 selected_internals = utils.get_internals(bpy.context.active_object.name,utils.get_select_mode())
                 #update the last selected internals only if not empty to avoid select mismatches on delete
                 if selected_internals['verts'] != [] or selected_internals['edges'] != [] or selected_internals['faces'] != []:
                     bpy.context.scene.selected_internals = json.dumps(selected_internals)
                 #print(bpy.context.scene.selected_internals) 
+        self.encoded = False
         self.encode_operation()
+        self.tag_indices()
+        self.sync_vertices()
         #print(bpy.context.scene.active_obj_name)
         
+    def tag_indices(self):
+        '''numbers the elements of the mesh in edit mode again once its topology changed, so a delete can tell what it removed'''
+        
+        obj = bpy.context.active_object
+        if bpy.context.mode not in ('EDIT_MESH') or obj is None or obj.type != 'MESH':
+            self.index_tag = None
+            return
+        counts = transformer.element_counts(obj)
+        if self.index_tag != (obj.name,counts):
+            self.index_tag = (obj.name,transformer.tag_indices(obj))
+            
+    def sync_vertices(self):
+        '''sends the vertices of the mesh being edited that moved since the last tick, whatever edit moved them'''
+        
+        obj = bpy.context.active_object
+        if bpy.context.mode not in ('EDIT_MESH','SCULPT') or obj is None or obj.type != 'MESH':
+            self.coords = None
+            return
+        previous = self.coords
+        #writing the edit mesh back to the mesh data is costly, it is only done once a scene update changed the mesh
+        if bpy.context.mode == 'EDIT_MESH' and not self.edit_changed and self.encoded == False:
+            if previous is not None and previous[0] == obj.name:
+                return
+        self.edit_changed = False
+        coords = utils.get_coords(obj)
+        #an encoded operation already carries the changes of this tick
+        if self.encoded == True or previous is None or previous[0] != obj.name:
+            self.coords = (obj.name,coords)
+            return
+        if len(previous[1]) != len(coords):
+            #offsets cannot describe a new topology, so the whole mesh is sent (the mesh data was just updated)
+            if not self.outqueue.full():
+                self.outqueue.put(self.enc.mesh_record(obj.name,snapshot.mesh_arrays(obj.data)))
+                self.coords = (obj.name,coords)
+            return
+        indices,deltas = meshdelta.find_changes(previous[1],coords)
+        if len(indices) == 0:
+            return
+        #the changes stay unsent until the out queue has room, the next tick compares against the same reference
+        if not self.outqueue.full():
+            self.outqueue.put(self.enc.mesh_delta(obj.name,len(coords) // 3,indices,deltas))
+            self.coords = (obj.name,coords)
+            
+    def watch_edits(self,scene):
+        '''the scene update handler, notes that the mesh being edited changed so sync_vertices reads it again
+        
+        Parameters
+        scene       -- the updated blender scene
+        '''
+        
+        obj = scene.objects.active
+        if obj is not None and obj.type == 'MESH' and (obj.is_updated_data or obj.data.is_updated):
+            self.edit_changed = True
+            
+    def removed_indices(self,active_object):
+        '''gets the indices an edit mode delete removed from the mesh numbered by tag_indices
+        
+        Parameters
+        active_object    -- a string containing the name of the object the delete was made on
+        
+        Return Value
+        removed          -- a dict object mapping element types to sorted lists of indices (None if the mesh was not numbered)
+        '''
+        
+        if self.index_tag is None or self.index_tag[0] != active_object or active_object not in bpy.data.objects:
+            return None
+        return transformer.read_removed(bpy.data.objects[active_object],self.index_tag[1])
+        
+            
+    def resync(self):
+        '''reloads the snapshot after the server stopped sending operations to this client because it fell behind'''
+        
+        self.resync_requested = False
+        print("Fell behind the session, reloading the snapshot")
+        #the operations received so far are included in the snapshot
+        while not self.inqueue.empty():
+            self.inqueue.get()
+        self.preview.restore(list(self.preview.bases.keys()))
+        
+        server_address = (bpy.context.scene.server_ip_address,bpy.context.scene.server_port)
+        self.snapshot_seq = self.request_file(server_address,utils.snapshot_extension(self.snapshot_format),True)
+        if self.snapshot_format == 'DAE':
+            self.request_file(server_address,utils.MANIFEST_EXTENSION,True)
+            if bpy.context.scene.load_mode == 'DIFF':
+                self.request_file(server_address,snapshot.EXTENSION,True)
+        utils.load_state(bpy.context.scene.client_filepath,bpy.context.scene.session_name,fmt=self.snapshot_format)
+        self.reset_state()
+        
+    def rejoin(self):
+        '''subscribes again after the server stopped counting this client as a member, then sends the refused operations again'''
+        
+        self.rejoin_requested = False
+        print("The server dropped this client, subscribing again")
+        #the refused operations were applied here but never reached the server, they are applied again after the reload
+        refused = [self.pending.pending[op_id] for op_id in self.refused if op_id in self.pending.pending]
+        self.refused = []
+        if self.loader is not None:
+            self.loader.stop()
+        self.close_listener()
+        if self.connection is not None:
+            self.connection.close()
+        while not self.inqueue.empty():
+            self.inqueue.get()
+        self.preview.restore(list(self.preview.bases.keys()))
+        
+        #a new subscription gets a new address and loads the current snapshot
+        result = self.subscribe((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
+        if result['success'] == False:
+            print("Could not subscribe again, the session ends")
+            bpy.context.scene.modal_flag = False
+            return
+        self.reset_state()
+        self.lease_ids = None
+        if self.sampler is not None:
+            self.sampler.address = self.address
+        self.start_listening()
+        
+        if refused != []:
+            self.dec.apply_batch([json.loads(json.dumps(op)) for op in refused])
+            for op in refused:
+                #the server never ordered them, so no acknowledgement comes for their old op ids
+                self.pending.discard(op.pop('op_id',None))
+                op.pop('base_seq',None)
+                self.transmit(op)
+            print("Sent {0} refused operations again".format(len(refused)))
             
+    def reset_state(self):
+        '''forgets what refers to the scene as it was before a snapshot was loaded'''
+        
+        self.ids.refresh()
+        self.names.rebuild(bpy.data.objects.keys())
+        #the order starts over after the operations included in the snapshot
+        self.pending.restart(self.snapshot_seq)
+        if self.sampler is not None:
+            self.sampler.reset()
+        #the reloaded objects are locked again if other clients hold them
+        self.lease_locked = set()
+        self.leases_changed = True
+        self.index_tag = None
+        self.coords = None
+        
     def decode_operation(self):
-        '''gets an operation from a queue and calls the appropriate function '''
+        '''gets all pending operations from the in queue and applies them as one batch '''
         #print("decode")
-        if not self.inqueue.empty():
-            op = self.inqueue.get()
-            decode_function = getattr(self.dec,utils.format_op_name(op['name']))
-            decode_function(op)
-            #utils.format_obj_names(".","_")
+        if self.rejoin_requested == True:
+            self.rejoin()
+        elif self.resync_requested == True:
+            self.resync()
+        ops = []
+        while not self.inqueue.empty():
+            data = self.inqueue.get()
+            if data['action'] == 'DISCARD':
+                #the server dropped an operation on objects deleted concurrently, the delete arrives on its own
+                self.pending.discard(data['op_id'])
+            elif self.sequencing == True:
+                self.pending.receive(data)
+            elif self.snapshot_seq is None or data.get('seq') is None or data['seq'] > self.snapshot_seq:
+                #operations included in the loaded snapshot would be applied twice
+                ops.append(data['operation'])
+                
+        if self.sequencing == True:
+            #release received data in server order, rebasing remote operations against the pending local ones
+            for data in self.pending.ready():
+                if data['action'] == 'ACK':
+                    #a local operation that was pending when the snapshot was loaded is applied like a remote one
+                    op = self.pending.acknowledge(data)
+                elif data['action'] == 'SKIP':
+                    #an operation outside of the interest of this client
+                    continue
+                else:
+                    op = data['operation']
+                if op is not None:
+                    ops.extend(self.pending.rebase(op))
+            #the order of this client's pending operations and a remote one cannot be reconciled locally
+            if self.pending.diverged == True:
+                self.resync_requested = True
+        
+        if ops != []:
+            #the committed operations start from the transforms the objects had before they were previewed
+            self.preview.restore_ops(ops)
+            self.dec.apply_batch(ops)
+            #a mesh delta arrived for a mesh whose vertices no longer match the sender's
+            if self.dec.resync_needed == True:
+                self.dec.resync_needed = False
+                self.resync_requested = True
+            #the received operations may have changed the mesh being edited
+            self.index_tag = None
+            if self.coords is not None and self.coords[0] in bpy.data.objects:
+                #remote changes are not sent back as changes of this client
+                self.coords = (self.coords[0],utils.get_coords(bpy.data.objects[self.coords[0]]))
+            if self.sampler is not None:
+                self.sampler.reset()
             
     def send_operation(self):
         '''gets an operation from the outqueue and sends it to the server'''
         #send an operation only if the out queue is not empty
         if not self.outqueue.empty():
-            s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-            s.connect((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
-            op = self.outqueue.get()
+            self.transmit(self.outqueue.get())
             
-            data = {
-                'action' : 'SEND',
-                'ip_addr' : self.address[0],
-                'port' : self.address[1],
-                'operation' : op        
-            }
+    def transmit(self,op):
+        '''sends an operation to the server, keeping it until it is acknowledged if the server orders operations
+        
+        Parameters
+        op       -- a dict object representing an operation that was applied locally
+        '''
+        
+        #the removed indices only matter locally, the server finds its own
+        removed = op.pop('removed',None)
+        if self.sequencing == True:
+            #keep the operation until the server acknowledges where it was ordered
+            self.pending.track(op,removed)
+        
+        data = {
+            'action' : 'SEND',
+            'ip_addr' : self.address[0],
+            'port' : self.address[1],
+            'operation' : op        
+        }
+        self.send_message(data)
             
-            s.sendall(bytes(json.dumps(data),'utf-8'))
-            s.close()
+    def send_message(self,data):
+        '''sends a message to the server over the transport of the session
+        
+        Parameters
+        data     -- a dict object containing the message
+        '''
+        
+        if self.connection is not None:
+            self.connection.send_message(data)
+            return
+        
+        if self.endpoint is not None:
+            self.endpoint.send(bytes(json.dumps(data),'utf-8'),self.server_peer)
+            return
+        
+        s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        s.connect((bpy.context.scene.server_ip_address,bpy.context.scene.server_port))
+        s.sendall(bytes(json.dumps(data),'utf-8'))
+        s.close()
+        
+    def update_leases(self):
+        '''asks for the edit leases of the selected objects when the selection changes, and renews them in time'''
+        
+        obj_ids = sorted(set(identity.get_id(obj) for obj in bpy.context.selected_objects) - set(['']))
+        now = time.time()
+        if obj_ids == self.lease_ids and (obj_ids == [] or now - self.last_lease < bpy.context.scene.lease_renew):
+            return
+        self.lease_ids = obj_ids
+        self.last_lease = now
+        self.send_message({
+            'action' : 'LEASE',
+            'ip_addr' : self.address[0],
+            'port' : self.address[1],
+            'ids' : obj_ids
+        })
+        
+    def apply_leases(self):
+        '''keeps the objects leased by other clients from being selected here and lists the holders in the panel'''
+        
+        self.leases_changed = False
+        own = leases.holder_key(self.address)
+        held = set(obj_id for obj_id,holder in self.holders.items() if holder != own)
+        
+        #objects released by the other clients can be selected again
+        for obj_id in self.lease_locked - held:
+            name = self.ids.name_of(obj_id)
+            if name is not None and name in bpy.data.objects:
+                bpy.data.objects[name].hide_select = False
+        self.lease_locked &= held
+        
+        listing = []
+        for obj_id,holder in sorted(self.holders.items(),key=lambda item: item[1]):
+            name = self.ids.name_of(obj_id)
+            if name is None or name not in bpy.data.objects:
+                continue
+            obj = bpy.data.objects[name]
+            if obj_id in held:
+                #the server would strip this client's edits of the object, so it cannot be selected while held
+                obj.select = False
+                if obj.hide_select == False:
+                    obj.hide_select = True
+                    self.lease_locked.add(obj_id)
+            listing.append({'name' : name,'holder' : "you" if holder == own else holder})
+        bpy.context.scene.leases = json.dumps(listing)
+
+class FollowSelection(bpy.types.Operator):
+    ''' limits the operations received in a session to the selected objects '''
+    bl_idname = "development.follow_selection"
+    bl_label = "Follow Selection"
+    bl_description = "Receives only the operations on the selected objects (and the interest groups/region)"
+    
+    def invoke(self,context, event):
+        return self.execute(context)
+    
+    def execute(self,context):
+        #objects without an id were never shared, so they cannot be addressed by the server
+        obj_ids = [identity.get_id(obj) for obj in context.selected_objects]
+        context.scene.interest_objects = json.dumps([obj_id for obj_id in obj_ids if obj_id != ''])
+        context.scene.interest_mode = 'CUSTOM'
+        context.scene.interest_changed = True
+        return {'FINISHED'}
 
 class EndSession(bpy.types.Operator):
     ''' ends a persistent collaborative session '''
@@ -1,8 +1,77 @@
 import bpy
+import bmesh
+from array import array
+from collections import OrderedDict
+from mathutils import Matrix,Vector
 from . import utils
+from . import locks
+from . import identity
+from . import registry
+from . import meshdelta
+from . import snapshot
+from . import binformat
+
+#the pivot point settings compose_transform reproduces in object mode
+BATCH_PIVOTS = ('MEDIAN_POINT','BOUNDING_BOX_CENTER','CURSOR','INDIVIDUAL_ORIGINS','ACTIVE_ELEMENT')
 
 class Decoder:
     
+    '''
+    Attributes
+    locks   -- a LockManager object used to lock objects from selection while operations are applied
+    ids     -- an IdMap object used to find objects by their persistent ids
+    names   -- a NameRegistry object that indexes the names of the objects in the scene
+    resync_needed -- a boolean value indicating that a mesh no longer matches the sender's and the snapshot must be reloaded
+    '''
+    
+    def __init__(self,ids=None,names=None):
+        self.locks = locks.LockManager()
+        if ids is None:
+            ids = identity.IdMap()
+        if names is None:
+            names = registry.NameRegistry(bpy.data.objects.keys())
+        self.ids = ids
+        self.names = names
+        self.resync_needed = False
+        
+    def resolve_targets(self,op):
+        '''replaces the object names in an operation with the local names of the objects carrying its ids
+        
+        Parameters
+        op      -- a dict object representing an operation
+        
+        Objects without an id (or ids that are not known yet, like the object of an add operation) keep their names.
+        '''
+        
+        if 'target_ids' in op:
+            targets = []
+            for obj_id,name in zip(op['target_ids'],op['targets']):
+                local_name = None
+                if obj_id != '':
+                    local_name = self.ids.name_of(obj_id)
+                if local_name is not None:
+                    targets.append(local_name)
+                else:
+                    targets.append(name)
+            op['targets'] = targets
+            
+        if op.get('active_id','') != '':
+            local_name = self.ids.name_of(op['active_id'])
+            if local_name is not None:
+                op['active_object'] = local_name
+                
+    def name_added_object(self,op):
+        '''gives a newly added object the name and id carried by its add operation
+        
+        Parameters
+        op      -- a dict object representing an add operation
+        '''
+        
+        obj = bpy.context.active_object
+        obj.name = op['active_object']
+        if op.get('active_id','') != '':
+            self.ids.register(obj,op['active_id'])
+    
     def refocus_object_mode(self,target_objects,flag):
         '''moves the selection to a collection of objects, in object mode
         
@@ -192,7 +261,8 @@ class Decoder:
             select_mode = op['select_mode']
             bpy.context.tool_settings.mesh_select_mode = (select_mode['vertex_select'],select_mode['edge_select'],select_mode['face_select'])
             
-        utils.lock_object_selection(op['targets'],True)
+        #lock every other object from selection while the operation is applied
+        self.locks.lock(op['targets'])
         
         #4. save the selection
         focus = {
@@ -219,7 +289,7 @@ class Decoder:
         
         '''
         current_mode = bpy.context.mode
-        utils.lock_object_selection([],False)
+        self.locks.unlock()
         
         #1. deselect current selection
         try:
@@ -292,6 +362,149 @@ class Decoder:
         except KeyError:
             bpy.context.scene.objects.active = None
         
+    def apply_batch(self,ops):
+        '''applies a batch of received operations, composing consecutive object mode transforms per object
+        
+        Parameters
+        ops        -- a list of dict objects representing operations, in the order they were received
+        
+        Transforms (translate, rotate, resize) made in object mode are not executed through operators. Instead, they are
+        composed into one matrix per object which is written once at the end of the batch. Any other operation first
+        flushes the pending matrices of the objects it touches so that the order of operations is kept.
+        '''
+        
+        #pending -- maps object names to the composed (but not yet written) world matrix
+        pending = OrderedDict()
+        
+        #keep the selection lock across the batch so that each operation only changes the locked objects it needs to
+        self.locks.begin_batch()
+        try:
+            for op in ops:
+                self.resolve_targets(op)
+                if self.is_batchable(op):
+                    self.compose_transform(op,pending)
+                else:
+                    self.flush_transforms(pending,op['targets'] + [op['active_object']])
+                    decode_function = getattr(self,utils.format_op_name(op['name']))
+                    decode_function(op)
+                    #only the names touched by the operation can have been added or removed
+                    self.names.sync(op['targets'] + [op['active_object']],bpy.data.objects)
+            
+            self.flush_transforms(pending,list(pending.keys()))
+        finally:
+            self.locks.end_batch()
+        
+    def is_batchable(self,op):
+        '''checks if an operation can be composed into a matrix instead of being executed as an operator
+        
+        Parameters
+        op          -- a dict object representing an operation
+        
+        Return Value
+        batchable   -- a boolean value indicating if the operation can be composed (True) or not (False)
+        '''
+        
+        batchable = False
+        if op['mode'] == 'OBJECT' and op['targets'] != []:
+            if utils.format_op_name(op['name']) in ('translate','rotate','resize'):
+                #the matrices are composed in global space, a constraint in another orientation needs the operator
+                constrained = op['caxis_x'] or op['caxis_y'] or op['caxis_z']
+                batchable = op.get('pivot_point','MEDIAN_POINT') in BATCH_PIVOTS
+                batchable = batchable and (not constrained or op.get('orientation','GLOBAL') == 'GLOBAL')
+                
+        return batchable
+        
+    def compose_transform(self,op,pending):
+        '''composes a transform operation into the pending matrices of its target objects
+        
+        Parameters
+        op          -- a dict object representing a translate, rotate or resize operation in object mode
+        pending     -- a dict object that maps object names to their composed world matrices
+        '''
+        
+        targets = []
+        for target in op['targets']:
+            #skip targets that do not exist (e.g. they were deleted by an earlier operation)
+            if target not in pending:
+                try:
+                    pending[target] = bpy.data.objects[target].matrix_world.copy()
+                except KeyError:
+                    continue
+            targets.append(target)
+            
+        if targets == []:
+            return
+        
+        op_name = utils.format_op_name(op['name'])
+        if op_name == 'translate':
+            delta = Matrix.Translation(Vector((op['x'],op['y'],op['z'])))
+            for target in targets:
+                pending[target] = delta * pending[target]
+            return
+        elif op_name == 'rotate':
+            #the rotate operator turns the selection by the negative of its value about the given axis
+            change = Matrix.Rotation(-op['value'],4,Vector((op['axis_x'],op['axis_y'],op['axis_z'])))
+        elif op_name == 'resize':
+            change = Matrix.Scale(op['x'],4,(1.0,0.0,0.0)) * Matrix.Scale(op['y'],4,(0.0,1.0,0.0)) * Matrix.Scale(op['z'],4,(0.0,0.0,1.0))
+            
+        #the pivot is the one the sender used (operations made before it was sent are about the median point)
+        pivot_point = op.get('pivot_point','MEDIAN_POINT')
+        if pivot_point == 'INDIVIDUAL_ORIGINS':
+            for target in targets:
+                pivot = pending[target].to_translation()
+                pending[target] = Matrix.Translation(pivot) * change * Matrix.Translation(-pivot) * pending[target]
+            return
+        
+        locations = [pending[target].to_translation() for target in targets]
+        if pivot_point == 'CURSOR':
+            pivot = Vector(op['cursor'])
+        elif pivot_point == 'BOUNDING_BOX_CENTER':
+            pivot = Vector([(min(location[i] for location in locations) + max(location[i] for location in locations)) / 2.0
+                            for i in range(3)])
+        elif pivot_point == 'ACTIVE_ELEMENT' and op['active_object'] in pending:
+            pivot = pending[op['active_object']].to_translation()
+        elif pivot_point == 'ACTIVE_ELEMENT' and op['active_object'] in bpy.data.objects:
+            pivot = bpy.data.objects[op['active_object']].matrix_world.to_translation()
+        else:
+            #the median point of the targets, same as the default pivot of the transform operators
+            pivot = Vector((0.0,0.0,0.0))
+            for location in locations:
+                pivot += location
+            pivot /= len(locations)
+            
+        delta = Matrix.Translation(pivot) * change * Matrix.Translation(-pivot)
+        for target in targets:
+            pending[target] = delta * pending[target]
+            
+    def flush_transforms(self,pending,names):
+        '''writes the composed matrices of the given objects and removes them from the pending transforms
+        
+        Parameters
+        pending     -- a dict object that maps object names to their composed world matrices
+        names       -- a list of names of the objects to write
+        '''
+        
+        for name in names:
+            if name in pending:
+                matrix = pending.pop(name)
+                try:
+                    bpy.data.objects[name].matrix_world = matrix
+                except KeyError:
+                    pass
+        
+    def use_pivot(self,op):
+        '''switches to the pivot point setting and 3D cursor a transform was made with
+        
+        Parameters
+        op          -- a dict object representing a translate, rotate or resize operation
+        
+        Return Value
+        previous    -- a tuple (pivot point, cursor) of the local settings, put back with utils.set_pivot
+        '''
+        
+        pivot_point,cursor = utils.get_pivot()
+        return utils.set_pivot(op.get('pivot_point',pivot_point),op.get('cursor',cursor))
+        
     def translate(self,op):
         
         previous_selected = self.remove_focus(op)
@@ -299,7 +512,9 @@ class Decoder:
         #get necessary parameters and translate the target object/s
         val = (op['x'],op['y'],op['z'])
         c_axis = (bool(op['caxis_x']),bool(op['caxis_y']),bool(op['caxis_z']))
-        bpy.ops.transform.translate(value=val,constraint_axis=c_axis)
+        previous_pivot = self.use_pivot(op)
+        bpy.ops.transform.translate(value=val,constraint_axis=c_axis,constraint_orientation=op.get('orientation','GLOBAL'))
+        utils.set_pivot(*previous_pivot)
         
         self.return_focus(op,previous_selected)
         
@@ -310,7 +525,9 @@ class Decoder:
         val = op['value']
         c_axis = (bool(op['caxis_x']),bool(op['caxis_y']),bool(op['caxis_z']))
         axis = (op['axis_x'],op['axis_y'],op['axis_z'])
-        bpy.ops.transform.rotate(value=val,axis=axis,constraint_axis=c_axis)
+        previous_pivot = self.use_pivot(op)
+        bpy.ops.transform.rotate(value=val,axis=axis,constraint_axis=c_axis,constraint_orientation=op.get('orientation','GLOBAL'))
+        utils.set_pivot(*previous_pivot)
         
         self.return_focus(op, previous_selected)
     
@@ -320,7 +537,9 @@ class Decoder:
         
         val = (op['x'],op['y'],op['z'])
         c_axis = (bool(op['caxis_x']),bool(op['caxis_y']),bool(op['caxis_z']))
-        bpy.ops.transform.resize(value=val,constraint_axis=c_axis)
+        previous_pivot = self.use_pivot(op)
+        bpy.ops.transform.resize(value=val,constraint_axis=c_axis,constraint_orientation=op.get('orientation','GLOBAL'))
+        utils.set_pivot(*previous_pivot)
         
         self.return_focus(op, previous_selected)
         
@@ -330,7 +549,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_cube_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         
         self.return_focus(op, previous_selected)
         
@@ -340,7 +559,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_circle_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_plane(self,op):
@@ -348,7 +567,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_plane_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_uv_sphere(self,op):
@@ -356,7 +575,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_uv_sphere_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_ico_sphere(self,op):
@@ -364,7 +583,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_ico_sphere_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_cylinder(self,op):
@@ -372,7 +591,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_cylinder_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_cone(self,op):
@@ -380,7 +599,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_cone_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
     
     def add_grid(self,op):
@@ -388,7 +607,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_grid_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
 
     def add_monkey(self,op):
@@ -396,7 +615,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_monkey_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
         
     def add_torus(self,op):
@@ -404,7 +623,7 @@ class Decoder:
         
         loc = (op['loc_x'],op['loc_y'],op['loc_z'])
         bpy.ops.mesh.primitive_torus_add(location=loc)
-        bpy.context.active_object.name = op['active_object']
+        self.name_added_object(op)
         self.return_focus(op, previous_selected)
         
     def delete(self,op):
@@ -412,19 +631,74 @@ class Decoder:
         
         if op['mode'] in ('OBJECT'):
             bpy.ops.object.delete(use_global=op['use_global'])
+            for obj_id in op.get('target_ids',[]):
+                self.ids.forget(obj_id)
         elif op['mode'] in ('EDIT_MESH'):
             bpy.ops.mesh.delete(type=op['type'])
         
         self.return_focus(op, previous_selected)
         
-    def rename_objects(self,op):
+    def mesh_delta(self,op):
+        '''moves the vertices carried by a mesh delta, the selection and the mode stay as they are'''
+        
+        try:
+            obj = bpy.data.objects[op['active_object']]
+        except KeyError:
+            return
+        count = utils.vertex_count(obj)
+        if count != op['count']:
+            #the topologies differ (e.g. an edit that added vertices was not synced), the offsets would move other vertices
+            print("Skipped a mesh delta of {0}: {1} vertices instead of {2}, the mesh needs a resync".format(obj.name,count,op['count']))
+            self.resync_needed = True
+            return
+        indices,deltas = meshdelta.decode(op)
+        utils.move_vertices(obj,indices,deltas)
+        
+    def mesh_record(self,op):
+        '''replaces the geometry of a mesh with the one carried by a mesh record, the object keeps its mesh and materials'''
         
-        objects = op['targets']
-        max_num = len(objects)-1
+        try:
+            obj = bpy.data.objects[op['active_object']]
+        except KeyError:
+            return
+        if obj.type != 'MESH':
+            return
+        mesh = snapshot.build_mesh(obj.data.name,binformat.unpack_mesh(meshdelta.decode_record(op)))
+        if obj.mode == 'EDIT':
+            bm = bmesh.from_edit_mesh(obj.data)
+            bm.clear()
+            bm.from_mesh(mesh)
+            bmesh.update_edit_mesh(obj.data,True,True)
+        else:
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bm.to_mesh(obj.data)
+            bm.free()
+            obj.data.update()
+        bpy.data.meshes.remove(mesh)
+        
+    def apply_mesh_deltas(self,ops,pool):
+        '''applies mesh deltas of different objects at once, moving the vertices in worker processes
+        
+        Parameters
+        ops         -- a list of dict objects representing mesh delta operations that address disjoint objects
+        pool        -- a WorkerPool object that runs the jobs
+        
+        The coordinates of every mesh are read here and sent to the pool with their delta, the moved coordinates are
+        written back once all jobs are done. Meshes in edit mode or with another vertex count go through mesh_delta.
+        '''
         
-        for obj in objects:
-            obj_name = bpy.data.objects[obj].name
-            bpy.data.objects[obj].name = utils.shift_name(obj_name,'_',-1,max_num)
+        jobs = []
+        for op in ops:
+            obj = bpy.data.objects.get(op['active_object'])
+            if obj is None or obj.mode == 'EDIT' or len(obj.data.vertices) != op['count']:
+                self.mesh_delta(op)
+                continue
+            coords = utils.get_coords(obj)
+            jobs.append((obj,pool.submit('move_vertices',coords.tobytes(),op['indices'],op['deltas'])))
             
-        utils.format_obj_names('_','.')
-        
\ No newline at end of file
+        for obj,future in jobs:
+            coords = array('f')
+            coords.frombytes(future.result())
+            obj.data.vertices.foreach_set('co',coords)
+            obj.data.update()
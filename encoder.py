@@ -1,9 +1,27 @@
 import bpy
 import json
 from . import utils
+from . import identity
+from . import registry
+from . import meshdelta
+from . import binformat
 
 class Encoder:
     
+    '''
+    Attributes
+    ids      -- an IdMap object used to get the persistent ids of objects
+    names    -- a NameRegistry object that indexes the names of the objects in the scene
+    '''
+    
+    def __init__(self,ids=None,names=None):
+        if ids is None:
+            ids = identity.IdMap()
+        if names is None:
+            names = registry.NameRegistry(bpy.data.objects.keys())
+        self.ids = ids
+        self.names = names
+    
     def create_generic_operation(self,op_name,target_objects,active_object,mode):
         ''' creates a generic encoded operation 
         
@@ -11,6 +29,7 @@ class Encoder:
         op_name        -- name of the operator
         target_objects -- a dictionary object containing the following:
             objects    -- a list of object names
+            ids        -- (optional) a list of ids of the objects, looked up from the names if not given
             verts      -- a list of indices of selected vertices
             edges      -- a list of indices of selected edges
             faces      -- a list of indices of selected faces
@@ -26,6 +45,12 @@ class Encoder:
         op['targets'] = target_objects['objects']
         op['active_object'] = active_object
         op['mode'] = mode
+        #ids are carried along with the names so that receivers can address objects even if their names differ
+        if 'ids' in target_objects:
+            op['target_ids'] = target_objects['ids']
+        else:
+            op['target_ids'] = self.ids.ids_of(op['targets'])
+        op['active_id'] = self.ids.ids_of([active_object])[0]
         
         if mode in ('EDIT_MESH'):
             op['verts'] = target_objects['verts']
@@ -39,6 +64,7 @@ class Encoder:
         op = self.create_generic_operation(operator.name,target_objects,active_object,mode)
         op['x'],op['y'],op['z'] = operator.properties['value']
         op['caxis_x'],op['caxis_y'],op['caxis_z'] = operator.properties['constraint_axis']
+        self.transform_settings(operator,op)
         return op
     
     def rotate(self,operator,target_objects,active_object,mode):
@@ -47,6 +73,7 @@ class Encoder:
         op['value'] = operator.properties['value']
         op['caxis_x'],op['caxis_y'],op['caxis_z'] = operator.properties['constraint_axis']
         op['axis_x'],op['axis_y'],op['axis_z'] = operator.properties['axis']
+        self.transform_settings(operator,op)
         return op
     
     def resize(self,operator,target_objects,active_object,mode):
@@ -54,7 +81,14 @@ class Encoder:
         op = self.create_generic_operation(operator.name, target_objects,active_object, mode)
         op['x'],op['y'],op['z'] = operator.properties['value']
         op['caxis_x'],op['caxis_y'],op['caxis_z'] = operator.properties['constraint_axis']
+        self.transform_settings(operator,op)
         return op
+    
+    def transform_settings(self,operator,op):
+        '''adds the settings a transform was made with besides its values: the orientation of the constraint axes, the
+        pivot point setting and the location of the 3D cursor (used by the 'CURSOR' pivot)'''
+        op['orientation'] = operator.properties.constraint_orientation
+        op['pivot_point'],op['cursor'] = utils.get_pivot()
         
     def delete(self,operator,target_objects,active_object,mode):
         '''creates an operation with attributes specific to a delete'''
@@ -63,6 +97,10 @@ class Encoder:
         if target_objects == {} or (target_objects['verts'] == [] and target_objects['edges'] == [] and target_objects['faces'] == []):
             selected_objects = {}
             selected_objects['objects'] = json.loads(bpy.context.scene.active_obj_name)
+            try:
+                selected_objects['ids'] = json.loads(bpy.context.scene.active_obj_ids)
+            except ValueError:
+                pass
             if mode in ('EDIT_MESH'):
                 internals = json.loads(bpy.context.scene.selected_internals)
                 selected_objects['verts'] = internals['verts']
@@ -75,6 +113,8 @@ class Encoder:
             
         if mode in ('OBJECT'):
             op['use_global'] = operator.properties['use_global']
+            #the deleted objects no longer exist, so they are dropped from the index
+            self.names.sync(op['targets'],bpy.data.objects)
         elif mode in ('EDIT_MESH'):
             op['type'] = operator.type
         return op
@@ -83,6 +123,10 @@ class Encoder:
         '''creates an operation with attributes of any type of object'''
         op = self.create_generic_operation(operator.name, target_objects,active_object, mode)
         op['loc_x'],op['loc_y'],op['loc_z'] = operator.properties['location']
+        #the added object gets its id here, receivers assign the same id to their copy
+        if active_object in bpy.data.objects:
+            op['active_id'] = self.ids.ensure(bpy.data.objects[active_object])
+            self.names.add(active_object)
         return op
     
     def add_cube(self,operator,target_objects,active_object,mode):
@@ -135,12 +179,31 @@ class Encoder:
         op = self.add_generic_object(operator, target_objects, active_object, mode)
         return op    
     
-    def rename_objects(self,active_object,collection):
-        start_index = utils.get_obj_index(active_object,0,collection)
-        #set only the object type (e.g. Cube, Sphere, Cone) as the target object for finding the end index
-        end_index = utils.get_obj_index(active_object.split(".")[0],1,collection)
-        #slice the list based on the start index and end index
+    def mesh_delta(self,active_object,count,indices,deltas):
+        '''creates an operation that moves the vertices of a mesh that changed since the last sync, whatever moved them
+        
+        Parameters
+        active_object  -- a string containing the name of the mesh object
+        count          -- the number of vertices of the mesh
+        indices        -- an array('I') of the indices of the moved vertices
+        deltas         -- an array('f') of their offsets in local coordinates (3 per vertex)
+        '''
+        target_objects = {}
+        target_objects['objects'] = [active_object]
+        op = self.create_generic_operation('Mesh Delta',target_objects,active_object,'NONE')
+        meshdelta.encode(op,count,indices,deltas)
+        return op
+    
+    def mesh_record(self,active_object,arrays):
+        '''creates an operation that replaces the whole mesh of an object, sent when its vertex count changed
+        
+        Parameters
+        active_object  -- a string containing the name of the mesh object
+        arrays         -- a dict object with the arrays of the mesh (see snapshot.mesh_arrays)
+        '''
         target_objects = {}
-        target_objects['objects'] = utils.get_obj_names(collection[start_index:end_index+1])
-        op = self.create_generic_operation('Rename Objects',target_objects,'','NONE')
-        return op
\ No newline at end of file
+        target_objects['objects'] = [active_object]
+        op = self.create_generic_operation('Mesh Record',target_objects,active_object,'NONE')
+        record = binformat.pack_mesh(arrays['verts'],arrays['edges'],arrays['loops'],arrays['loop_starts'],arrays['loop_totals'])
+        meshdelta.encode_record(op,record)
+        return op
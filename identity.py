@@ -0,0 +1,127 @@
+import bpy
+import uuid
+
+#the name of the custom property that stores the id of an object
+ID_PROPERTY = "collab_id"
+
+def get_id(obj):
+    '''gets the id of an object
+    
+    Parameters
+    obj         -- a blender object
+    
+    Return Value
+    obj_id      -- a string containing the id of the object (empty if the object has no id)
+    '''
+    
+    return obj.get(ID_PROPERTY,'')
+
+def new_id():
+    '''creates a new id
+    
+    Return Value
+    obj_id      -- a string containing a random uuid in hex form
+    '''
+    
+    return uuid.uuid4().hex
+
+class IdMap:
+    '''maps the persistent ids of objects to their current names
+    
+    Attributes
+    names       -- a dict object that maps object ids to object names
+    '''
+    
+    def __init__(self):
+        self.names = {}
+        self.refresh()
+        
+    def refresh(self):
+        '''rebuilds the map from the ids stored in the objects of the scene'''
+        
+        self.names = {}
+        for obj in bpy.data.objects:
+            obj_id = get_id(obj)
+            if obj_id != '':
+                self.names[obj_id] = obj.name
+                
+    def register(self,obj,obj_id=''):
+        '''stores an id in an object and adds it to the map
+        
+        Parameters
+        obj         -- a blender object
+        obj_id      -- a string containing the id to assign (a new id is created if empty)
+        
+        Return Value
+        obj_id      -- a string containing the id that was assigned
+        '''
+        
+        if obj_id == '':
+            obj_id = new_id()
+        obj[ID_PROPERTY] = obj_id
+        self.names[obj_id] = obj.name
+        return obj_id
+    
+    def ensure(self,obj):
+        '''gets the id of an object, registering a new one if it has none
+        
+        Parameters
+        obj         -- a blender object
+        
+        Return Value
+        obj_id      -- a string containing the id of the object
+        '''
+        
+        obj_id = get_id(obj)
+        if obj_id == '':
+            obj_id = self.register(obj)
+        return obj_id
+    
+    def forget(self,obj_id):
+        '''removes an id from the map (e.g. after its object is deleted)
+        
+        Parameters
+        obj_id      -- a string containing the id to remove
+        '''
+        
+        self.names.pop(obj_id,None)
+        
+    def name_of(self,obj_id):
+        '''gets the current name of the object with a given id
+        
+        Parameters
+        obj_id      -- a string containing the id of the object
+        
+        Return Value
+        name        -- a string containing the name of the object (None if no object has the id)
+        '''
+        
+        name = self.names.get(obj_id)
+        if name is None:
+            return None
+        
+        #the object may have been renamed or deleted since it was mapped, so the map is rebuilt once in that case
+        obj = bpy.data.objects.get(name)
+        if obj is None or get_id(obj) != obj_id:
+            self.refresh()
+            name = self.names.get(obj_id)
+        return name
+    
+    def ids_of(self,names):
+        '''gets the ids of objects given their names
+        
+        Parameters
+        names       -- a list of object names
+        
+        Return Value
+        obj_ids     -- a list of ids in the same order (empty strings for objects without an id)
+        '''
+        
+        obj_ids = []
+        for name in names:
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                obj_ids.append(get_id(obj))
+            else:
+                obj_ids.append('')
+        return obj_ids
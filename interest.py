@@ -0,0 +1,340 @@
+import bpy
+import mathutils
+import json
+import math
+import threading
+
+def intersects(low_a,high_a,low_b,high_b):
+    '''checks if two axis-aligned boxes overlap
+
+    Parameters
+    low_a,high_a   -- the min and max corners of the first box
+    low_b,high_b   -- the min and max corners of the second box
+
+    Return Value
+    overlap_flag   -- a boolean value indicating if the boxes overlap (True) or not (False)
+    '''
+
+    for i in range(3):
+        if high_a[i] < low_b[i] or high_b[i] < low_a[i]:
+            return False
+    return True
+
+def world_bounds(obj):
+    '''computes the world-space axis-aligned bounding box of an object
+
+    Parameters
+    obj         -- a blender object
+
+    Return Value
+    low,high    -- tuples containing the min and max corners of the box
+    '''
+
+    corners = [obj.matrix_world * mathutils.Vector(corner) for corner in obj.bound_box]
+    low = tuple(min(corner[i] for corner in corners) for i in range(3))
+    high = tuple(max(corner[i] for corner in corners) for i in range(3))
+    return low,high
+
+def object_groups(obj):
+    '''gets the names of the groups an object belongs to
+
+    Parameters
+    obj         -- a blender object
+
+    Return Value
+    groups      -- a set containing the names of the groups
+    '''
+    return set(group.name for group in obj.users_group)
+
+def mark_changed(self,context):
+    '''update callback of the interest properties, the session sends the new interest on its next tick
+
+    Parameters
+    context     -- the blender context whose scene holds the interest properties
+    '''
+    context.scene.interest_changed = True
+
+def scene_interest(scene):
+    '''builds the interest request of a client from the scene properties
+
+    Parameters
+    scene       -- the blender scene holding the interest properties
+
+    Return Value
+    interest    -- a dict object containing 'objects' (ids), 'collections' (group names) and 'region' (a pair of corners or None),
+                   None if the client wants every operation
+    '''
+
+    if scene.interest_mode == 'ALL':
+        return None
+    try:
+        objects = json.loads(scene.interest_objects)
+    except ValueError:
+        objects = []
+    interest = {
+        'objects' : objects,
+        'collections' : [name.strip() for name in scene.interest_collections.split(",") if name.strip() != ''],
+        'region' : None
+    }
+    if scene.interest_use_region == True:
+        interest['region'] = [list(scene.interest_min),list(scene.interest_max)]
+    return interest
+
+class SpatialGrid:
+
+    '''indexes the bounding boxes of objects in a uniform grid, each box is listed in every cell it overlaps
+
+    Attributes
+    cell_size   -- the length of the side of a cell
+    cells       -- a dict object mapping a cell (a tuple of 3 ints) to the set of keys overlapping it
+    boxes       -- a dict object mapping a key to its (low, high) box
+    '''
+
+    def __init__(self,cell_size=10.0):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+
+    def cell_range(self,low,high):
+        '''gets the ranges of cell coordinates covered by a box along each axis
+
+        Parameters
+        low,high    -- the min and max corners of the box
+
+        Return Value
+        ranges      -- a list of three range objects, one per axis
+        '''
+        return [range(int(math.floor(low[i]/self.cell_size)),int(math.floor(high[i]/self.cell_size))+1) for i in range(3)]
+
+    def cell_count(self,low,high):
+        '''counts the cells covered by a box
+
+        Parameters
+        low,high    -- the min and max corners of the box
+
+        Return Value
+        count       -- the number of cells the box overlaps
+        '''
+        count = 1
+        for axis in self.cell_range(low,high):
+            count *= len(axis)
+        return count
+
+    def update(self,key,low,high):
+        '''adds a box or moves it to new bounds
+
+        Parameters
+        key         -- the key of the box (an object id)
+        low,high    -- the min and max corners of the box
+        '''
+        self.remove(key)
+        self.boxes[key] = (tuple(low),tuple(high))
+        xs,ys,zs = self.cell_range(low,high)
+        for x in xs:
+            for y in ys:
+                for z in zs:
+                    self.cells.setdefault((x,y,z),set()).add(key)
+
+    def remove(self,key):
+        '''removes a box, does nothing if the key is not in the grid
+
+        Parameters
+        key         -- the key of the box
+        '''
+        box = self.boxes.pop(key,None)
+        if box is None:
+            return
+        xs,ys,zs = self.cell_range(*box)
+        for x in xs:
+            for y in ys:
+                for z in zs:
+                    cell = self.cells.get((x,y,z))
+                    if cell is not None:
+                        cell.discard(key)
+                        if not cell:
+                            del self.cells[(x,y,z)]
+
+    def query(self,low,high):
+        '''gets the keys of the boxes that overlap a region
+
+        Parameters
+        low,high    -- the min and max corners of the region
+
+        Return Value
+        keys        -- a set containing the keys of the overlapping boxes
+        '''
+        #a region spanning more cells than there are boxes is faster to check box by box
+        if self.cell_count(low,high) > len(self.boxes):
+            candidates = self.boxes.keys()
+        else:
+            candidates = set()
+            xs,ys,zs = self.cell_range(low,high)
+            for x in xs:
+                for y in ys:
+                    for z in zs:
+                        candidates.update(self.cells.get((x,y,z),()))
+        return set(key for key in candidates if intersects(low,high,*self.boxes[key]))
+
+    def clear(self):
+        '''removes every box'''
+        self.cells = {}
+        self.boxes = {}
+
+class Interest:
+
+    '''what a client asked to receive operations on: objects, groups and a region
+
+    Attributes
+    objects     -- a set containing the ids of the objects a client asked for
+    collections -- a set containing the names of the groups a client asked for
+    region      -- a tuple containing the min and max corners of the region a client asked for (None if no region)
+    members     -- a set containing the ids of the objects currently overlapping the region
+    '''
+
+    def __init__(self,request):
+        self.objects = set(request.get('objects') or [])
+        self.collections = set(request.get('collections') or [])
+        self.region = None
+        region = request.get('region')
+        if region:
+            low,high = region
+            self.region = (tuple(min(low[i],high[i]) for i in range(3)),tuple(max(low[i],high[i]) for i in range(3)))
+        self.members = set()
+
+    def matches(self,key,groups):
+        '''checks if an object is of interest
+
+        Parameters
+        key     -- the id of the object
+        groups  -- a set containing the names of the groups of the object
+
+        Return Value
+        match_flag -- a boolean value indicating if the object is of interest (True) or not (False)
+        '''
+        return key in self.objects or key in self.members or not self.collections.isdisjoint(groups)
+
+class InterestManager:
+
+    '''keeps the interest of every client that declared one along with the bounds and groups of the objects in the scene
+
+    Clients without a declared interest receive every operation.
+
+    Attributes
+    ids         -- an IdMap object used to find the objects addressed by an operation
+    grid        -- a SpatialGrid object indexing the world bounds of the objects by id
+    groups      -- a dict object mapping an object id to the set of names of its groups
+    interests   -- a dict object mapping a client address to its Interest object
+    lock        -- a Lock object guarding the interests, they are changed by the registration thread
+    '''
+
+    def __init__(self,ids,cell_size=10.0):
+        self.ids = ids
+        self.grid = SpatialGrid(cell_size)
+        self.groups = {}
+        self.interests = {}
+        self.lock = threading.Lock()
+
+    def set_interest(self,client,request):
+        '''declares (or replaces) the interest of a client, an empty request means every operation
+
+        Parameters
+        client      -- a tuple containing the ip address and port of the client
+        request     -- a dict object as built by scene_interest (or None)
+        '''
+
+        with self.lock:
+            if not request:
+                self.interests.pop(client,None)
+                return
+            interest = Interest(request)
+            if interest.region is not None:
+                interest.members = self.grid.query(*interest.region)
+            self.interests[client] = interest
+
+    def remove_client(self,client):
+        '''forgets the interest of a client, so it receives every operation again
+
+        Parameters
+        client      -- a tuple containing the ip address and port of the client
+        '''
+        with self.lock:
+            self.interests.pop(client,None)
+
+    def rebuild(self):
+        '''indexes every object in the scene (e.g. after loading a snapshot)'''
+        with self.lock:
+            self.grid.clear()
+            self.groups = {}
+            for obj_id in list(self.ids.names.keys()):
+                self.refresh_object(obj_id)
+
+    def keys_of(self,op):
+        '''gets the ids of the objects an operation addresses
+
+        Parameters
+        op          -- a dict object representing an operation
+
+        Return Value
+        keys        -- a set containing the ids of its targets and active object
+        '''
+        keys = set(op.get('target_ids') or [])
+        keys.add(op.get('active_id',''))
+        keys.discard('')
+        return keys
+
+    def update(self,op):
+        '''re-indexes the objects addressed by an operation after it was executed
+
+        Parameters
+        op          -- a dict object representing the executed operation
+        '''
+        with self.lock:
+            for key in self.keys_of(op):
+                self.refresh_object(key)
+
+    def refresh_object(self,key):
+        '''updates the bounds and groups of an object, or drops it if it no longer exists (lock held)
+
+        Parameters
+        key         -- the id of the object
+        '''
+        name = self.ids.name_of(key)
+        if name is None or name not in bpy.data.objects:
+            self.grid.remove(key)
+            self.groups.pop(key,None)
+            for interest in self.interests.values():
+                interest.members.discard(key)
+            return
+
+        obj = bpy.data.objects[name]
+        low,high = world_bounds(obj)
+        self.grid.update(key,low,high)
+        self.groups[key] = object_groups(obj)
+        for interest in self.interests.values():
+            if interest.region is None:
+                continue
+            if intersects(low,high,*interest.region):
+                interest.members.add(key)
+            else:
+                interest.members.discard(key)
+
+    def excluded(self,op):
+        '''gets the clients that are not interested in an operation
+
+        Parameters
+        op          -- a dict object representing an operation
+
+        Return Value
+        excluded    -- a set containing the addresses of the clients whose interest none of the addressed objects match
+        '''
+
+        keys = self.keys_of(op)
+        excluded = set()
+        #operations that do not address any object concern every client
+        if keys == set():
+            return excluded
+        with self.lock:
+            for client,interest in self.interests.items():
+                if not any(interest.matches(key,self.groups.get(key,())) for key in keys):
+                    excluded.add(client)
+        return excluded
@@ -0,0 +1,107 @@
+'''jobs that the server runs in worker processes
+
+This module does not depend on bpy or on the add-on package. It is the only module of the jobs folder, which
+workers.py puts on sys.path so that worker processes can import it and its functions can be pickled by name and run
+on other cores. The bpy-free modules of the add-on it uses are loaded by path under names of their own (see
+load_sibling), so nothing else of the add-on becomes importable as a top-level module. Every job takes and returns
+plain values, bytes or lists.
+'''
+
+import os
+import sys
+import importlib.util
+from array import array
+
+#the add-on folder, the bpy-free modules the jobs use are loaded from it
+ADDON_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#the prefix of the module names the add-on modules are loaded under, so they never shadow other modules
+MODULE_PREFIX = "collab_jobs_"
+
+def load_sibling(name):
+    '''loads a bpy-free module of the add-on by path, once per process
+
+    Parameters
+    name         -- a string containing the name of the module in the add-on folder (e.g. 'binformat')
+
+    Return Value
+    module       -- the loaded module, registered in sys.modules as MODULE_PREFIX + name
+    '''
+
+    module_name = MODULE_PREFIX + name
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name,os.path.join(ADDON_FOLDER,name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+binformat = load_sibling('binformat')
+oplog = load_sibling('oplog')
+meshdelta = load_sibling('meshdelta')
+
+def hash_entries(entries,records):
+    '''computes the content hashes of collected snapshot entries that do not have one yet
+
+    Parameters
+    entries      -- a list of dict objects describing the objects (type and matrix are used)
+    records      -- a list of packed mesh records (None for objects without a mesh), same order as entries
+    '''
+
+    for entry,record in zip(entries,records):
+        if 'hash' in entry:
+            continue
+        matrix = entry['matrix']
+        if record is None:
+            entry['hash'] = binformat.content_hash(entry['type'],matrix)
+        else:
+            arrays = binformat.unpack_mesh(record)
+            entry['hash'] = binformat.content_hash(entry['type'],matrix,arrays['verts'],arrays['loops'],arrays['loop_totals'])
+            for view in arrays.values():
+                view.release()
+
+def write_snapshot(filename,entries,records):
+    '''hashes collected entries and writes them to a binary snapshot file
+
+    Parameters
+    filename     -- a string containing the path of the file to write
+    entries      -- a list of dict objects describing the objects
+    records      -- a list of packed mesh records
+
+    Return Value
+    digest       -- a string containing the sha1 digest of the written file (for the checkpoint list)
+    '''
+
+    hash_entries(entries,records)
+    output_file = open(filename,'wb')
+    binformat.write_snapshot(output_file,entries,records)
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    output_file.close()
+    return oplog.file_digest(filename)
+
+def file_digest(filename):
+    '''computes the sha1 digest of a file (see oplog.file_digest)'''
+    return oplog.file_digest(filename)
+
+def compact_log(filename,temp_name,keep_after,end):
+    '''copies the records of an operation log that are still needed to a new file (see oplog.copy_records_after)'''
+    return oplog.copy_records_after(filename,temp_name,keep_after,end)
+
+def move_vertices(coords,indices,deltas):
+    '''moves vertex coordinates by the offsets of a mesh delta (see meshdelta.encode)
+
+    Parameters
+    coords       -- a bytes object of the vertex coordinates of the mesh (float32 x 3)
+    indices      -- a string containing the base64 indices of the moved vertices
+    deltas       -- a string containing the base64 offsets of the moved vertices
+
+    Return Value
+    coords       -- a bytes object of the moved coordinates
+    '''
+
+    moved = array('f')
+    moved.frombytes(coords)
+    indices,deltas = meshdelta.decode({'indices' : indices,'deltas' : deltas})
+    meshdelta.apply_changes(moved,indices,deltas)
+    return moved.tobytes()
@@ -0,0 +1,163 @@
+'''short edit leases on objects, kept by the server
+
+This module does not depend on bpy. A client asks for leases on the objects it selects and renews them while they
+stay selected, a lease that is not renewed runs out after its duration. Operations from a client that does not hold
+the lease of an object are stripped of that object (or rejected when nothing is left), so two users never edit the
+same object at once and most operations need no transformation at all.
+'''
+
+import time
+import threading
+
+
+def holder_key(address):
+    '''formats the address of a client the way holders are listed to the clients'''
+    return "{0}:{1}".format(address[0],address[1])
+
+class Lease:
+
+    '''
+    Attributes
+    holder      -- a tuple containing the ip address and port of the client holding the lease
+    acquired    -- the time the lease was granted
+    expires     -- the time the lease runs out unless it is renewed
+    '''
+
+    def __init__(self,holder,now,duration):
+        self.holder = holder
+        self.acquired = now
+        self.expires = now + duration
+
+class LeaseTable:
+
+    '''
+    Attributes
+    duration    -- the number of seconds a lease lasts without being renewed
+    leases      -- a dict object mapping object ids to Lease objects
+    lock        -- a Lock object guarding the leases, they are requested by the receiving threads
+    '''
+
+    def __init__(self,duration=3.0):
+        self.duration = duration
+        self.leases = {}
+        self.lock = threading.Lock()
+
+    def request(self,holder,obj_ids):
+        '''replaces the leases of a client with leases on the objects it has selected
+
+        Parameters
+        holder      -- a tuple containing the ip address and port of the client
+        obj_ids     -- a list of the ids of the objects the client wants to edit (empty to release everything)
+
+        Return Value
+        changed_flag -- a boolean value indicating if a lease was granted or released (renewals change nothing)
+
+        Objects held by another client are not granted, the client keeps asking while they stay selected.
+        '''
+
+        now = time.time()
+        wanted = set(obj_ids)
+        wanted.discard('')
+        changed_flag = False
+        with self.lock:
+            changed_flag = self.expire_locked(now)
+            for obj_id,lease in list(self.leases.items()):
+                if lease.holder == holder and obj_id not in wanted:
+                    del self.leases[obj_id]
+                    changed_flag = True
+            for obj_id in wanted:
+                lease = self.leases.get(obj_id)
+                if lease is None:
+                    self.leases[obj_id] = Lease(holder,now,self.duration)
+                    changed_flag = True
+                elif lease.holder == holder:
+                    lease.expires = now + self.duration
+        return changed_flag
+
+    def release_all(self,holder):
+        '''removes every lease of a client (e.g. it left the session)
+
+        Return Value
+        changed_flag -- a boolean value indicating if the client held a lease
+        '''
+
+        with self.lock:
+            held = [obj_id for obj_id,lease in self.leases.items() if lease.holder == holder]
+            for obj_id in held:
+                del self.leases[obj_id]
+        return held != []
+
+    def expire(self):
+        '''removes the leases that were not renewed in time
+
+        Return Value
+        changed_flag -- a boolean value indicating if a lease ran out
+        '''
+
+        with self.lock:
+            return self.expire_locked(time.time())
+
+    def expire_locked(self,now):
+        expired = [obj_id for obj_id,lease in self.leases.items() if lease.expires <= now]
+        for obj_id in expired:
+            del self.leases[obj_id]
+        return expired != []
+
+    def held_by_others(self,obj_ids,holder):
+        '''gets the objects among some ids that another client holds a lease on
+
+        Return Value
+        held        -- a set object containing the ids held by other clients
+        '''
+
+        now = time.time()
+        with self.lock:
+            return set(obj_id for obj_id in obj_ids if obj_id in self.leases and
+                       self.leases[obj_id].holder != holder and self.leases[obj_id].expires > now)
+
+    def filter(self,op,sender):
+        '''removes the objects leased by other clients from an operation
+
+        Parameters
+        op          -- a dict object representing an operation with resolved targets
+        sender      -- a tuple containing the ip address and port of the client that sent it
+
+        Return Value
+        op          -- the operation to process (None if nothing of it may be applied)
+        rejected    -- a list of the ids of the objects the operation was not allowed to edit
+        '''
+
+        kind = op['name'].lower().replace(" ","_")
+        #adds create their objects, they do not edit objects other clients may hold
+        if kind.startswith('add'):
+            return op,[]
+        target_ids = op.get('target_ids') or []
+        held = self.held_by_others(target_ids + [op.get('active_id','')],sender)
+        if held == set():
+            return op,[]
+        rejected = sorted(held)
+
+        #an edit mode operation changes the internals of its active object, it cannot be split
+        if op['mode'] != 'OBJECT' or len(target_ids) != len(op['targets']):
+            return None,rejected
+
+        kept = [(name,obj_id) for name,obj_id in zip(op['targets'],target_ids) if obj_id not in held]
+        if kept == []:
+            return None,rejected
+        op = dict(op)
+        op['targets'] = [name for name,obj_id in kept]
+        op['target_ids'] = [obj_id for name,obj_id in kept]
+        if op.get('active_id','') in held:
+            op['active_object'],op['active_id'] = kept[0]
+        return op,rejected
+
+    def holders(self):
+        '''lists the current leases
+
+        Return Value
+        holders     -- a dict object mapping object ids to the holders formatted by holder_key
+        '''
+
+        now = time.time()
+        with self.lock:
+            return dict((obj_id,holder_key(lease.holder)) for obj_id,lease in self.leases.items() if lease.expires > now)
@@ -0,0 +1,94 @@
+import bpy
+
+class LockManager:
+    '''keeps track of the objects locked from selection while remote operations are applied
+    
+    Attributes
+    locked    -- a set containing the names of the objects whose selection was locked by this manager
+    excluded  -- a set containing the names of the objects left unlocked by the last lock (the targets of its operation)
+    active    -- a boolean value indicating if a lock is currently held (True) or not (False)
+    depth     -- an int value counting the open batches; while it is above 0, unlocking is deferred to end_batch
+    '''
+    
+    def __init__(self):
+        self.locked = set()
+        self.excluded = set()
+        self.active = False
+        self.depth = 0
+        
+    def lock(self,excluded_objects):
+        '''locks all objects from selection, excluding specified objects
+        
+        Parameters
+        excluded_objects   -- a list containing the names of objects not to lock
+        
+        Only the first lock of a batch visits every object. While a lock is held, a new lock only touches the
+        difference between the previous and the new set of excluded objects.
+        '''
+        
+        excluded = set(excluded_objects)
+        
+        if self.active == False:
+            for obj in bpy.data.objects:
+                #objects that were already locked (e.g. by the user) are left alone so they are not unlocked later
+                if obj.name not in excluded and obj.hide_select == False:
+                    obj.hide_select = True
+                    self.locked.add(obj.name)
+            self.active = True
+        else:
+            #unlock the objects that are excluded now but were locked by the previous lock
+            for name in excluded & self.locked:
+                self.set_lock(name,False)
+            #lock the objects that were excluded by the previous lock but are no longer excluded
+            for name in self.excluded - excluded:
+                self.set_lock(name,True)
+                
+        self.excluded = excluded
+        
+    def unlock(self):
+        '''unlocks all objects locked by this manager, unless a batch is open'''
+        
+        if self.depth == 0:
+            self.release()
+            
+    def release(self):
+        '''unlocks every object that was locked by this manager'''
+        
+        for name in list(self.locked):
+            self.set_lock(name,False)
+        self.locked = set()
+        self.excluded = set()
+        self.active = False
+        
+    def begin_batch(self):
+        '''keeps the lock between operations so consecutive locks only apply their difference'''
+        self.depth += 1
+        
+    def end_batch(self):
+        '''closes a batch and releases the lock once all batches are closed'''
+        
+        if self.depth > 0:
+            self.depth -= 1
+        self.unlock()
+        
+    def set_lock(self,name,flag):
+        '''locks (or unlocks) a single object and records the change
+        
+        Parameters
+        name     -- a string containing the name of the object
+        flag     -- a boolean value representing lock (True) and unlock (False)
+        '''
+        
+        try:
+            obj = bpy.data.objects[name]
+        except KeyError:
+            #the object no longer exists (e.g. it was deleted by a remote operation)
+            self.locked.discard(name)
+            return
+        
+        if flag == True and obj.hide_select == False:
+            obj.hide_select = True
+            self.locked.add(name)
+        elif flag == False and name in self.locked:
+            obj.hide_select = False
+            self.locked.discard(name)
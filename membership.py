@@ -0,0 +1,128 @@
+'''the registry of the clients subscribed to a server
+
+This module does not depend on bpy. The server pings every member periodically, the replies (and any other data
+from a member) mark it as alive, and members that stay silent for too long are evicted.
+'''
+
+import time
+import json
+import threading
+
+class Member:
+
+    '''
+    Attributes
+    address     -- a tuple containing the ip address and port of the client
+    joined      -- the time the client subscribed
+    last_seen   -- the time data was last received from the client
+    rtt         -- the smoothed round trip time in seconds (None until the first heartbeat reply)
+    '''
+
+    def __init__(self,address,now):
+        self.address = address
+        self.joined = now
+        self.last_seen = now
+        self.rtt = None
+
+class Membership:
+
+    '''
+    A registry of clients keyed by address, it can be used where a list of addresses was used (in, iteration, len)
+
+    Attributes
+    members     -- a dict object mapping client addresses to Member objects
+    lock        -- a Lock object guarding the members, they are changed by the receiving and registration threads
+    '''
+
+    def __init__(self):
+        self.members = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self,address):
+        return address in self.members
+
+    def __iter__(self):
+        #iterate over a copy, members come and go while operations are sent
+        with self.lock:
+            return iter(list(self.members.keys()))
+
+    def __len__(self):
+        return len(self.members)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def add(self,address):
+        '''adds a client (or refreshes it if it subscribes again)'''
+        with self.lock:
+            if address not in self.members:
+                self.members[address] = Member(address,time.time())
+            else:
+                self.members[address].last_seen = time.time()
+
+    def remove(self,address):
+        '''removes a client, does nothing if it is not a member'''
+        with self.lock:
+            self.members.pop(address,None)
+
+    def touch(self,address,sent_time=None):
+        '''records that data was received from a client
+
+        Parameters
+        address     -- a tuple containing the ip address and port of the client
+        sent_time   -- (optional) the time the heartbeat being answered was sent, to measure the round trip time
+
+        Return Value
+        member_flag -- a boolean value indicating if the client is a member (True) or not (False)
+        '''
+
+        now = time.time()
+        with self.lock:
+            member = self.members.get(address)
+            if member is None:
+                return False
+            member.last_seen = now
+            if sent_time is not None:
+                sample = max(0.0,now - sent_time)
+                if member.rtt is None:
+                    member.rtt = sample
+                else:
+                    member.rtt = 0.875 * member.rtt + 0.125 * sample
+            return True
+
+    def evict(self,timeout):
+        '''removes the clients that have not been heard from for a while
+
+        Parameters
+        timeout     -- the number of seconds of silence after which a client is evicted
+
+        Return Value
+        evicted     -- a list of the addresses of the removed clients
+        '''
+
+        now = time.time()
+        with self.lock:
+            evicted = [address for address,member in self.members.items() if now - member.last_seen > timeout]
+            for address in evicted:
+                del self.members[address]
+        return evicted
+
+    def rtt_of(self,address):
+        '''gets the smoothed round trip time of a client (None if unknown)'''
+        member = self.members.get(address)
+        if member is None:
+            return None
+        return member.rtt
+
+    def to_json(self):
+        '''lists the members with their round trip times in milliseconds, as shown in the panel'''
+        now = time.time()
+        with self.lock:
+            listing = []
+            for address,member in sorted(self.members.items()):
+                listing.append({
+                    'address' : "{0}:{1}".format(address[0],address[1]),
+                    'rtt' : None if member.rtt is None else round(member.rtt * 1000.0,1),
+                    'idle' : round(now - member.last_seen,1)
+                })
+        return json.dumps(listing)
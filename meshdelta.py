@@ -0,0 +1,147 @@
+'''sparse vertex coordinate deltas of meshes
+
+This module does not depend on bpy. A client keeps the vertex coordinates of the mesh being edited from the last
+tick and compares them with the current ones, so every edit that moves vertices (sculpting, proportional editing,
+operators the encoder does not know) is synced as the indices of the moved vertices and their offsets. Unchanged
+blocks of vertices are skipped by comparing their bytes, so only the changed region is looked at vertex by vertex.
+
+Operation fields
+count      -- the number of vertices of the mesh, the server rejects a delta made on another count back to its sender and a
+              client with another count skips the delta and reloads the snapshot
+indices    -- base64 of the indices of the moved vertices (uint32, little-endian)
+deltas     -- base64 of the offsets of the moved vertices in local coordinates (float32 x 3, little-endian)
+
+An edit that changes the number of vertices cannot be sent as offsets. The whole mesh is sent as a mesh record
+operation instead, its only field is:
+
+record     -- base64 of the packed mesh (see binformat.pack_mesh)
+'''
+
+import base64
+from array import array
+
+#the number of vertices whose coordinates are compared as one block of bytes
+BLOCK = 256
+#the size of the coordinates of one vertex in bytes
+VERTEX_SIZE = 3 * array('f').itemsize
+
+def find_changes(previous,current):
+    '''finds the vertices that moved between two arrays of coordinates of the same mesh
+
+    Parameters
+    previous    -- an array('f') of the earlier vertex coordinates (3 per vertex)
+    current     -- an array('f') of the current vertex coordinates, as long as previous
+
+    Return Value
+    indices     -- an array('I') of the indices of the moved vertices, in increasing order
+    deltas      -- an array('f') of the offsets of the moved vertices (3 per vertex)
+    '''
+
+    indices = array('I')
+    deltas = array('f')
+    previous_bytes = previous.tobytes()
+    current_bytes = current.tobytes()
+    step = BLOCK * VERTEX_SIZE
+    count = len(current) // 3
+    for start in range(0,len(current_bytes),step):
+        if previous_bytes[start:start + step] == current_bytes[start:start + step]:
+            continue
+        first = start // VERTEX_SIZE
+        for index in range(first,min(first + BLOCK,count)):
+            i = 3 * index
+            dx = current[i] - previous[i]
+            dy = current[i + 1] - previous[i + 1]
+            dz = current[i + 2] - previous[i + 2]
+            if dx != 0.0 or dy != 0.0 or dz != 0.0:
+                indices.append(index)
+                deltas.extend((dx,dy,dz))
+    return indices,deltas
+
+def apply_changes(coords,indices,deltas):
+    '''moves vertices of an array of coordinates by their offsets, in place'''
+    for n,index in enumerate(indices):
+        i = 3 * index
+        coords[i] += deltas[3 * n]
+        coords[i + 1] += deltas[3 * n + 1]
+        coords[i + 2] += deltas[3 * n + 2]
+
+def encode(op,count,indices,deltas):
+    '''stores the moved vertices in an operation
+
+    Parameters
+    op          -- a dict object representing a mesh delta operation
+    count       -- the number of vertices of the mesh
+    indices     -- an array('I') of the indices of the moved vertices
+    deltas      -- an array('f') of their offsets
+    '''
+
+    op['count'] = count
+    op['indices'] = base64.b64encode(indices.tobytes()).decode('ascii')
+    op['deltas'] = base64.b64encode(deltas.tobytes()).decode('ascii')
+
+def decode(op):
+    '''gets the moved vertices stored by encode
+
+    Return Value
+    indices     -- an array('I') of the indices of the moved vertices
+    deltas      -- an array('f') of their offsets
+    '''
+
+    indices = array('I')
+    indices.frombytes(base64.b64decode(op['indices']))
+    deltas = array('f')
+    deltas.frombytes(base64.b64decode(op['deltas']))
+    return indices,deltas
+
+def encode_record(op,record):
+    '''stores a packed mesh in a mesh record operation'''
+    op['record'] = base64.b64encode(record).decode('ascii')
+
+def decode_record(op):
+    '''gets the packed mesh stored by encode_record, as a bytes object'''
+    return base64.b64decode(op['record'])
+
+def negate(op):
+    '''gets the mesh delta operation that moves the vertices of a mesh delta back
+
+    Parameters
+    op          -- a dict object representing a mesh delta operation
+
+    Return Value
+    undo        -- a copy of the operation with the offsets negated
+    '''
+
+    indices,deltas = decode(op)
+    undo = dict(op)
+    encode(undo,op['count'],indices,array('f',[-delta for delta in deltas]))
+    return undo
+
+def remap(op,removed):
+    '''maps the vertices of a mesh delta operation across a delete of vertices of the same mesh
+
+    Parameters
+    op          -- a dict object representing a mesh delta operation made without knowing the delete
+    removed     -- a sorted list of the indices of the removed vertices
+
+    Return Value
+    op          -- the mesh delta operation for the mesh after the delete, offsets of removed vertices are dropped
+    '''
+
+    if removed == []:
+        return op
+    indices,deltas = decode(op)
+    removed_set = set(removed)
+    kept_indices = array('I')
+    kept_deltas = array('f')
+    shift = 0
+    for n,index in enumerate(indices):
+        if index in removed_set:
+            continue
+        #both lists are sorted, so the number of removed vertices below an index only grows
+        while shift < len(removed) and removed[shift] < index:
+            shift += 1
+        kept_indices.append(index - shift)
+        kept_deltas.extend(deltas[3 * n:3 * n + 3])
+    op = dict(op)
+    encode(op,op['count'] - len(removed),kept_indices,kept_deltas)
+    return op
@@ -0,0 +1,200 @@
+'''publishing operations once to an IP multicast group
+
+This module does not depend on bpy. On a LAN the server can publish every operation as a single datagram to the
+session's multicast group instead of sending one copy per client. Group datagrams are numbered, so a client notices
+the ones it missed and asks the server for them over unicast (a NACK), the server answers from its recent history.
+
+Datagram (little-endian)
+header     -- magic (4 bytes), group sequence number (uint32)
+payload    -- the json data, empty for a repair of a datagram that is no longer in the history
+'''
+
+import time
+import struct
+import socket
+import threading
+from collections import OrderedDict
+
+MAGIC = b'MCST'
+HEADER = struct.Struct('<4sI')
+#the number of published datagrams kept for repairs
+HISTORY = 4096
+#datagrams further ahead of the next expected one are dropped, they are repaired once the gap is filled
+REORDER_WINDOW = 4096
+#the number of seconds before a missing range is asked for again
+NACK_INTERVAL = 0.2
+
+def is_group_datagram(datagram):
+    '''checks if a datagram was published to the group (or is a repair of one)'''
+    return datagram[:len(MAGIC)] == MAGIC
+
+def join(group,port,interface=''):
+    '''opens a socket that receives the datagrams of a multicast group
+
+    Parameters
+    group       -- a string containing the multicast address of the group
+    port        -- the port the group datagrams are sent to
+    interface   -- a string containing the address of the interface to join on ('' for the default one,
+                   '127.0.0.1' to test on the loopback interface)
+
+    Return Value
+    sock        -- a UDP socket object bound to the port of the group, several clients on one host can share it
+    '''
+
+    sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM,socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+    if hasattr(socket,'SO_REUSEPORT'):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEPORT,1)
+        except OSError:
+            pass
+    sock.bind(('',port))
+    membership = socket.inet_aton(group) + socket.inet_aton(interface or '0.0.0.0')
+    sock.setsockopt(socket.IPPROTO_IP,socket.IP_ADD_MEMBERSHIP,membership)
+    return sock
+
+def leave(sock):
+    '''closes a socket returned by join, the membership of the group ends with it'''
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+class Publisher:
+
+    '''
+    Sends datagrams to a multicast group and keeps the recent ones for repairs
+
+    Attributes
+    group       -- a tuple containing the multicast address and port of the group
+    sock        -- the UDP socket object used for publishing
+    seq         -- the group sequence number of the last published datagram
+    history     -- an OrderedDict mapping group sequence numbers to the published datagrams, oldest first
+    lock        -- a Lock object guarding the sequence number and the history
+    '''
+
+    def __init__(self,group,port,interface='',ttl=1):
+        self.group = (group,port)
+        self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM,socket.IPPROTO_UDP)
+        #a ttl of 1 keeps the datagrams on the local network
+        self.sock.setsockopt(socket.IPPROTO_IP,socket.IP_MULTICAST_TTL,ttl)
+        #clients on the server's host receive the datagrams too
+        self.sock.setsockopt(socket.IPPROTO_IP,socket.IP_MULTICAST_LOOP,1)
+        if interface:
+            self.sock.setsockopt(socket.IPPROTO_IP,socket.IP_MULTICAST_IF,socket.inet_aton(interface))
+        self.seq = 0
+        self.history = OrderedDict()
+        self.lock = threading.Lock()
+
+    def publish(self,payload):
+        '''sends a payload to the group once, whatever the number of clients
+
+        Return Value
+        seq         -- the group sequence number given to the payload
+        '''
+
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            datagram = HEADER.pack(MAGIC,seq) + payload
+            self.history[seq] = datagram
+            while len(self.history) > HISTORY:
+                self.history.popitem(last=False)
+        try:
+            self.sock.sendto(datagram,self.group)
+        except OSError:
+            #the datagram stays in the history, the clients ask for it when they notice the gap
+            pass
+        return seq
+
+    def repair(self,first,last):
+        '''gets the datagrams of a range of group sequence numbers to send them again over unicast
+
+        Return Value
+        datagrams   -- a list of datagrams, the ones no longer in the history have an empty payload
+        '''
+
+        with self.lock:
+            last = min(last,self.seq)
+            return [self.history.get(seq,HEADER.pack(MAGIC,seq)) for seq in range(max(first,1),last + 1)]
+
+    def close(self):
+        self.sock.close()
+
+class GroupReceiver:
+
+    '''
+    Orders the datagrams of a group and finds the missing ones. Group datagrams and their unicast repairs arrive on
+    different sockets, so the receiver is shared by the listening threads.
+
+    Attributes
+    expected    -- the group sequence number of the next datagram to deliver
+    latest      -- the highest group sequence number known to be published
+    reorder     -- a dict object mapping group sequence numbers to payloads received ahead of a gap
+    asked       -- a dict object mapping the first sequence number of a missing range to the time it was asked for
+    lock        -- a Lock object guarding the state
+    '''
+
+    def __init__(self,seq):
+        self.expected = seq + 1
+        self.latest = seq
+        self.reorder = {}
+        self.asked = {}
+        self.lock = threading.Lock()
+
+    def receive(self,datagram):
+        '''handles a group datagram
+
+        Return Value
+        payloads    -- a list of the payloads that can now be delivered, in order (empty for duplicates)
+        '''
+
+        if len(datagram) < HEADER.size:
+            return []
+        magic,seq = HEADER.unpack_from(datagram,0)
+        payloads = []
+        with self.lock:
+            self.latest = max(self.latest,seq)
+            if seq >= self.expected and seq < self.expected + REORDER_WINDOW:
+                self.reorder[seq] = datagram[HEADER.size:]
+                while self.expected in self.reorder:
+                    payload = self.reorder.pop(self.expected)
+                    if payload != b'':
+                        payloads.append(payload)
+                    else:
+                        print("Group datagram {0} is no longer available".format(self.expected))
+                    self.expected += 1
+        return payloads
+
+    def announce(self,seq):
+        '''records the latest group sequence number (sent with the heartbeats), so losing the last datagram is noticed'''
+        with self.lock:
+            self.latest = max(self.latest,seq)
+
+    def missing(self):
+        '''lists the ranges to ask for, a range is asked for again if the repair does not arrive in time
+
+        Return Value
+        ranges      -- a list of (first, last) tuples of group sequence numbers
+        '''
+
+        now = time.time()
+        ranges = []
+        with self.lock:
+            end = min(self.latest,self.expected + REORDER_WINDOW - 1)
+            first = None
+            for seq in range(self.expected,end + 1):
+                if seq in self.reorder:
+                    if first is not None:
+                        ranges.append((first,seq - 1))
+                        first = None
+                elif first is None:
+                    first = seq
+            if first is not None:
+                ranges.append((first,end))
+            for seq in [seq for seq in self.asked if seq < self.expected]:
+                del self.asked[seq]
+            ranges = [(first,last) for first,last in ranges if now - self.asked.get(first,0.0) >= NACK_INTERVAL]
+            for first,last in ranges:
+                self.asked[first] = now
+        return ranges
@@ -0,0 +1,412 @@
+'''write-ahead log of processed operations and checkpoints of the session snapshot
+
+This module does not depend on bpy. A crashed server restarts from the newest checkpoint whose files are intact and
+replays only the logged operations that came after it.
+
+Log record (little-endian)
+header     -- payload length (uint32), crc32 of the sequence number and payload (uint32), sequence number (uint64)
+payload    -- the operation data as utf-8 json
+'''
+
+import os
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+
+#the extension of the operation log file
+EXTENSION = ".oplog"
+#the extension of the file that lists the retained checkpoints
+CHECKPOINT_EXTENSION = ".ckpt"
+#the suffix added to the name of the snapshot files kept from the previous checkpoint
+PREVIOUS_SUFFIX = ".prev"
+RECORD = struct.Struct('<IIQ')
+SEQ = struct.Struct('<Q')
+
+def record_crc(seq,payload):
+    '''computes the checksum of a log record
+    
+    Parameters
+    seq         -- the sequence number of the record
+    payload     -- a bytes object containing the payload of the record
+    
+    Return Value
+    crc         -- an unsigned 32-bit checksum
+    '''
+    
+    return zlib.crc32(payload,zlib.crc32(SEQ.pack(seq))) & 0xffffffff
+
+def pack_record(seq,data):
+    '''packs operation data into a log record
+    
+    Parameters
+    seq         -- the sequence number of the operation
+    data        -- a dict object containing the operation data
+    
+    Return Value
+    record      -- a bytes object
+    '''
+    
+    payload = json.dumps(data).encode('utf-8')
+    return RECORD.pack(len(payload),record_crc(seq,payload),seq) + payload
+
+def scan_records(buffer):
+    '''reads the valid records at the start of a buffer, stopping at the first torn or corrupt record
+    
+    Parameters
+    buffer      -- a bytes-like object (e.g. a memory-mapped log file)
+    
+    Return Value
+    records     -- a list of (seq, data) tuples
+    end         -- the offset right after the last valid record
+    '''
+    
+    records = []
+    offset = 0
+    size = len(buffer)
+    while offset + RECORD.size <= size:
+        length,crc,seq = RECORD.unpack_from(buffer,offset)
+        start = offset + RECORD.size
+        if start + length > size:
+            break
+        payload = bytes(buffer[start:start + length])
+        if record_crc(seq,payload) != crc:
+            break
+        try:
+            records.append((seq,json.loads(payload.decode('utf-8'))))
+        except ValueError:
+            break
+        offset = start + length
+    return records,offset
+
+def copy_records_after(filename,temp_name,keep_after,end):
+    '''copies the records of a log that come after a sequence number to a new file, as they are (no re-framing)
+    
+    Parameters
+    filename    -- a string containing the path of the log file
+    temp_name   -- a string containing the path of the file to write
+    keep_after  -- the sequence number after which records are kept
+    end         -- the offset up to which the log is copied (records appended later are copied by the caller)
+    
+    Return Value
+    first_seq   -- the sequence number of the first copied record (None if no record was copied)
+    
+    This does not need anything from the process that owns the log, so it can run in a worker process.
+    '''
+    
+    first_seq = None
+    output_file = open(temp_name,'wb')
+    if end > 0:
+        log_file = open(filename,'rb')
+        log_map = mmap.mmap(log_file.fileno(),0,access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            while offset + RECORD.size <= end:
+                length,crc,seq = RECORD.unpack_from(log_map,offset)
+                if seq > keep_after:
+                    first_seq = seq
+                    break
+                offset += RECORD.size + length
+            #the records are in sequence order, so everything from the first kept record on is kept
+            if first_seq is not None:
+                output_file.write(log_map[offset:end])
+        finally:
+            log_map.close()
+            log_file.close()
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    output_file.close()
+    return first_seq
+
+def file_digest(filename):
+    '''computes the sha1 digest of a file
+    
+    Parameters
+    filename    -- a string containing the path of the file
+    
+    Return Value
+    digest      -- a string containing the hex digest (None if the file cannot be read)
+    '''
+    
+    digest = hashlib.sha1()
+    try:
+        input_file = open(filename,'rb')
+    except IOError:
+        return None
+    chunk = input_file.read(1 << 20)
+    while chunk:
+        digest.update(chunk)
+        chunk = input_file.read(1 << 20)
+    input_file.close()
+    return digest.hexdigest()
+
+class OpLog:
+    '''an append-only log of the operations processed by the server
+    
+    Attributes
+    filename    -- a string containing the path of the log file
+    file        -- the file object used for appending (None until recover is called)
+    first_seq   -- the sequence number of the first record in the log (None if the log is empty)
+    last_seq    -- the sequence number of the last record in the log (0 if the log is empty)
+    compaction  -- a tuple (future, end) of a compaction running in a worker process (None if there is none)
+    '''
+    
+    def __init__(self,path,name):
+        self.filename = path + "/" + name + EXTENSION
+        self.file = None
+        self.first_seq = None
+        self.last_seq = 0
+        self.compaction = None
+        
+    def scan(self):
+        '''reads the valid records of the log through a memory map
+        
+        Return Value
+        records     -- a list of (seq, data) tuples
+        end         -- the offset right after the last valid record
+        '''
+        
+        if not os.path.isfile(self.filename) or os.path.getsize(self.filename) == 0:
+            return [],0
+        log_file = open(self.filename,'rb')
+        log_map = mmap.mmap(log_file.fileno(),0,access=mmap.ACCESS_READ)
+        try:
+            records,end = scan_records(log_map)
+        finally:
+            log_map.close()
+            log_file.close()
+        return records,end
+    
+    def recover(self,after_seq):
+        '''reads the log, cuts off a torn tail and opens the log for appending
+        
+        Parameters
+        after_seq   -- the sequence number included in the checkpoint that was loaded
+        
+        Return Value
+        records     -- a list of (seq, data) tuples of the records that come after the checkpoint, in order
+        '''
+        
+        records,end = self.scan()
+        if os.path.isfile(self.filename) and os.path.getsize(self.filename) > end:
+            print("Discarding a torn operation log tail at offset {0}".format(end))
+            log_file = open(self.filename,'r+b')
+            log_file.truncate(end)
+            log_file.close()
+            
+        if records != []:
+            self.first_seq = records[0][0]
+            self.last_seq = records[-1][0]
+        self.file = open(self.filename,'ab')
+        return [record for record in records if record[0] > after_seq]
+    
+    def append(self,seq,data):
+        '''appends the data of a processed operation to the log
+        
+        Parameters
+        seq         -- the sequence number of the operation
+        data        -- a dict object containing the operation data
+        '''
+        
+        self.file.write(pack_record(seq,data))
+        self.file.flush()
+        if self.first_seq is None:
+            self.first_seq = seq
+        self.last_seq = seq
+        
+    def sync(self):
+        '''forces the appended records to disk'''
+        
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+            
+    def compact(self,keep_after,pool=None):
+        '''drops the records that every retained checkpoint already includes
+        
+        Parameters
+        keep_after  -- the sequence number of the oldest retained checkpoint (None does nothing)
+        pool        -- (optional) a WorkerPool object, the records are then copied by a worker process and the new log
+                       is swapped in by a later call once the copy is done
+        '''
+        
+        if self.compaction is not None:
+            future,end = self.compaction
+            if future.done():
+                self.compaction = None
+                try:
+                    self.swap(future.result(),end)
+                except (OSError,RuntimeError):
+                    #the log is left as it is and compacted again on a later call
+                    print("Operation log compaction failed")
+            return
+        
+        if keep_after is None or self.first_seq is None or self.first_seq > keep_after:
+            return
+        
+        self.file.flush()
+        end = self.file.tell()
+        temp_name = self.filename + ".tmp"
+        if pool is not None:
+            self.compaction = (pool.submit('compact_log',self.filename,temp_name,keep_after,end),end)
+        else:
+            self.swap(copy_records_after(self.filename,temp_name,keep_after,end),end)
+            
+    def swap(self,first_seq,end):
+        '''replaces the log with its compacted copy
+        
+        Parameters
+        first_seq   -- the sequence number of the first record in the copy (None if it is empty)
+        end         -- the offset of the log up to which the copy was made
+        '''
+        
+        temp_name = self.filename + ".tmp"
+        #the records appended while the copy was made are moved over as well
+        self.file.close()
+        log_file = open(self.filename,'rb')
+        log_file.seek(end)
+        tail = log_file.read()
+        log_file.close()
+        output_file = open(temp_name,'ab')
+        output_file.write(tail)
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        output_file.close()
+        os.replace(temp_name,self.filename)
+        
+        if first_seq is None and tail != b'':
+            first_seq = RECORD.unpack_from(tail,0)[2]
+        self.first_seq = first_seq
+        self.file = open(self.filename,'ab')
+        
+    def close(self):
+        '''closes the log'''
+        
+        if self.compaction is not None:
+            future,end = self.compaction
+            self.compaction = None
+            self.swap(future.result(),end)
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+            
+class Checkpoints:
+    '''keeps the newest and the previous snapshot of a session as checkpoints, each with the digests of its files
+    
+    Attributes
+    path        -- a string containing the filepath of the folder of the session files
+    name        -- a string containing the name of the session
+    entries     -- a list of dict objects (seq, name, format, digests), newest first
+    '''
+    
+    def __init__(self,path,name):
+        self.path = path
+        self.name = name
+        self.entries = self.read()
+        
+    def read(self):
+        '''reads the list of checkpoints
+        
+        Return Value
+        entries     -- a list of dict objects, newest first (empty if there is no valid list)
+        '''
+        
+        try:
+            checkpoint_file = open(self.path + "/" + self.name + CHECKPOINT_EXTENSION,'r')
+            entries = json.load(checkpoint_file)
+            checkpoint_file.close()
+        except (IOError,ValueError):
+            entries = []
+        return entries
+    
+    def is_valid(self,entry):
+        '''checks that every file of a checkpoint still has the digest it had when it was written'''
+        
+        for extension,digest in entry['digests'].items():
+            if file_digest(self.path + "/" + entry['name'] + extension) != digest:
+                return False
+        return True
+    
+    def newest_valid(self):
+        '''finds the newest checkpoint whose files are intact
+        
+        Return Value
+        entry       -- a dict object describing the checkpoint (None if there is none)
+        '''
+        
+        for entry in self.entries:
+            if self.is_valid(entry):
+                return entry
+            print("Checkpoint {0} is damaged".format(entry['seq']))
+        return None
+    
+    def oldest_seq(self):
+        '''gets the sequence number of the oldest retained checkpoint (None if there is none)'''
+        
+        if self.entries == []:
+            return None
+        return min(entry['seq'] for entry in self.entries)
+    
+    def rotate(self,extensions):
+        '''keeps the files of the current checkpoint under the previous name before they are replaced
+        
+        Parameters
+        extensions  -- a tuple of the extensions of the snapshot files
+        
+        Return Value
+        previous    -- a dict object describing the previous checkpoint (None if there was no current one)
+        '''
+        
+        if self.entries == [] or self.entries[0]['name'] != self.name:
+            return None
+        
+        current = self.entries[0]
+        previous_name = self.name + PREVIOUS_SUFFIX
+        for extension in extensions:
+            source = self.path + "/" + self.name + extension
+            temp_name = self.path + "/" + previous_name + extension + ".tmp"
+            #a hard link keeps the current file readable the whole time; copy where links are not supported
+            try:
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+                os.link(source,temp_name)
+            except (OSError,AttributeError):
+                input_file = open(source,'rb')
+                output_file = open(temp_name,'wb')
+                output_file.write(input_file.read())
+                output_file.close()
+                input_file.close()
+            os.replace(temp_name,self.path + "/" + previous_name + extension)
+            
+        previous = dict(current)
+        previous['name'] = previous_name
+        return previous
+    
+    def record(self,seq,fmt,extensions,previous,digests=None):
+        '''writes the list of checkpoints after a new snapshot was committed
+        
+        Parameters
+        seq         -- the sequence number of the last operation included in the new snapshot
+        fmt         -- a string containing the snapshot format ('DAE','BINARY')
+        extensions  -- a tuple of the extensions of the snapshot files
+        previous    -- a dict object describing the previous checkpoint (None if there is none)
+        digests     -- (optional) a dict object mapping extensions to digests already computed by the writer
+        '''
+        
+        digests = dict(digests or {})
+        for extension in extensions:
+            if extension not in digests:
+                digests[extension] = file_digest(self.path + "/" + self.name + extension)
+        entries = [{'seq' : seq,'name' : self.name,'format' : fmt,'digests' : digests}]
+        if previous is not None:
+            entries.append(previous)
+            
+        filename = self.path + "/" + self.name + CHECKPOINT_EXTENSION
+        output_file = open(filename + ".tmp",'w')
+        json.dump(entries,output_file)
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        output_file.close()
+        os.replace(filename + ".tmp",filename)
+        self.entries = entries
@@ -0,0 +1,334 @@
+'''per-client outbound queues of the server
+
+This module does not depend on bpy. Every client gets its own bounded queue, sent from by the workers of a thread pool
+one batch at a time, so a client on a slow link only delays itself. While messages wait in a queue, transforms of the
+same objects are merged and previews, heartbeats or lease lists superseded by newer ones are dropped. A client whose
+queue still falls too far behind is told to resync (reload the snapshot) and its queue is cleared, instead of holding
+on to an ever growing backlog. No worker ever waits for a slow link: a queue whose previous batch has not left yet (or
+whose batch the pool refused) is deferred and handed to the pool again by a retry thread.
+'''
+
+import time
+import json
+import threading
+from collections import deque
+
+#object mode transforms that can be merged while queued, the pivot is left where it was by each of them
+TRANSFORMS = ('translate','rotate','resize')
+#messages that are replaced by newer messages of the same kind
+SUPERSEDED = ('PREVIEW','PING','LEASES')
+#the number of seconds after which a deferred queue is handed to the pool again
+RETRY_INTERVAL = 0.05
+
+def op_kind(op):
+    '''gets the method name of an operation (see utils.format_op_name)'''
+    return op['name'].lower().replace(" ","_")
+
+def merge_transforms(first,second):
+    '''merges two queued transforms of the same objects into one operation
+
+    Parameters
+    first       -- a dict object containing the data of the queued operation
+    second      -- a dict object containing the data of the newer operation
+
+    Return Value
+    merged      -- a dict object containing the data of the merged operation (None if they cannot be merged)
+
+    The merged data takes the place of the first one in the queue and the sequence number of the second. The sequence
+    numbers it replaces are listed in 'merged_seqs', so a client that orders operations does not wait for them.
+    '''
+
+    op1 = first['operation']
+    op2 = second['operation']
+    kind = op_kind(op2)
+    if kind not in TRANSFORMS or op_kind(op1) != kind:
+        return None
+    if op1['mode'] != 'OBJECT' or op2['mode'] != 'OBJECT':
+        return None
+    if '' in op2['target_ids'] or sorted(op1['target_ids']) != sorted(op2['target_ids']):
+        return None
+    #both have to use the same orientation and turn or scale about the same pivot, a rotation moves the center of the bounding box of the targets
+    pivot1 = (op1.get('pivot_point','MEDIAN_POINT'),op1.get('cursor'),op1.get('orientation','GLOBAL'))
+    pivot2 = (op2.get('pivot_point','MEDIAN_POINT'),op2.get('cursor'),op2.get('orientation','GLOBAL'))
+    if pivot1[2] != pivot2[2]:
+        return None
+    if kind != 'translate' and (pivot1 != pivot2 or (kind == 'rotate' and pivot1[0] == 'BOUNDING_BOX_CENTER')):
+        return None
+
+    op = dict(op2)
+    if kind == 'translate':
+        op['x'],op['y'],op['z'] = op1['x'] + op2['x'],op1['y'] + op2['y'],op1['z'] + op2['z']
+    elif kind == 'resize':
+        op['x'],op['y'],op['z'] = op1['x'] * op2['x'],op1['y'] * op2['y'],op1['z'] * op2['z']
+    elif kind == 'rotate':
+        #only rotations about the same axis add up
+        if (op1['axis_x'],op1['axis_y'],op1['axis_z']) != (op2['axis_x'],op2['axis_y'],op2['axis_z']):
+            return None
+        op['value'] = op1['value'] + op2['value']
+    #the values are already constrained, a merge of differently constrained transforms is left unconstrained
+    if (op1['caxis_x'],op1['caxis_y'],op1['caxis_z']) != (op2['caxis_x'],op2['caxis_y'],op2['caxis_z']):
+        op['caxis_x'],op['caxis_y'],op['caxis_z'] = False,False,False
+
+    merged = dict(second)
+    merged['operation'] = op
+    if 'seq' in first:
+        merged['merged_seqs'] = first.get('merged_seqs',[]) + [first['seq']]
+    return merged
+
+class Message:
+
+    '''
+    Attributes
+    kind        -- a string containing the kind of message ('OP','ACK','SKIP','PREVIEW','PING','LEASES','REJECT','DISCARD',
+                   'RESYNC')
+    data_bytes  -- the message in bytes format
+    data        -- a dict object containing the message (operations, acknowledgements and previews, None otherwise)
+    reliable_flag -- a boolean value indicating if the message must be delivered (False if a newer one replaces it)
+    queued      -- the time the message was queued
+    '''
+
+    def __init__(self,kind,data_bytes,data=None,reliable_flag=True):
+        self.kind = kind
+        self.data_bytes = data_bytes
+        self.data = data
+        self.reliable_flag = reliable_flag
+        self.queued = time.time()
+
+    def targets(self):
+        '''gets the ids of the objects the message is about'''
+        if self.data is None:
+            return set()
+        if self.kind == 'PREVIEW':
+            return set(self.data['objects'].keys())
+        op = self.data.get('operation')
+        if op is None:
+            return set()
+        return (set(op.get('target_ids') or []) | set([op.get('active_id','')])) - set([''])
+
+class ClientQueue:
+
+    '''
+    Attributes
+    address     -- a tuple containing the ip address and port of the client
+    send        -- a function send(data_bytes, address, reliable_flag) that transmits a message
+    drain       -- a function drain(address) that tells if the transmitted messages left, without waiting for them
+                   (None if sending never blocks)
+    pool        -- a ThreadPool object whose workers send the batches
+    max_length  -- the number of queued messages after which the client is told to resync
+    lag_threshold -- the number of seconds the oldest queued message may wait before the client is told to resync
+    messages    -- a deque of the queued Message objects, oldest first
+    lock        -- a Lock object guarding the messages
+    scheduled   -- a boolean value indicating if a batch of the client is waiting for or running on a worker (one at a time)
+    deferred    -- a boolean value indicating that the batch waits for the previous one to leave or for room in the pool,
+                   the retry thread of the Outbound object schedules it again (see retry)
+    resyncing   -- a boolean value indicating that the client was told to resync and has not asked for the snapshot yet
+    merged      -- the number of operations merged into queued ones
+    dropped     -- the number of superseded messages dropped
+    resyncs     -- the number of times the client was told to resync
+    closed      -- a boolean value indicating if the queue was closed
+    '''
+
+    def __init__(self,address,send,drain,pool,max_length=256,lag_threshold=5.0):
+        self.address = address
+        self.send = send
+        self.drain = drain
+        self.pool = pool
+        self.max_length = max_length
+        self.lag_threshold = lag_threshold
+        self.messages = deque()
+        self.lock = threading.Lock()
+        self.resyncing = False
+        self.merged = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.scheduled = False
+        self.deferred = False
+        self.closed = False
+
+    def put(self,message):
+        '''queues a message, merging it into or superseding the queued ones where possible'''
+
+        with self.lock:
+            if self.closed:
+                return
+            #everything up to the snapshot the client is about to load would be thrown away anyway
+            if self.resyncing and message.kind != 'PING':
+                return
+            if message.kind in SUPERSEDED:
+                self.supersede(message)
+            elif message.kind == 'OP' and self.merge(message):
+                self.merged += 1
+                return
+            self.messages.append(message)
+
+            lagging = len(self.messages) > self.max_length or time.time() - self.messages[0].queued > self.lag_threshold
+            if lagging and not self.resyncing:
+                print("{0} fell behind by {1} messages, resyncing".format(self.address,len(self.messages)))
+                self.messages.clear()
+                self.resyncing = True
+                self.resyncs += 1
+                resync = {'action' : 'RESYNC'}
+                self.messages.append(Message('RESYNC',bytes(json.dumps(resync),'utf-8'),resync))
+            self.schedule()
+            
+    def schedule(self):
+        '''hands the next batch to the pool unless one is already on its way (lock held)'''
+        if not self.scheduled and not self.deferred and not self.closed:
+            self.scheduled = self.pool.submit(self.send_batch)
+            #a refused batch is retried even if no other message comes
+            self.deferred = not self.scheduled
+
+    def retry(self):
+        '''hands a deferred batch to the pool again (called from the retry thread)'''
+        with self.lock:
+            if self.deferred:
+                self.deferred = False
+                self.schedule()
+
+    def supersede(self,message):
+        '''drops the queued messages a newer preview or heartbeat replaces (lock held)'''
+        targets = message.targets()
+        kept = deque()
+        for queued in self.messages:
+            if queued.kind == message.kind and queued.targets() <= targets:
+                self.dropped += 1
+                continue
+            kept.append(queued)
+        self.messages = kept
+
+    def merge(self,message):
+        '''merges an operation into the newest queued operation on the same objects (lock held)
+
+        Return Value
+        merged_flag -- a boolean value indicating if the operation was merged (True) or must be queued (False)
+        '''
+
+        targets = message.targets()
+        if targets == set():
+            return False
+        for index in range(len(self.messages) - 1,-1,-1):
+            queued = self.messages[index]
+            if queued.kind in SUPERSEDED:
+                continue
+            #a skipped operation is not known to this client, it may have touched the objects
+            if queued.kind in ('SKIP','RESYNC'):
+                return False
+            if queued.targets() & targets == set():
+                continue
+            if queued.kind != 'OP':
+                return False
+            merged = merge_transforms(queued.data,message.data)
+            if merged is None:
+                return False
+            replacement = Message('OP',bytes(json.dumps(merged),'utf-8'),merged)
+            replacement.queued = queued.queued
+            self.messages[index] = replacement
+            return True
+        return False
+
+    def resume(self):
+        '''accepts messages again once the client asked for the snapshot after a resync'''
+        with self.lock:
+            self.resyncing = False
+
+    def send_batch(self):
+        '''sends everything queued once the previous batch left (task run by the pool)'''
+        
+        #a batch is only sent once the previous one left, so a slow link shows up as a growing queue. A client that is
+        #still busy is deferred and frees the worker for the others right away
+        drained_flag = self.drain is None or self.drain(self.address)
+        with self.lock:
+            self.scheduled = False
+            if self.closed:
+                return
+            if not drained_flag:
+                self.deferred = True
+                return
+            batch = list(self.messages)
+            self.messages.clear()
+        for message in batch:
+            try:
+                self.send(message.data_bytes,self.address,message.reliable_flag)
+            except OSError:
+                pass
+        with self.lock:
+            if self.messages:
+                self.schedule()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.messages.clear()
+
+class Outbound:
+
+    '''
+    The outbound queues of all the clients
+
+    Attributes
+    queues      -- a dict object mapping client addresses to ClientQueue objects
+    send        -- a function send(data_bytes, address, reliable_flag) that transmits a message
+    drain       -- a function drain(address) that tells if the transmitted messages left, without waiting for them
+    pool        -- a ThreadPool object shared by the queues to send their batches
+    max_length  -- the number of queued messages after which a client is told to resync
+    lag_threshold -- the number of seconds a queued message may wait before its client is told to resync
+    lock        -- a Lock object guarding the queues
+    stopped     -- an Event object that stops the retry thread
+    '''
+
+    def __init__(self,send,drain,pool,max_length=256,lag_threshold=5.0):
+        self.queues = {}
+        self.send = send
+        self.drain = drain
+        self.pool = pool
+        self.max_length = max_length
+        self.lag_threshold = lag_threshold
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        threading.Thread(target=self.retry_thread,args=(),daemon=True).start()
+
+    def retry_thread(self):
+        '''hands the deferred queues to the pool again every RETRY_INTERVAL seconds (thread function)'''
+        while not self.stopped.wait(RETRY_INTERVAL):
+            with self.lock:
+                queues = list(self.queues.values())
+            for queue in queues:
+                queue.retry()
+
+    def add(self,address):
+        '''creates the queue of a client (an existing queue is replaced)'''
+        with self.lock:
+            previous = self.queues.get(address)
+            self.queues[address] = ClientQueue(address,self.send,self.drain,self.pool,self.max_length,self.lag_threshold)
+        if previous is not None:
+            previous.close()
+
+    def remove(self,address):
+        with self.lock:
+            queue = self.queues.pop(address,None)
+        if queue is not None:
+            queue.close()
+
+    def put(self,address,message):
+        '''queues a message for a client, clients without a queue are sent the message right away'''
+        queue = self.queues.get(address)
+        if queue is not None:
+            queue.put(message)
+            return
+        try:
+            self.send(message.data_bytes,address,message.reliable_flag)
+        except OSError:
+            pass
+
+    def resume(self,address):
+        queue = self.queues.get(address)
+        if queue is not None:
+            queue.resume()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            queues = list(self.queues.values())
+            self.queues = {}
+        for queue in queues:
+            queue.close()
@@ -0,0 +1,247 @@
+import bpy
+import json
+import math
+import socket
+import threading
+import time
+from mathutils import Matrix,Vector,Quaternion
+from . import identity
+
+#the largest number of objects sampled at a time, the samples of one tick have to fit in a single packet
+MAX_OBJECTS = 32
+
+def pack_transform(matrix):
+    '''decomposes a world matrix into a flat list of location, rotation (quaternion) and scale values
+
+    Parameters
+    matrix      -- a 4x4 Matrix object
+
+    Return Value
+    values      -- a list of 10 floats (location xyz, rotation wxyz, scale xyz) rounded to 4 decimals
+    '''
+    loc,rot,scale = matrix.decompose()
+    return [round(value,4) for value in (loc[:] + rot[:] + scale[:])]
+
+def unpack_transform(values):
+    '''splits a packed transform into its location, rotation and scale
+
+    Parameters
+    values      -- a list of 10 floats as returned by pack_transform
+
+    Return Value
+    loc,rot,scale -- a Vector, a Quaternion and a Vector object
+    '''
+    return Vector(values[0:3]),Quaternion(values[3:7]),Vector(values[7:10])
+
+def compose(loc,rot,scale):
+    '''builds a world matrix from a location, rotation and scale
+
+    Parameters
+    loc         -- a Vector object containing the location
+    rot         -- a Quaternion object containing the rotation
+    scale       -- a Vector object containing the scale
+
+    Return Value
+    matrix      -- a 4x4 Matrix object
+    '''
+    scale_matrix = Matrix.Identity(4)
+    scale_matrix[0][0],scale_matrix[1][1],scale_matrix[2][2] = scale
+    return Matrix.Translation(loc) * rot.to_matrix().to_4x4() * scale_matrix
+
+class PreviewSampler:
+
+    '''samples the transforms of the selected objects while they are being changed and sends the ones that moved
+
+    It runs as a scene update handler, so it also fires during modal drags.
+
+    Attributes
+    server_address -- a tuple containing the ip address and port of the server
+    address        -- a tuple containing the ip address and port of the client
+    ids            -- an IdMap object used to address the objects
+    receiver       -- a PreviewReceiver object, the objects it drives are not sampled
+    interval       -- the minimum number of seconds between two samples
+    last           -- a dict object mapping object ids to their last sent transforms
+    last_time      -- the time of the last sample
+    count          -- an int value that numbers the sent samples so that receivers can drop reordered ones
+    sock           -- a UDP socket object used to send the samples
+    '''
+
+    def __init__(self,server_address,address,ids,receiver,rate=20.0):
+        self.server_address = server_address
+        self.address = address
+        self.ids = ids
+        self.receiver = receiver
+        self.interval = 1.0/rate
+        self.last = {}
+        self.last_time = 0.0
+        self.count = 0
+        self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+
+    def current(self):
+        '''gets the packed transforms of the selected objects that can be addressed by the server
+
+        Return Value
+        transforms  -- a dict object mapping object ids to packed transforms (empty outside of object mode)
+        '''
+        transforms = {}
+        if bpy.context.mode not in ('OBJECT'):
+            return transforms
+        for obj in bpy.context.selected_objects[:MAX_OBJECTS]:
+            obj_id = identity.get_id(obj)
+            if obj_id != '' and not self.receiver.driving(obj_id):
+                transforms[obj_id] = pack_transform(obj.matrix_world)
+        return transforms
+
+    def sample(self,scene):
+        '''the scene update handler, sends the transforms that changed since the last sample
+
+        Parameters
+        scene       -- the updated blender scene (passed by the handler, not used)
+        '''
+        now = time.time()
+        if now - self.last_time < self.interval:
+            return
+        self.last_time = now
+
+        changed = {}
+        for obj_id,values in self.current().items():
+            if self.last.get(obj_id) != values:
+                changed[obj_id] = values
+                self.last[obj_id] = values
+        if changed == {}:
+            return
+
+        self.count += 1
+        data = {
+            'action' : 'PREVIEW',
+            'ip_addr' : self.address[0],
+            'port' : self.address[1],
+            'count' : self.count,
+            'objects' : changed
+        }
+        try:
+            self.sock.sendto(bytes(json.dumps(data),'utf-8'),self.server_address)
+        except OSError:
+            pass
+
+    def reset(self):
+        '''takes the current transforms as sent, so that changes made by remote operations are not sampled'''
+        self.last.update(self.current())
+
+    def close(self):
+        '''closes the socket the samples are sent from'''
+        self.sock.close()
+
+class PreviewReceiver:
+
+    '''moves objects toward the transforms previewed by other clients
+
+    The transform an object had before the preview is kept and put back before the committed operation is applied, or
+    after the previews stop arriving.
+
+    Attributes
+    ids            -- an IdMap object used to find the previewed objects
+    timeout        -- the number of seconds without samples after which an object is put back
+    smoothing      -- the time constant (in seconds) of the interpolation toward the latest sample
+    targets        -- a dict object mapping object ids to (count, packed transform, time received, sender) of their latest sample
+    bases          -- a dict object mapping object ids to their world matrices before the preview
+    last_tick      -- the time of the last interpolation step
+    lock           -- a Lock object guarding the targets, samples are received by the listener thread
+    '''
+
+    def __init__(self,ids,timeout=5.0,smoothing=0.05):
+        self.ids = ids
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self.targets = {}
+        self.bases = {}
+        self.last_tick = time.time()
+        self.lock = threading.Lock()
+
+    def receive(self,data):
+        '''keeps the newest sample of every object in a received preview (called from the listener thread)
+
+        Parameters
+        data        -- a dict object containing the preview, with the samples keyed by object id in 'objects'
+        '''
+        now = time.time()
+        sender = (data['ip_addr'],data['port'])
+        with self.lock:
+            for obj_id,values in data['objects'].items():
+                target = self.targets.get(obj_id)
+                #samples of the same sender arrive out of order at times, only newer ones are kept
+                if target is None or target[3] != sender or target[0] < data['count']:
+                    self.targets[obj_id] = (data['count'],values,now,sender)
+
+    def driving(self,obj_id):
+        '''checks if an object is currently moved by a preview
+
+        Parameters
+        obj_id      -- a string containing the id of the object
+
+        Return Value
+        driving_flag -- a boolean value indicating if a preview moves the object (True) or not (False)
+        '''
+        return obj_id in self.bases
+
+    def tick(self):
+        '''moves the previewed objects one step toward their latest samples'''
+        now = time.time()
+        #the interpolation is frame rate independent
+        alpha = 1.0 - math.exp(-(now - self.last_tick)/self.smoothing)
+        self.last_tick = now
+
+        with self.lock:
+            targets = list(self.targets.items())
+        for obj_id,(count,values,received,sender) in targets:
+            if now - received > self.timeout:
+                self.restore([obj_id])
+                continue
+            name = self.ids.name_of(obj_id)
+            if name is None or name not in bpy.data.objects:
+                self.forget(obj_id)
+                continue
+            obj = bpy.data.objects[name]
+            if obj_id not in self.bases:
+                self.bases[obj_id] = obj.matrix_world.copy()
+
+            loc,rot,scale = obj.matrix_world.decompose()
+            target_loc,target_rot,target_scale = unpack_transform(values)
+            obj.matrix_world = compose(loc.lerp(target_loc,alpha),rot.slerp(target_rot,alpha),scale.lerp(target_scale,alpha))
+
+    def restore(self,obj_ids):
+        '''puts previewed objects back to where they were before the preview
+
+        Parameters
+        obj_ids     -- a list of object ids, ids that are not previewed are ignored
+        '''
+
+        for obj_id in obj_ids:
+            base = self.bases.get(obj_id)
+            if base is not None:
+                name = self.ids.name_of(obj_id)
+                if name is not None and name in bpy.data.objects:
+                    bpy.data.objects[name].matrix_world = base
+            self.forget(obj_id)
+
+    def restore_ops(self,ops):
+        '''puts back the previewed objects addressed by committed operations before they are applied
+
+        Parameters
+        ops         -- a list of dict objects representing the operations about to be applied
+        '''
+        obj_ids = []
+        for op in ops:
+            obj_ids.extend(op.get('target_ids') or [])
+            obj_ids.append(op.get('active_id',''))
+        self.restore([obj_id for obj_id in obj_ids if obj_id != ''])
+
+    def forget(self,obj_id):
+        '''stops previewing an object without moving it
+
+        Parameters
+        obj_id      -- a string containing the id of the object
+        '''
+        self.bases.pop(obj_id,None)
+        with self.lock:
+            self.targets.pop(obj_id,None)
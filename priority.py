@@ -0,0 +1,267 @@
+'''priority scheduling of the operations received by the server
+
+This module does not depend on bpy. Every operation falls into a class by its type, and the classes are served in
+order, so structural changes (adds, deletes) that later operations depend on are not held up behind a
+burst of transforms. An operation only overtakes older ones that address other objects, and operations of the
+structural class, or that address no known object at all, keep their order with respect to everything else. An
+operation waiting longer than the starvation limit is served next whatever its class.
+
+Operations are taken in waves: every operation of a wave addresses objects no other operation of the wave addresses,
+so the server applies a wave as one batch. Barriers are waves of their own.
+'''
+
+import time
+import json
+import threading
+from collections import deque
+
+#the classes in the order they are served
+CLASSES = ('STRUCTURAL','EDIT','TRANSFORM')
+#the operation types of the structural class besides the adds
+STRUCTURAL = ('delete',)
+#the operation types of the transform class when they are made in object mode
+TRANSFORMS = ('translate','rotate','resize')
+#a key shared by the structural operations, so they keep their order among themselves
+STRUCTURE_KEY = '#structure'
+def op_kind(op):
+    '''gets the method name of an operation (see utils.format_op_name)'''
+    return op['name'].lower().replace(" ","_")
+
+def classify(op,overrides=None):
+    '''gets the class of an operation
+
+    Parameters
+    op          -- a dict object representing an operation
+    overrides   -- (optional) a dict object mapping operation types (e.g. 'translate', 'add_cube') to class names
+
+    Return Value
+    op_class    -- a string containing one of the CLASSES
+    '''
+
+    kind = op_kind(op)
+    if overrides and overrides.get(kind) in CLASSES:
+        return overrides[kind]
+    if kind.startswith('add') or kind in STRUCTURAL:
+        return 'STRUCTURAL'
+    if kind in TRANSFORMS and op.get('mode') == 'OBJECT':
+        return 'TRANSFORM'
+    return 'EDIT'
+
+def keys_of(op):
+    '''gets the ids of the objects an operation addresses, names stand in for objects without an id'''
+    keys = set(op.get('target_ids') or [])
+    keys.add(op.get('active_id',''))
+    keys.discard('')
+    if keys == set():
+        keys = set('name:' + name for name in (op.get('targets') or []) + [op.get('active_object','')] if name != '')
+    return keys
+
+class Entry:
+
+    '''
+    Attributes
+    data        -- a dict object containing the received operation
+    op_class    -- a string containing the class of the operation
+    keys        -- a set object containing the keys of the objects the operation addresses
+    barrier     -- a boolean value indicating if nothing may overtake the operation (it addresses no known object)
+    solo        -- a boolean value indicating if the operation must be a wave of its own (barriers)
+    arrival     -- an int value giving the order in which the operations were received
+    queued      -- the time the operation was received
+    promoted    -- a boolean value indicating if the operation was served early by the starvation protection
+    '''
+
+    def __init__(self,data,op_class,keys,arrival):
+        self.data = data
+        self.op_class = op_class
+        self.keys = keys
+        self.barrier = keys == set()
+        self.solo = self.barrier
+        self.promoted = False
+        self.arrival = arrival
+        self.queued = time.time()
+
+class ClassMetrics:
+
+    '''
+    Attributes
+    queued      -- the number of operations of the class waiting
+    served      -- the number of operations of the class taken so far
+    promoted    -- the number of operations of the class served early by the starvation protection
+    mean_wait   -- the smoothed time the operations of the class waited, in seconds
+    max_wait    -- the longest time an operation of the class waited, in seconds
+    '''
+
+    def __init__(self):
+        self.queued = 0
+        self.served = 0
+        self.promoted = 0
+        self.mean_wait = 0.0
+        self.max_wait = 0.0
+
+class OperationScheduler:
+
+    '''
+    A thread-safe replacement for the FIFO of received operations, taken from by the main thread in priority order
+
+    Attributes
+    overrides   -- a dict object mapping operation types to class names, replacing the default classes
+    max_wait    -- the number of seconds after which a waiting operation is served next whatever its class
+    pending     -- a dict object mapping class names to deques of their waiting Entry objects, oldest first
+    holders     -- a dict object mapping keys to deques of the arrivals of the waiting operations that address them
+    barriers    -- a deque of the arrivals of the waiting barrier operations
+    arrivals    -- the arrival number given to the next operation
+    metrics     -- a dict object mapping class names to ClassMetrics objects
+    lock        -- a Lock object guarding the state, operations are put by the receiving threads
+    '''
+
+    def __init__(self,overrides=None,max_wait=1.0):
+        self.overrides = overrides or {}
+        self.max_wait = max_wait
+        self.pending = dict((op_class,deque()) for op_class in CLASSES)
+        self.holders = {}
+        self.barriers = deque()
+        self.arrivals = 0
+        self.metrics = dict((op_class,ClassMetrics()) for op_class in CLASSES)
+        self.lock = threading.Lock()
+
+    def put(self,data):
+        '''queues received data carrying an 'operation' '''
+        op = data['operation']
+        op_class = classify(op,self.overrides)
+        keys = keys_of(op)
+        if op_class == 'STRUCTURAL' and keys != set():
+            keys.add(STRUCTURE_KEY)
+        with self.lock:
+            entry = Entry(data,op_class,keys,self.arrivals)
+            self.arrivals += 1
+            self.pending[op_class].append(entry)
+            for key in keys:
+                self.holders.setdefault(key,deque()).append(entry.arrival)
+            if entry.barrier:
+                self.barriers.append(entry.arrival)
+            self.metrics[op_class].queued += 1
+
+    def empty(self):
+        with self.lock:
+            return all(entries == deque() for entries in self.pending.values())
+
+    def eligible(self,entry):
+        '''checks that no older waiting operation addresses the same objects and no older barrier waits (lock held)'''
+        if self.barriers and self.barriers[0] < entry.arrival:
+            return False
+        for key in entry.keys:
+            if self.holders[key][0] != entry.arrival:
+                return False
+        return True
+
+    def get(self):
+        '''takes the next operation to process
+
+        Return Value
+        data        -- a dict object containing the received operation (None if nothing waits)
+        '''
+
+        wave = self.get_wave(1)
+        if wave == []:
+            return None
+        return wave[0]
+
+    def get_wave(self,limit):
+        '''takes the next operations to process that address disjoint objects
+
+        Parameters
+        limit       -- the largest number of operations to take
+
+        Return Value
+        wave        -- a list of dict objects containing the received operations, in the order they are served (empty
+                       if nothing waits)
+        '''
+
+        now = time.time()
+        wave = []
+        used = set()
+        with self.lock:
+            while len(wave) < limit:
+                chosen = self.choose(now,used,wave == [])
+                if chosen is None:
+                    break
+                self.take(chosen,now)
+                wave.append(chosen.data)
+                used |= chosen.keys
+                if chosen.solo:
+                    break
+        return wave
+
+    def choose(self,now,used,first_flag):
+        '''finds the next operation of a wave (lock held)
+
+        Parameters
+        now         -- the current time
+        used        -- a set object containing the keys addressed by the operations already in the wave
+        first_flag  -- a boolean value indicating if the wave is still empty
+
+        Return Value
+        chosen      -- the Entry object to take next (None if the wave is complete)
+        '''
+
+        #the oldest operation is always eligible, it is served first once it waited too long
+        oldest = None
+        for entries in self.pending.values():
+            if entries and (oldest is None or entries[0].arrival < oldest.arrival):
+                oldest = entries[0]
+        if oldest is None:
+            return None
+        if now - oldest.queued > self.max_wait:
+            oldest.promoted = True
+            #a starving operation that does not fit the wave starts the next one
+            if first_flag or (not oldest.solo and oldest.keys & used == set()):
+                return oldest
+            return None
+
+        for op_class in CLASSES:
+            for entry in self.pending[op_class]:
+                if entry.keys & used != set() or (entry.solo and not first_flag):
+                    continue
+                if self.eligible(entry):
+                    return entry
+        #an ineligible operation is blocked by an older one, so the scan always finds the oldest at least
+        if first_flag:
+            return oldest
+        return None
+
+    def take(self,chosen,now):
+        '''removes a chosen operation from the waiting ones and updates the metrics of its class (lock held)'''
+
+        self.pending[chosen.op_class].remove(chosen)
+        for key in chosen.keys:
+            holders = self.holders[key]
+            holders.remove(chosen.arrival)
+            if holders == deque():
+                del self.holders[key]
+        if chosen.barrier:
+            self.barriers.remove(chosen.arrival)
+
+        metrics = self.metrics[chosen.op_class]
+        wait = now - chosen.queued
+        metrics.queued -= 1
+        metrics.served += 1
+        if chosen.promoted and chosen.op_class != CLASSES[0]:
+            metrics.promoted += 1
+        metrics.mean_wait = wait if metrics.served == 1 else 0.9 * metrics.mean_wait + 0.1 * wait
+        metrics.max_wait = max(metrics.max_wait,wait)
+
+    def to_json(self):
+        '''lists the metrics of every class with the waits in milliseconds, as shown in the panel'''
+        with self.lock:
+            listing = []
+            for op_class in CLASSES:
+                metrics = self.metrics[op_class]
+                listing.append({
+                    'class' : op_class,
+                    'queued' : metrics.queued,
+                    'served' : metrics.served,
+                    'promoted' : metrics.promoted,
+                    'mean_wait' : round(metrics.mean_wait * 1000.0,1),
+                    'max_wait' : round(metrics.max_wait * 1000.0,1)
+                })
+        return json.dumps(listing)
@@ -0,0 +1,194 @@
+import heapq
+
+def split_name(name):
+    '''splits an object name into its base name and numeric suffix
+    
+    Parameters
+    name        -- a string containing the name of an object (e.g. "Cube.002")
+    
+    Return Value
+    base        -- a string containing the name without the numeric suffix (e.g. "Cube")
+    suffix      -- an int value of the numeric suffix (e.g. 2), 0 if the name has no suffix
+    '''
+    
+    base,separator,number = name.rpartition(".")
+    if separator != "" and base != "" and number.isdigit():
+        return base,int(number)
+    return name,0
+
+def join_name(base,suffix):
+    '''builds an object name from a base name and a numeric suffix, following blender's naming (e.g. "Cube.001")
+    
+    Parameters
+    base        -- a string containing the base name of the object
+    suffix      -- an int value of the numeric suffix (0 means no suffix)
+    
+    Return Value
+    name        -- a string containing the joined name
+    '''
+    
+    if suffix == 0:
+        return base
+    return base + "." + str(suffix).zfill(3)
+
+class SuffixSet:
+    '''keeps the used numeric suffixes of one base name and finds the lowest free one
+    
+    Attributes
+    used        -- a set containing the used suffixes
+    top         -- an int value above every suffix that was ever used, the suffixes from it on are free
+    gaps        -- a heap of the free suffixes below top, entries that were used again since are skipped lazily
+    '''
+    
+    def __init__(self):
+        self.used = set()
+        self.top = 0
+        self.gaps = []
+        
+    def __len__(self):
+        return len(self.used)
+        
+    def add(self,suffix):
+        '''marks a suffix as used in O(log n) (a suffix far above the others also adds the gaps it skips)'''
+        
+        self.used.add(suffix)
+        for gap in range(self.top,suffix):
+            heapq.heappush(self.gaps,gap)
+        self.top = max(self.top,suffix + 1)
+        
+    def remove(self,suffix):
+        '''marks a suffix as free in O(log n)'''
+        
+        self.used.discard(suffix)
+        heapq.heappush(self.gaps,suffix)
+        
+    def lowest_free(self):
+        '''gets the lowest free suffix, in O(log n) amortized'''
+        
+        while self.gaps and self.gaps[0] in self.used:
+            heapq.heappop(self.gaps)
+        if self.gaps:
+            return self.gaps[0]
+        return self.top
+
+class NameRegistry:
+    '''keeps an index of object names by base name and numeric suffix
+    
+    Attributes
+    names       -- a set containing every registered name
+    suffixes    -- a dict object that maps each base name to the SuffixSet of its used numeric suffixes
+    '''
+    
+    def __init__(self,names=()):
+        self.names = set()
+        self.suffixes = {}
+        for name in names:
+            self.add(name)
+            
+    def __contains__(self,name):
+        return name in self.names
+    
+    def __len__(self):
+        return len(self.names)
+        
+    def rebuild(self,names):
+        '''discards the index and rebuilds it from a collection of names (e.g. after a snapshot is loaded)
+        
+        Parameters
+        names       -- an iterable of object names
+        '''
+        
+        self.names = set()
+        self.suffixes = {}
+        for name in names:
+            self.add(name)
+            
+    def add(self,name):
+        '''registers a name
+        
+        Parameters
+        name        -- a string containing the name to register
+        '''
+        
+        if name in self.names:
+            return
+        self.names.add(name)
+        base,suffix = split_name(name)
+        #only names in blender's canonical form (e.g. not "Cube.1") take up a suffix
+        if join_name(base,suffix) == name:
+            self.suffixes.setdefault(base,SuffixSet()).add(suffix)
+            
+    def remove(self,name):
+        '''unregisters a name, if it was registered
+        
+        Parameters
+        name        -- a string containing the name to unregister
+        '''
+        
+        if name not in self.names:
+            return
+        self.names.discard(name)
+        base,suffix = split_name(name)
+        if join_name(base,suffix) == name:
+            used = self.suffixes[base]
+            used.remove(suffix)
+            if len(used) == 0:
+                del self.suffixes[base]
+                
+    def rename(self,old_name,new_name):
+        '''moves a registration from one name to another
+        
+        Parameters
+        old_name    -- a string containing the previous name
+        new_name    -- a string containing the new name
+        '''
+        
+        self.remove(old_name)
+        self.add(new_name)
+        
+    def sync(self,names,existing):
+        '''registers or unregisters names depending on whether they still exist
+        
+        Parameters
+        names       -- an iterable of names that may have been added or removed
+        existing    -- a container (e.g. bpy.data.objects) that holds the names that exist
+        '''
+        
+        for name in names:
+            if name in existing:
+                self.add(name)
+            else:
+                self.remove(name)
+                
+    def next_free(self,base):
+        '''finds the lowest unused numeric suffix of a base name in O(log n)
+        
+        Parameters
+        base        -- a string containing the base name (e.g. "Cube")
+        
+        Return Value
+        suffix      -- an int value of the lowest free suffix (0 means the bare base name is free)
+        '''
+        
+        used = self.suffixes.get(base)
+        if used is None:
+            return 0
+        return used.lowest_free()
+    
+    def allocate(self,name):
+        '''returns a free name for an object, registering it
+        
+        Parameters
+        name        -- a string containing the requested name
+        
+        Return Value
+        free_name   -- the requested name if it is free, otherwise the base name with the lowest free suffix
+        '''
+        
+        if name in self.names:
+            base = split_name(name)[0]
+            free_name = join_name(base,self.next_free(base))
+        else:
+            free_name = name
+        self.add(free_name)
+        return free_name
@@ -0,0 +1,268 @@
+'''a reliability layer over UDP datagrams
+
+This module does not depend on bpy. Reliable datagrams carry a small binary header in front of the json data, so plain
+json datagrams (heartbeats, previews) can still be sent on the same socket without it.
+
+Datagram (little-endian)
+header     -- magic (4 bytes), kind (uint8), sequence number (uint32)
+DATA       -- the header followed by the payload
+ACK        -- the header carrying the cumulative ack (every sequence number up to it was received), followed by the
+              number of selective acks (uint8) and the sequence numbers received past a gap (uint32 each)
+'''
+
+import time
+import struct
+import threading
+from collections import OrderedDict,deque
+
+MAGIC = b'RUDP'
+HEADER = struct.Struct('<4sBI')
+SACK_COUNT = struct.Struct('<B')
+SACK = struct.Struct('<I')
+DATA = 0
+ACK = 1
+#the largest number of selective acks in one ack
+MAX_SACKS = 32
+#datagrams further ahead of the next expected one are dropped, so senders keep at most this many in flight
+REORDER_WINDOW = 1024
+
+def is_reliable(datagram):
+    '''checks if a datagram belongs to the reliability layer'''
+    return datagram[:len(MAGIC)] == MAGIC
+
+class Peer:
+
+    '''
+    The state of the exchange with one address
+
+    Attributes
+    next_seq    -- the sequence number given to the next sent datagram
+    unacked     -- an OrderedDict mapping sequence numbers to [datagram, first sent, last sent, retransmissions], oldest first
+    waiting     -- a deque of (seq, datagram) tuples that wait for room in the window
+    srtt        -- the smoothed round trip time (None until the first sample)
+    rttvar      -- the round trip time variation
+    rto         -- the retransmission timeout in seconds
+    backed_off  -- the time the timeout was last doubled
+    expected    -- the sequence number of the next datagram to deliver
+    reorder     -- a dict object mapping sequence numbers to payloads received ahead of a gap
+    '''
+
+    def __init__(self,initial_rto):
+        self.next_seq = 1
+        self.unacked = OrderedDict()
+        self.waiting = deque()
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = initial_rto
+        self.backed_off = 0.0
+        self.expected = 1
+        self.reorder = {}
+
+class Endpoint:
+
+    '''
+    Sends and receives reliable datagrams on a UDP socket. Received datagrams are delivered in order and acknowledged
+    right away, missing ones are retransmitted by the sender after a timeout that adapts to the round trip time, or as
+    soon as an ack shows that later datagrams arrived. Datagrams are never given up, a peer that stops answering is
+    removed by its owner (e.g. when it is evicted).
+
+    Attributes
+    sock        -- the UDP socket object used for sending (receiving is done by the owner of the socket)
+    peers       -- a dict object mapping addresses to Peer objects
+    min_rto     -- the lower bound of the retransmission timeout in seconds
+    max_rto     -- the upper bound of the retransmission timeout in seconds
+    condition   -- a threading.Condition object guarding the peers, the retransmit thread waits on it
+    running     -- a boolean value indicating if the retransmit thread should keep running
+    '''
+
+    def __init__(self,sock,min_rto=0.05,max_rto=2.0):
+        self.sock = sock
+        self.peers = {}
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.condition = threading.Condition()
+        self.running = False
+
+    def add_peer(self,address):
+        '''starts (or restarts) the exchange with an address'''
+        with self.condition:
+            self.peers[address] = Peer(min(max(0.3,self.min_rto),self.max_rto))
+
+    def remove_peer(self,address):
+        with self.condition:
+            self.peers.pop(address,None)
+
+    def has_peer(self,address):
+        return address in self.peers
+
+    def start(self):
+        '''starts the retransmit thread'''
+        self.running = True
+        t = threading.Thread(target=self.retransmit_thread,args=(),daemon=True)
+        t.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def transmit(self,datagram,address):
+        try:
+            self.sock.sendto(datagram,address)
+        except OSError:
+            pass
+
+    def send(self,payload,address):
+        '''sends a payload reliably
+
+        Parameters
+        payload     -- a bytes object
+        address     -- a tuple containing the ip address and port of a peer added with add_peer
+        '''
+
+        now = time.time()
+        with self.condition:
+            peer = self.peers.get(address)
+            if peer is None:
+                return
+            seq = peer.next_seq
+            peer.next_seq += 1
+            datagram = HEADER.pack(MAGIC,DATA,seq) + payload
+            peer.waiting.append((seq,datagram))
+            released = self.release(peer,now)
+            self.condition.notify_all()
+        for datagram in released:
+            self.transmit(datagram,address)
+            
+    def wait_room(self,address,timeout=5.0):
+        '''waits until every datagram sent to a peer fits in the window, so a slow peer makes its sender wait
+        
+        Return Value
+        room_flag   -- a boolean value indicating if there is room (True) or the wait timed out (False)
+        '''
+        
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.running or address not in self.peers or
+                                           self.peers[address].waiting == deque(),timeout)
+            
+    def release(self,peer,now):
+        '''moves waiting datagrams into flight while they fit in the receiver's window (lock held)
+        
+        Return Value
+        released    -- a list of the datagrams to transmit
+        '''
+        
+        released = []
+        while peer.waiting != deque():
+            seq,datagram = peer.waiting[0]
+            if peer.unacked and seq >= next(iter(peer.unacked)) + REORDER_WINDOW:
+                break
+            peer.waiting.popleft()
+            peer.unacked[seq] = [datagram,now,now,0]
+            released.append(datagram)
+        return released
+
+    def receive(self,datagram,address):
+        '''handles a reliable datagram
+
+        Parameters
+        datagram    -- a bytes object for which is_reliable is True
+        address     -- a tuple containing the address the datagram came from
+
+        Return Value
+        payloads    -- a list of the payloads that can now be delivered, in order (empty for acks and duplicates)
+        '''
+
+        if len(datagram) < HEADER.size:
+            return []
+        magic,kind,seq = HEADER.unpack_from(datagram,0)
+        with self.condition:
+            peer = self.peers.get(address)
+            if peer is None:
+                return []
+            if kind == ACK:
+                self.acknowledge(peer,address,seq,datagram)
+                #wakes up the senders waiting for room in the window
+                self.condition.notify_all()
+                return []
+
+            payloads = []
+            if seq >= peer.expected and seq < peer.expected + REORDER_WINDOW:
+                peer.reorder[seq] = datagram[HEADER.size:]
+                while peer.expected in peer.reorder:
+                    payloads.append(peer.reorder.pop(peer.expected))
+                    peer.expected += 1
+            #duplicates are acknowledged again, the previous ack may have been lost
+            sacks = sorted(peer.reorder.keys())[:MAX_SACKS]
+            ack = HEADER.pack(MAGIC,ACK,peer.expected - 1) + SACK_COUNT.pack(len(sacks))
+            ack += b''.join(SACK.pack(sack) for sack in sacks)
+        self.transmit(ack,address)
+        return payloads
+
+    def acknowledge(self,peer,address,cumulative,datagram):
+        '''removes the acknowledged datagrams of a peer and retransmits the ones an ack shows missing (lock held)'''
+        now = time.time()
+        offset = HEADER.size
+        count = 0
+        if len(datagram) >= offset + SACK_COUNT.size:
+            count = SACK_COUNT.unpack_from(datagram,offset)[0]
+            offset += SACK_COUNT.size
+        sacks = set()
+        for i in range(count):
+            if offset + SACK.size > len(datagram):
+                break
+            sacks.add(SACK.unpack_from(datagram,offset)[0])
+            offset += SACK.size
+
+        for seq in [seq for seq in peer.unacked if seq <= cumulative or seq in sacks]:
+            entry = peer.unacked.pop(seq)
+            #retransmitted datagrams do not give rtt samples, it is unknown which copy was acknowledged
+            if entry[3] == 0:
+                self.sample(peer,now - entry[1])
+
+        #datagrams older than a selectively acknowledged one were most likely lost, they are sent again right away
+        #(at most once per round trip)
+        if sacks != set():
+            newest = max(sacks)
+            round_trip = peer.srtt if peer.srtt is not None else peer.rto
+            for seq,entry in peer.unacked.items():
+                if seq < newest and now - entry[2] >= round_trip:
+                    entry[2] = now
+                    entry[3] += 1
+                    self.transmit(entry[0],address)
+                    
+        for datagram in self.release(peer,now):
+            self.transmit(datagram,address)
+
+    def sample(self,peer,rtt):
+        '''updates the round trip estimate and the timeout of a peer (RFC 6298)'''
+        if peer.srtt is None:
+            peer.srtt = rtt
+            peer.rttvar = rtt / 2.0
+        else:
+            peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - rtt)
+            peer.srtt = 0.875 * peer.srtt + 0.125 * rtt
+        peer.rto = min(max(peer.srtt + 4.0 * peer.rttvar,self.min_rto),self.max_rto)
+
+    def retransmit_thread(self):
+        '''sends the datagrams whose timeout expired again, backing off the timeout (thread function)'''
+        with self.condition:
+            while self.running:
+                now = time.time()
+                wait = self.max_rto
+                for address,peer in list(self.peers.items()):
+                    expired = False
+                    for seq,entry in list(peer.unacked.items()):
+                        deadline = entry[2] + peer.rto
+                        if deadline > now:
+                            wait = min(wait,deadline - now)
+                            continue
+                        entry[2] = now
+                        entry[3] += 1
+                        expired = True
+                        self.transmit(entry[0],address)
+                    #the timeout is doubled once per expiry, not once per datagram sent in the same burst
+                    if expired and now - peer.backed_off >= peer.rto:
+                        peer.backed_off = now
+                        peer.rto = min(peer.rto * 2.0,self.max_rto)
+                self.condition.wait(max(wait,0.005))
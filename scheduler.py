@@ -0,0 +1,242 @@
+import bpy
+import os
+import time
+import threading
+from . import utils
+from . import snapshot
+
+class SnapshotScheduler:
+    '''coalesces changes to the session into occasional snapshot writes
+    
+    Attributes
+    path             -- a string containing the filepath of the folder where the snapshot is saved
+    name             -- a string containing the filename of the snapshot
+    quiet_period     -- the number of seconds without changes after which a dirty session is written
+    max_interval     -- the maximum number of seconds a dirty session waits to be written, even if changes keep coming
+    generation       -- an int value incremented every time the session is marked dirty
+    saved_generation -- the generation included in the last completed write
+    first_dirty      -- the time of the first change since the last write (None if clean)
+    last_dirty       -- the time of the latest change
+    flush_requested  -- a boolean value indicating that a write is needed as soon as possible (e.g. for a joining client)
+    condition        -- a threading.Condition object guarding the generations, used to wait for a write
+    writer           -- a Thread object writing a binary snapshot in the background (None when idle)
+    seq              -- the sequence number of the last operation marked dirty (included in the next checkpoint)
+    saved_seq        -- the sequence number of the last operation included in the snapshot on disk
+    checkpoints      -- a Checkpoints object that records each written snapshot as a checkpoint (None to disable)
+    pool             -- a WorkerPool object that hashes and writes binary snapshots in a worker process (None to do it here)
+    '''
+    
+    def __init__(self,path,name,quiet_period=2.0,max_interval=10.0,checkpoints=None,pool=None,seq=0):
+        self.path = path
+        self.name = name
+        self.quiet_period = quiet_period
+        self.max_interval = max_interval
+        self.generation = 0
+        self.saved_generation = 0
+        self.first_dirty = None
+        self.last_dirty = None
+        self.flush_requested = False
+        self.condition = threading.Condition()
+        self.writer = None
+        self.seq = seq
+        self.saved_seq = seq
+        self.checkpoints = checkpoints
+        self.pool = pool
+        
+    def mark_dirty(self,seq=None):
+        '''records that the session changed and needs to be written
+        
+        Parameters
+        seq         -- the sequence number of the operation that changed the session (None if unknown)
+        '''
+        
+        with self.condition:
+            now = time.time()
+            if seq is not None and seq > self.seq:
+                self.seq = seq
+            self.generation += 1
+            if self.first_dirty is None:
+                self.first_dirty = now
+            self.last_dirty = now
+            
+    def is_dirty(self):
+        '''checks if there are changes that have not been written yet'''
+        
+        with self.condition:
+            return self.saved_generation < self.generation
+        
+    def wait_clean(self,timeout=5.0):
+        '''asks for a write as soon as possible and waits until every change made so far is written
+        
+        Parameters
+        timeout     -- the maximum number of seconds to wait
+        
+        Return Value
+        clean_flag  -- a boolean value indicating if the snapshot is up to date (True) or the wait timed out (False)
+        
+        This is called from other threads (e.g. while sending the snapshot to a client), never from the main thread.
+        '''
+        
+        with self.condition:
+            target = self.generation
+            if self.saved_generation >= target:
+                return True
+            self.flush_requested = True
+            end = time.time() + timeout
+            while self.saved_generation < target:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+        
+    def open_snapshot(self,filename):
+        '''opens a file of the written snapshot along with the sequence number of the last operation it includes
+        
+        Parameters
+        filename    -- a string containing the path of the file
+        
+        Return Value
+        snapshot_file -- a file object open for reading in binary mode
+        seq         -- the sequence number of the last operation included in the file
+        
+        No write is committed in between, so the file and the number always match (raises IOError if there is no file).
+        '''
+        
+        with self.condition:
+            return open(filename,'rb'),self.saved_seq
+        
+    def tick(self):
+        '''writes the snapshot if the session is dirty and has been quiet long enough (called from the main thread)'''
+        
+        with self.condition:
+            if self.saved_generation >= self.generation or self.writer is not None:
+                return
+            now = time.time()
+            due = self.flush_requested
+            due = due or now - self.last_dirty >= self.quiet_period
+            due = due or (self.first_dirty is not None and now - self.first_dirty >= self.max_interval)
+        if due:
+            self.write()
+            
+    def flush(self):
+        '''writes any pending changes right away and waits for the write to finish (called from the main thread)'''
+        
+        if self.writer is not None:
+            self.writer.join()
+        if self.is_dirty():
+            self.write()
+        if self.writer is not None:
+            self.writer.join()
+            
+    def write(self):
+        '''writes the current state of the scene
+        
+        Collada exports need bpy and run on the main thread. Binary snapshots are collected on the main thread
+        (bulk array copies) and written to disk by a background thread, which hands the hashing and writing to a
+        worker process when there is a pool.
+        '''
+        
+        with self.condition:
+            generation = self.generation
+            seq = self.seq
+            first_dirty = self.first_dirty
+            flush_requested = self.flush_requested
+            self.first_dirty = None
+            self.flush_requested = False
+            
+        if not os.path.isdir(self.path):
+            utils.create_directory(self.path)
+            
+        temp_name = self.name + utils.TEMP_SUFFIX
+        if bpy.context.scene.snapshot_format == 'BINARY':
+            entries,records = snapshot.collect(hashed=self.pool is None)
+            self.writer = threading.Thread(target=self.write_binary,args=(entries,records,generation,seq,first_dirty,
+                                                                           flush_requested))
+            self.writer.start()
+        else:
+            try:
+                utils.write_state(self.path,temp_name,'DAE')
+                self.commit(temp_name,'DAE',generation,seq)
+            except OSError:
+                print("Snapshot could not be written")
+                self.retry(first_dirty,flush_requested)
+            
+    def retry(self,first_dirty,flush_requested):
+        '''keeps a session whose write failed due, so a later tick writes it again
+        
+        Parameters
+        first_dirty      -- the time of the first change the failed write was meant to include
+        flush_requested  -- a boolean value indicating if a write was asked for as soon as possible
+        '''
+        
+        with self.condition:
+            if first_dirty is not None and (self.first_dirty is None or first_dirty < self.first_dirty):
+                self.first_dirty = first_dirty
+            self.flush_requested = self.flush_requested or flush_requested
+            
+    def write_binary(self,entries,records,generation,seq,first_dirty,flush_requested):
+        '''writes a collected binary snapshot under a temporary name and commits it (thread function)
+        
+        Parameters
+        entries     -- a list of dict objects describing the objects
+        records     -- a list of packed mesh records
+        generation  -- the generation included in the snapshot
+        seq         -- the sequence number of the last operation included in the snapshot
+        first_dirty -- the time of the first change included in the snapshot (given back if the write fails)
+        flush_requested -- a boolean value indicating if the write was asked for as soon as possible (given back too)
+        '''
+        
+        temp_name = self.name + utils.TEMP_SUFFIX
+        try:
+            if self.pool is not None:
+                digest = self.pool.run('write_snapshot',self.path + "/" + temp_name + snapshot.EXTENSION,entries,records)
+                self.commit(temp_name,'BINARY',generation,seq,{snapshot.EXTENSION : digest})
+            else:
+                snapshot.write(self.path,temp_name,entries,records)
+                self.commit(temp_name,'BINARY',generation,seq)
+        except (OSError,RuntimeError):
+            #the snapshot stays dirty and is written again on a later tick
+            print("Snapshot could not be written")
+            self.retry(first_dirty,flush_requested)
+        self.writer = None
+        
+    def commit(self,temp_name,fmt,generation,seq,digests=None):
+        '''renames a written snapshot into place and records it as the newest checkpoint
+        
+        Parameters
+        temp_name   -- a string containing the temporary name the snapshot was written under
+        fmt         -- a string containing the snapshot format ('DAE','BINARY')
+        generation  -- the generation included in the snapshot
+        seq         -- the sequence number of the last operation included in the snapshot
+        digests     -- (optional) a dict object mapping extensions to the digests of the written files
+        
+        This does not use bpy, so it can run on the writer thread.
+        '''
+        
+        extensions = utils.snapshot_files(fmt)
+        previous = None
+        if self.checkpoints is not None:
+            previous = self.checkpoints.rotate(extensions)
+        with self.condition:
+            #the files and the sequence number they include change together (see open_snapshot)
+            utils.commit_files(self.path,temp_name,self.name,extensions)
+            self.saved_seq = seq
+        if self.checkpoints is not None:
+            self.checkpoints.record(seq,fmt,extensions,previous,digests)
+        self.finish(generation)
+        
+    def finish(self,generation):
+        '''records a completed write and wakes up the threads waiting for it
+        
+        Parameters
+        generation  -- the generation included in the written snapshot
+        '''
+        
+        with self.condition:
+            if generation > self.saved_generation:
+                self.saved_generation = generation
+            #changes made during the write keep the session dirty
+            if self.saved_generation < self.generation and self.first_dirty is None:
+                self.first_dirty = time.time()
+            self.condition.notify_all()
@@ -0,0 +1,317 @@
+import bpy
+import time
+from collections import OrderedDict
+from . import utils
+from . import registry
+from . import transformer
+from . import meshdelta
+
+#operations whose effects add up, so applying them in either order gives the same result
+ADDITIVE = ('translate','mesh_delta')
+
+def addressed(op):
+    '''gets the objects an operation changes, by id (by name for objects without an id)
+    
+    Adds are left out, they address their objects by id and their name clashes are rebased separately.
+    '''
+    
+    kind = transformer.op_kind(op)
+    if kind.startswith('add'):
+        return set()
+    target_ids = op.get('target_ids') or []
+    if len(target_ids) != len(op['targets']):
+        target_ids = [''] * len(op['targets'])
+    objects = set(obj_id or name for name,obj_id in zip(op['targets'],target_ids))
+    if op.get('mode') == 'EDIT_MESH' or kind == 'mesh_delta':
+        objects.add(op.get('active_id','') or op['active_object'])
+    return objects - set([''])
+
+def commutes(op,other):
+    '''checks if two operations give the same result whichever of them is applied first'''
+    if addressed(op) & addressed(other) == set():
+        return True
+    return transformer.op_kind(op) in ADDITIVE and transformer.op_kind(other) in ADDITIVE
+
+def inverse(op):
+    '''gets the operation that undoes an operation applied locally
+    
+    Parameters
+    op          -- a dict object representing an operation
+    
+    Return Value
+    undo        -- a dict object representing the undoing operation (None if no operation can undo it, e.g. a delete)
+    
+    The pivot of a transform stays where it is (the median point, the cursor, the origins or the active object), so
+    the same transform with the opposite value undoes it. A rotation moves the center of the bounding box it turned
+    about, so it cannot be undone that way.
+    '''
+    
+    kind = transformer.op_kind(op)
+    if kind == 'mesh_delta':
+        undo = meshdelta.negate(op)
+    elif kind == 'translate':
+        undo = dict(op)
+        undo['x'],undo['y'],undo['z'] = -op['x'],-op['y'],-op['z']
+    elif kind == 'rotate' and op.get('pivot_point') != 'BOUNDING_BOX_CENTER':
+        undo = dict(op)
+        undo['value'] = -op['value']
+    elif kind == 'resize' and 0 not in (op['x'],op['y'],op['z']):
+        undo = dict(op)
+        undo['x'],undo['y'],undo['z'] = 1.0 / op['x'],1.0 / op['y'],1.0 / op['z']
+    else:
+        return None
+    undo.pop('op_id',None)
+    undo.pop('base_seq',None)
+    return undo
+
+class Sequencer:
+    '''stamps operations with a global sequence number in the order the server processes them
+    
+    Attributes
+    seq         -- an int value of the last sequence number given out
+    '''
+    
+    def __init__(self,seq=0):
+        self.seq = seq
+        
+    def stamp(self,data):
+        '''gives an operation the next sequence number
+        
+        Parameters
+        data        -- a dict object containing an operation received from a client
+        
+        Return Value
+        seq         -- the sequence number given to the operation
+        '''
+        
+        self.seq += 1
+        data['seq'] = self.seq
+        return self.seq
+    
+class PendingBuffer:
+    '''keeps a client's own operations until the server orders them and puts received operations in server order
+    
+    Attributes
+    pending      -- an OrderedDict that maps op ids to the sent operations that the server has not acknowledged yet
+    orphans      -- a dict object that maps op ids to the operations that were pending when a snapshot was loaded
+    effects      -- an OrderedDict that maps op ids of pending operations to their Effect objects (deletes only)
+    held         -- a dict object that maps sequence numbers to received data that cannot be applied yet
+    last_seq     -- an int value of the sequence number of the last data that was released (None until the first)
+    next_op_id   -- an int value of the id to give to the next sent operation
+    diverged     -- a boolean value indicating that a remote operation did not commute with a pending one that cannot
+                    be undone, so the local scene no longer matches the server's order and must be reloaded
+    gap_since    -- the time when the oldest gap in the sequence was first seen (None if there is no gap)
+    gap_timeout  -- the number of seconds to wait for a missing sequence number before skipping it
+    ids          -- an IdMap object used to find the objects of pending operations
+    names        -- a NameRegistry object used to pick free names when rebasing
+    '''
+    
+    def __init__(self,ids,names,gap_timeout=2.0):
+        self.pending = OrderedDict()
+        self.orphans = {}
+        self.effects = OrderedDict()
+        self.held = {}
+        self.last_seq = None
+        self.next_op_id = 1
+        self.diverged = False
+        self.gap_since = None
+        self.gap_timeout = gap_timeout
+        self.ids = ids
+        self.names = names
+        
+    def restart(self,seq):
+        '''starts the order over after a snapshot was loaded
+        
+        Parameters
+        seq         -- the sequence number of the last operation included in the snapshot (None if unknown)
+        
+        The data up to seq is in the snapshot and is dropped when it arrives. The pending operations are gone from the
+        scene, those the server orders after seq are applied as remote operations once acknowledged (see acknowledge).
+        '''
+        
+        self.orphans.update(self.pending)
+        self.pending = OrderedDict()
+        self.effects = OrderedDict()
+        self.held = {}
+        self.last_seq = seq
+        self.diverged = False
+        self.gap_since = None
+        
+    def track(self,op,removed=None):
+        '''gives an operation an op id and keeps it until it is acknowledged
+        
+        Parameters
+        op          -- a dict object representing an operation that was applied locally and is about to be sent
+        removed     -- (optional) a dict object mapping element types to the indices an edit mode delete removed
+        
+        The op id and the 'base_seq' (the last server operation applied before it was made) are the version of the
+        operation, the server transforms it against the operations it ordered after that version.
+        '''
+        
+        op['op_id'] = self.next_op_id
+        self.next_op_id += 1
+        if self.last_seq is not None:
+            op['base_seq'] = self.last_seq
+        self.pending[op['op_id']] = op
+        effect = transformer.effect_of(op,removed)
+        if not effect.empty():
+            self.effects[op['op_id']] = effect
+        
+    def receive(self,data):
+        '''holds received data (a remote operation or an acknowledgement) until it can be released in order
+        
+        Parameters
+        data        -- a dict object received from the server, carrying a 'seq'
+        '''
+        
+        if 'seq' not in data:
+            return
+        #anything at or below the last released sequence number is a duplicate
+        if self.last_seq is not None and data['seq'] <= self.last_seq:
+            return
+        self.held[data['seq']] = data
+        #the server merged queued operations into this one, their sequence numbers are not coming
+        for seq in data.get('merged_seqs',[]):
+            if self.last_seq is None or seq > self.last_seq:
+                self.held[seq] = {'action' : 'SKIP','seq' : seq}
+        
+    def ready(self):
+        '''releases the held data that follows the last released sequence number without a gap
+        
+        Return Value
+        released    -- a list of dict objects in server order
+        '''
+        
+        released = []
+        if self.held == {}:
+            return released
+        
+        #the first data received starts the sequence
+        if self.last_seq is None:
+            self.last_seq = min(self.held) - 1
+            
+        while self.last_seq + 1 in self.held:
+            self.last_seq += 1
+            released.append(self.held.pop(self.last_seq))
+            
+        if self.held == {}:
+            self.gap_since = None
+        elif self.gap_since is None:
+            self.gap_since = time.time()
+        elif time.time() - self.gap_since > self.gap_timeout:
+            #the missing data was lost, so skip to the next held sequence number and keep going
+            print("missing operations {0}-{1}".format(self.last_seq + 1,min(self.held) - 1))
+            self.last_seq = min(self.held) - 1
+            self.gap_since = None
+            released.extend(self.ready())
+            
+        return released
+    
+    def acknowledge(self,data):
+        '''removes an acknowledged operation from the pending buffer and reconciles it with the server's version
+        
+        Parameters
+        data        -- a dict object containing the acknowledged operation as ordered (and maybe revised) by the server
+        
+        Return Value
+        op          -- the operation to apply (None unless it was an orphan, which the loaded snapshot does not include)
+        '''
+        
+        server_op = data['operation']
+        if self.orphans.pop(server_op.get('op_id'),None) is not None:
+            return server_op
+        local_op = self.pending.pop(server_op.get('op_id'),None)
+        self.effects.pop(server_op.get('op_id'),None)
+        if local_op is None:
+            return
+        
+        #the server may have renamed an added object to resolve a name clash
+        if local_op['active_object'] != server_op['active_object'] and server_op.get('active_id','') != '':
+            local_name = self.ids.name_of(server_op['active_id'])
+            if local_name is not None:
+                self.rename(local_name,server_op['active_object'])
+                
+    def discard(self,op_id):
+        '''forgets a pending operation the server dropped because the objects it addressed were deleted concurrently'''
+        self.pending.pop(op_id,None)
+        self.orphans.pop(op_id,None)
+        self.effects.pop(op_id,None)
+        
+    def rebase(self,op):
+        '''puts a remote operation ordered before the pending operations in front of them in the local scene
+        
+        Parameters
+        op          -- a dict object representing a remote operation
+        
+        Return Value
+        ops         -- a list of dict objects representing the operations to apply, in order
+        
+        A remote add that uses the name of an object added by a pending operation wins the name, since the server
+        ordered it first. The local object moves to the next free name until its acknowledgement brings the final one.
+        The element indices and objects of the remote operation are transformed against the pending deletes, which in
+        turn are transformed against the remote operation for the ones received after it.
+        
+        Pending operations that commute with the remote one (see commutes) stay applied. From the first one that does
+        not, the pending operations are undone (see inverse), the remote operation is applied and they are applied
+        again, transformed against what the remote operation deleted. If one of them cannot be undone (e.g. an edit
+        mode extrude), diverged is set and the client reloads the snapshot.
+        '''
+        
+        if "add" in utils.format_op_name(op['name']):
+            for local_op in self.pending.values():
+                if "add" not in utils.format_op_name(local_op['name']):
+                    continue
+                local_name = self.ids.name_of(local_op.get('active_id',''))
+                if local_name == op['active_object']:
+                    base = registry.split_name(local_name)[0]
+                    free_name = registry.join_name(base,self.names.next_free(base))
+                    self.rename(local_name,free_name)
+        
+        effects = list(self.effects.values())
+        remote = transformer.effect_of(op)
+        op = transformer.transform(op,effects)
+        #the remote effect as seen after the pending deletes, the pending operations applied again address that scene
+        for effect in effects:
+            remote = effect.include(remote)
+        if op is None:
+            return []
+        
+        op_ids = list(self.pending.keys())
+        conflicts = [index for index,op_id in enumerate(op_ids) if not commutes(op,self.pending[op_id])]
+        if conflicts == []:
+            return [op]
+        redone = op_ids[conflicts[0]:]
+        undos = [inverse(self.pending[op_id]) for op_id in redone]
+        if None in undos:
+            print("A remote {0} conflicts with a pending operation that cannot be undone".format(op['name']))
+            self.diverged = True
+            return [op]
+        
+        ops = list(reversed(undos)) + [op]
+        for op_id in redone:
+            local_op = remote.transform(self.pending[op_id])
+            if local_op is None:
+                #everything it addressed was deleted, the server drops it as well
+                self.discard(op_id)
+                continue
+            #the pending operation is kept as it is applied now, so it can be undone again
+            self.pending[op_id] = local_op
+            redo = dict(local_op)
+            redo.pop('op_id',None)
+            redo.pop('base_seq',None)
+            ops.append(redo)
+        return ops
+    
+    def rename(self,old_name,new_name):
+        '''renames a local object and updates the name index
+        
+        Parameters
+        old_name    -- a string containing the current name of the object
+        new_name    -- a string containing the name to give
+        '''
+        
+        obj = bpy.data.objects[old_name]
+        obj.name = new_name
+        #blender adds a suffix if the new name is taken, so the actual name is registered
+        self.names.rename(old_name,obj.name)
+        self.ids.register(obj,self.ids.ensure(obj))
@@ -4,10 +4,27 @@ import threading
 import queue
 import socket
 import os
+import time
 from . import encoder
 from . import decoder
 from . import utils
 from . import transformer
+from . import identity
+from . import sequencer
+from . import scheduler
+from . import snapshot
+from . import binformat
+from . import oplog
+from . import interest
+from . import workers
+from . import membership
+from . import transport
+from . import reliable
+from . import multicast
+from . import outbound
+from . import priority
+from . import threadpool
+from . import leases
 
 class StartServer(bpy.types.Operator):
     '''starts a persistent collaboration server'''
@@ -19,13 +36,29 @@ class StartServer(bpy.types.Operator):
     Attributes
     servsock    -- a UDP socket object used to serve requests
     regsock    -- a TCP socket object used for subscription and sending files
-    clients     -- a list containing the addresses of the clients
+    clients     -- a Membership object keyed by the addresses of the clients, with their last heartbeats and round trip times
+    last_ping   -- the time the last heartbeat was sent to the clients
+    notified    -- a dict object mapping the addresses of senders that are not members to the time they were last told to subscribe again
+    connections -- a dict object mapping the addresses of the clients using the TCP transport to their Connection objects
+    endpoint    -- an Endpoint object that delivers datagrams reliably to the clients using the reliable UDP transport
+    publisher   -- a Publisher object that sends every operation once to the session's multicast group (None until a client joins it)
+    group_members -- a set object containing the addresses of the clients that receive the operations from the multicast group
+    outbound    -- an Outbound object that keeps a queue per client, so a slow client only delays itself
+    threads     -- a ThreadPool object whose workers serve the register requests and send the clients' queued messages
+    leases      -- a LeaseTable object that keeps which client may edit which object
     addr        -- a tuple containing the ip address and port of the server socket
+    ids         -- an IdMap object shared by the encoder and decoder to address objects by persistent ids
     dec         -- a decoder object used to run operations
     enc         -- an encoder object used to create operations
     transformer -- a transformer object used to modify operations
-    inqueue     -- a Queue object that stores received operations
-    outqueue    -- a Queue object that stores operations to send to clients
+    inqueue     -- an OperationScheduler object that hands out the received operations by priority class
+    outqueue    -- a Queue object that stores processed operations to send to clients, in processing order
+    sequencer   -- a Sequencer object that stamps processed operations with a global sequence number
+    snapshots   -- a SnapshotScheduler object that writes the session snapshot after changes settle
+    checkpoints -- a Checkpoints object that keeps the written snapshots as recovery checkpoints
+    oplog       -- an OpLog object that logs every processed operation for crash recovery
+    interests   -- an InterestManager object that keeps what each client subscribed to and the bounds of the objects
+    pool        -- a WorkerPool object that runs the bpy-independent heavy jobs (snapshot hashing and writing, log compaction)
     '''
     
     def invoke(self,context, event):
@@ -37,17 +70,60 @@ class StartServer(bpy.types.Operator):
             bpy.context.scene.modal_flag = True
             
             #attribute initializations
-            self.clients = []
-            self.dec = decoder.Decoder()
-            self.enc = encoder.Encoder()
+            self.clients = membership.Membership()
+            self.last_ping = 0.0
+            self.notified = {}
+            self.connections = {}
+            self.publisher = None
+            self.group_members = set()
+            self.threads = threadpool.ThreadPool(bpy.context.scene.worker_threads)
+            self.leases = leases.LeaseTable(bpy.context.scene.lease_duration)
+            self.outbound = outbound.Outbound(self.send_data,self.drain,self.threads,bpy.context.scene.outbound_length,
+                                              bpy.context.scene.outbound_lag)
+            self.ids = identity.IdMap()
             self.transformer = transformer.Transformer()
-            self.inqueue = queue.Queue(30)
-            self.outqueue = queue.Queue(30)
+            self.dec = decoder.Decoder(self.ids,self.transformer.names)
+            self.enc = encoder.Encoder(self.ids,self.transformer.names)
+            #received operations are never dropped, structural changes are processed before queued transforms
+            self.inqueue = priority.OperationScheduler(self.priority_overrides(),bpy.context.scene.priority_max_wait)
+            self.outqueue = queue.Queue()
             
-            load_flag = utils.load_state(bpy.context.scene.server_filepath,bpy.context.scene.session_name)
-            if not load_flag:
-                utils.save_state(bpy.context.scene.server_filepath,bpy.context.scene.session_name)
-                utils.load_state(bpy.context.scene.server_filepath,bpy.context.scene.session_name)
+            path = bpy.context.scene.server_filepath
+            name = bpy.context.scene.session_name
+            if not utils.check_dir(path):
+                utils.create_directory(path)
+            self.pool = workers.WorkerPool(bpy.context.scene.worker_processes)
+            self.checkpoints = oplog.Checkpoints(path,name)
+            self.oplog = oplog.OpLog(path,name)
+            
+            #restart from the newest checkpoint whose files are intact
+            checkpoint = self.checkpoints.newest_valid()
+            if checkpoint is not None:
+                utils.load_state(path,checkpoint['name'],'FULL',checkpoint['format'])
+                checkpoint_seq = checkpoint['seq']
+            else:
+                load_flag = utils.load_state(path,name)
+                if not load_flag:
+                    utils.save_state(path,name)
+                    utils.load_state(path,name)
+                #give every object an id (objects from older snapshots have none) and publish them with the snapshot
+                if bpy.context.scene.snapshot_format == 'DAE':
+                    utils.save_manifest(path,name)
+                    snapshot.save(path,name)
+                checkpoint_seq = 0
+                
+            self.ids.refresh()
+            self.transformer.load()
+            self.sequencer = sequencer.Sequencer(checkpoint_seq)
+            self.snapshots = scheduler.SnapshotScheduler(path,name,bpy.context.scene.snapshot_quiet,
+                                                         bpy.context.scene.snapshot_max_interval,self.checkpoints,self.pool,
+                                                         checkpoint_seq)
+            
+            #replay the operations logged after the checkpoint, the log ends cleanly at a torn record
+            self.transformer.start(checkpoint_seq)
+            self.replay(self.oplog.recover(checkpoint_seq))
+            self.interests = interest.InterestManager(self.ids)
+            self.interests.rebuild()
             
             #initialize the server
             self.init_server(5050)
@@ -57,7 +133,7 @@ class StartServer(bpy.types.Operator):
             registerthread.start()
             
             #bind the modal events
-            self._timer = bpy.context.window_manager.event_timer_add(1.0, context.window)
+            self._timer = bpy.context.window_manager.event_timer_add(bpy.context.scene.sync_interval, context.window)
             bpy.context.window_manager.modal_handler_add(self)
             
         return {'RUNNING_MODAL'}
@@ -74,8 +150,22 @@ class StartServer(bpy.types.Operator):
         
         if event.type in ('TIMER'):
             #print("timer")
-            conflict_flag = self.process_operation()
-            self.broadcast_operation(conflict_flag)
+            #process as many waves as fit in the budget of a tick, each operation is queued for the clients right away
+            deadline = time.time() + bpy.context.scene.process_budget / 1000.0
+            while True:
+                conflict_flag = self.process_wave()
+                while not self.outqueue.empty():
+                    self.broadcast_operation(conflict_flag)
+                if conflict_flag is None or time.time() >= deadline:
+                    break
+            bpy.context.scene.queue_metrics = self.inqueue.to_json()
+            if self.leases.expire():
+                self.publish_leases()
+            self.heartbeat()
+            self.oplog.sync()
+            self.snapshots.tick()
+            #operations included in every retained checkpoint are no longer needed for recovery
+            self.oplog.compact(self.checkpoints.oldest_seq(),self.pool)
             
         return {'PASS_THROUGH'}
     
@@ -102,10 +192,25 @@ class StartServer(bpy.types.Operator):
             except OSError:
                 temp_port+=1        
         self.addr = self.servsock.getsockname()
+        self.endpoint = reliable.Endpoint(self.servsock)
+        self.endpoint.start()
         bpy.context.scene.server_port = temp_port
         
     def close_server(self):
         ''' close a server '''
+        #write the changes that are still pending so that the next start loads them
+        self.snapshots.flush()
+        self.oplog.close()
+        self.pool.shutdown()
+        bpy.context.scene.members = "[]"
+        bpy.context.scene.queue_metrics = "[]"
+        self.outbound.close()
+        self.threads.shutdown()
+        for connection in list(self.connections.values()):
+            connection.close()
+        self.endpoint.stop()
+        if self.publisher is not None:
+            self.publisher.close()
         self.servsock.close()
         self.regsock.close()
         #remove the timer to prevent redundancy when the server is re-initialized
@@ -117,66 +222,238 @@ class StartServer(bpy.types.Operator):
             
             try:
                 print("Listening for requests...")
-                data_bytes, addr = self.servsock.recvfrom(4096)
+                data_bytes, addr = self.servsock.recvfrom(65536)
+                #reliable datagrams are acknowledged here and handed over in order, acks are consumed by the endpoint
+                if reliable.is_reliable(data_bytes):
+                    for payload in self.endpoint.receive(data_bytes,addr):
+                        self.receive_data(payload,json.loads(payload.decode()))
+                    continue
                 #convert the bytes object into a dictionary object
                 data = json.loads(data_bytes.decode())
-                sender = (data['ip_addr'],data['port'])
-                action = data['action']
-                
-                #accept data if it came from a node in the list of clients and that client intends to send data
-                if sender in self.clients and action in ('SEND'):
-                    if not self.inqueue.full():
-                        self.inqueue.put(data)
+                self.receive_data(data_bytes,data)
                                             
             except OSError:
                 #this can happen when the socket is suddenly closed while waiting for data
                 break
             
+    def receive_data(self,data_bytes,data):
+        '''handles operations, previews and heartbeat replies, whether they came as datagrams or over a connection
+        
+        Parameters
+        data_bytes  -- the received data in bytes format
+        data        -- a dict object containing the received data
+        '''
+        
+        sender = (data['ip_addr'],data['port'])
+        action = data['action']
+        
+        #any data from a client shows that it is still alive, heartbeat replies also carry the time of the ping
+        if action in ('PONG'):
+            member_flag = self.clients.touch(sender,data.get('time'))
+        else:
+            member_flag = self.clients.touch(sender)
+        
+        #accept data if it came from a node in the list of clients and that client intends to send data
+        if member_flag and action in ('SEND'):
+            self.inqueue.put(data)
+        
+        #previews are relayed right away, they are not queued, logged or executed
+        elif member_flag and action in ('PREVIEW'):
+            self.relay_preview(data_bytes,sender,data)
+            
+        #a client asks for the leases of the objects it selected (and renews them)
+        elif member_flag and action in ('LEASE'):
+            if self.leases.request(sender,data.get('ids',[])):
+                self.publish_leases()
+            
+        #group datagrams a client missed are sent to it again over unicast
+        elif member_flag and action in ('NACK') and self.publisher is not None:
+            for datagram in self.publisher.repair(data['first'],data['last']):
+                self.servsock.sendto(datagram,sender)
+                
+        #a client that was evicted but is still alive (e.g. after a long stall) would otherwise never learn it
+        elif not member_flag and action in ('SEND','PREVIEW','LEASE','PONG','NACK'):
+            self.notify_evicted(sender,data)
+            
     def register_thread(self):
         '''a thread function that continuously listens for login or logout requests'''
         while bpy.context.scene.thread_flag == True:
             try:
                 conn,addr = self.regsock.accept()
+            except OSError:
+                continue
+            
+            #the requests are read and served by the pool, so a slow client never holds up the next accept
+            if not self.threads.submit(self.handle_request,conn,addr):
+                print("Too many requests waiting, refusing {0}".format(addr))
+                conn.close()
                 
-                data_bytes = conn.recv(4096)
-                data = json.loads(data_bytes.decode('utf-8'))
-                sender = (data['ip_addr'],data['port'])
-                action = data['action']
-                print(data_bytes)
+    def handle_request(self,conn,addr):
+        '''reads a register request and serves it (task run by the pool)
+        
+        Parameters
+        conn    -- the accepted TCP socket object
+        addr    -- a tuple containing the ip address and port of the connection
+        '''
+        
+        try:
+            #a client that connects and sends nothing gives up its worker after a while
+            conn.settimeout(5.0)
+            
+            #clients using the TCP transport keep their connection and send frames instead of a single request,
+            #the connection lives as long as the client so it gets a thread of its own instead of a worker
+            first_byte = conn.recv(1,socket.MSG_PEEK)
+            if first_byte != b'' and transport.is_framed(first_byte):
+                conn.settimeout(None)
+                t = threading.Thread(target=self.connection_thread,args=(conn,addr))
+                t.start()
+                return
+            
+            data_bytes = conn.recv(4096)
+            data = json.loads(data_bytes.decode('utf-8'))
+            sender = (data['ip_addr'],data['port'])
+            action = data['action']
+            print(data_bytes)
+            
+            #add a new subscriber if not yet in the list of clients
+            if addr not in self.clients and action in ('LOGIN','SUBSCRIBE'):
+                self.subscribe_thread(conn,addr,data)
+            
+            elif sender in self.clients and action in ('LOGOUT','UNSUBSCRIBE'):
+                self.unsubscribe_thread(sender,conn)
                 
-                #add a new subscriber if not yet in the list of clients
-                if addr not in self.clients and action in ('LOGIN','SUBSCRIBE'):
-                    t = threading.Thread(target=self.subscribe_thread(conn, addr, data))
-                    t.start()
+            elif sender in self.clients and action in ('REQUEST_FILE'):
+                self.send_file(conn,data)
                 
-                elif sender in self.clients and action in ('LOGOUT','UNSUBSCRIBE'):
-                    t = threading.Thread(target=self.unsubscribe_thread(sender, conn))
-                    t.start()
-                    
-                elif sender in self.clients and action in ('REQUEST_FILE'):
-                    t = threading.Thread(target=self.send_file,args=(conn,data))
-                    t.start()
+            elif sender in self.clients and action in ('REQUEST_MANIFEST','REQUEST_OBJECTS'):
+                self.send_objects(conn,data)
                 
-            except OSError:
-                pass
+            elif sender in self.clients and action in ('SET_INTEREST'):
+                self.interest_thread(sender,conn,data)
+            
+        except (OSError,ValueError,KeyError):
+            conn.close()
     
-    def client_thread(self,data_bytes,sender,conflict_flag):
-        ''' broadcasts data to all connected clients except for the sender
+    def connection_thread(self,conn,addr):
+        '''serves a client over its persistent connection, from the subscription until it leaves (thread function)
+        
+        Parameters
+        conn    -- the accepted TCP socket object
+        addr    -- a tuple containing the ip address and port of the connection, used as the address of the client
+        '''
+        
+        connection = transport.Connection(conn)
+        try:
+            data = None
+            if connection.accept():
+                data = connection.receive_message()
+        except (OSError,ValueError):
+            data = None
+        if data is None or data['action'] not in ('LOGIN','SUBSCRIBE'):
+            connection.close()
+            return
+        
+        #the connection is registered first so that nothing is sent to the client as a datagram
+        self.connections[addr] = connection
+        self.subscribe_thread(connection,addr,data)
+        if addr not in self.clients:
+            self.connections.pop(addr,None)
+            connection.flush()
+            connection.close()
+            return
+        
+        while bpy.context.scene.thread_flag == True:
+            try:
+                frame = connection.receive()
+                if frame is None:
+                    break
+                kind,data_bytes = frame
+                if kind != transport.MESSAGE:
+                    continue
+                data = json.loads(data_bytes.decode('utf-8'))
+            except (OSError,ValueError):
+                break
+            action = data['action']
+            
+            if action in ('SEND','PREVIEW','PONG','LEASE'):
+                self.receive_data(data_bytes,data)
+            elif action in ('LOGOUT','UNSUBSCRIBE'):
+                break
+            elif action in ('REQUEST_FILE'):
+                self.send_file(connection,data)
+            elif action in ('SET_INTEREST'):
+                self.interests.set_interest(addr,data.get('interest'))
+                
+        #a closed connection is the same as an unsubscription
+        self.connections.pop(addr,None)
+        self.outbound.remove(addr)
+        self.clients.remove(addr)
+        self.interests.remove_client(addr)
+        if self.leases.release_all(addr):
+            self.publish_leases()
+        connection.close()
+        print(self.clients)
+        
+    def client_thread(self,data_bytes,sender,conflict_flag,excluded=()):
+        ''' broadcasts data to all connected clients except for the sender and the clients not interested in it
         
         Parameters
         data_bytes      -- the data to send in bytes format
         sender          -- a tuple containing the ip address and port of the sender
         conflict_flag   -- a boolean value that indicates the presence (True) or absence (False) of a conflicting operation
+        excluded        -- a collection of the addresses of the clients whose interest does not cover the operation
         '''
         
         print(data_bytes)
         data = json.loads(data_bytes.decode('utf-8'))
+        #the clients' queues may merge the operation with queued ones, they never change the data they were given
+        op_message = outbound.Message('OP',data_bytes,data)
+        if bpy.context.scene.sequencing == True:
+            #the sender already applied the operation, it only needs to know where the server ordered it
+            ack = dict(data)
+            ack['action'] = 'ACK'
+            ack_message = outbound.Message('ACK',bytes(json.dumps(ack),'utf-8'),ack)
+            #clients that are not interested only get the sequence number so that they do not wait for it
+            skip_message = outbound.Message('SKIP',bytes(json.dumps({'action' : 'SKIP','seq' : data['seq']}),'utf-8'))
+            
+        if self.group_members:
+            #one copy for the whole group, its members recognize their own operations and the ones they are excluded from
+            group_data = json.loads(data_bytes.decode('utf-8'))
+            group_data['excluded'] = [list(client) for client in excluded if client in self.group_members]
+            self.publisher.publish(bytes(json.dumps(group_data),'utf-8'))
+            
         for client in self.clients:
-            #no need to send data to the node that sent the data
+            if client in self.group_members:
+                continue
+            
+            #no need to send the operation to the node that sent the data
             if client == sender:
+                if bpy.context.scene.sequencing == True:
+                    self.outbound.put(client,ack_message)
                 continue
             
-            self.send_data(data_bytes,client)
+            if client in excluded:
+                if bpy.context.scene.sequencing == True:
+                    self.outbound.put(client,skip_message)
+                continue
+            
+            self.outbound.put(client,op_message)
+            
+    def relay_preview(self,data_bytes,sender,data):
+        ''' forwards the transform samples of a drag to the other clients interested in the objects
+        
+        Parameters
+        data_bytes      -- the received preview in bytes format
+        sender          -- a tuple containing the ip address and port of the sender
+        data            -- a dict object containing the preview, with the samples keyed by object id in 'objects'
+        '''
+        
+        excluded = self.interests.excluded({'target_ids' : list(data['objects'].keys())})
+        message = outbound.Message('PREVIEW',data_bytes,data,False)
+        for client in self.clients:
+            if client == sender or client in excluded:
+                continue
+            self.outbound.put(client,message)
             
     def subscribe_thread(self,sender,addr,data):
         '''add a node to the list of clients and return an acknowledgement of success
@@ -189,13 +466,29 @@ class StartServer(bpy.types.Operator):
         
         #if the requested file/session exists and is the currently active session, add the user to the list of clients and send a success acknowledgement
         if utils.check_file(bpy.context.scene.server_filepath,data['filename']) and data['filename'] == bpy.context.scene.session_name:
-            self.clients.append(addr)
+            #a client may narrow down the operations it receives right away
+            self.interests.set_interest(addr,data.get('interest'))
+            if data.get('transport') == 'RUDP':
+                self.endpoint.add_peer(addr)
+            #taken before the client is added, every operation it is sent is numbered after it
+            seq = self.sequencer.seq
+            self.clients.add(addr)
+            self.outbound.add(addr)
             print(self.clients)
             ack = {
                 'success' : True,
                 'ip' : addr[0],
-                'port' : addr[1]
+                'port' : addr[1],
+                'seq' : seq,
+                'sequencing' : bpy.context.scene.sequencing,
+                'snapshot_format' : bpy.context.scene.snapshot_format,
+                'leases' : self.leases.holders()
             }
+            #the client gets the operations from the group starting after the current group sequence number
+            if data.get('transport') == 'MULTICAST' and self.start_publisher():
+                self.group_members.add(addr)
+                ack['group'] = list(self.publisher.group)
+                ack['group_seq'] = self.publisher.seq
             
         #if the requested file/session does not exist or is not active, do not add the user to the list and send a failure acknowledgement
         elif not utils.check_file(bpy.context.scene.server_filepath,data['filename']) or data['filename'] != bpy.context.scene.session_name:
@@ -216,6 +509,12 @@ class StartServer(bpy.types.Operator):
         '''
         
         self.clients.remove(sender)
+        self.endpoint.remove_peer(sender)
+        self.group_members.discard(sender)
+        self.outbound.remove(sender)
+        self.interests.remove_client(sender)
+        if self.leases.release_all(sender):
+            self.publish_leases()
         print(self.clients)
         ack = {
             'success' : True
@@ -223,72 +522,399 @@ class StartServer(bpy.types.Operator):
         
         conn.sendall(bytes(json.dumps(ack),'utf-8'))
         
+    def interest_thread(self,sender,conn,data):
+        '''replaces the interest of a client
+        
+        Parameters
+        sender  -- a tuple containing the ip address and port data of a node
+        conn    -- a TCP socket object used to communicate with a sender
+        data    -- a dict object that contains the new 'interest' (None to receive every operation)
+        '''
+        
+        self.interests.set_interest(sender,data.get('interest'))
+        ack = {
+            'success' : True
+        }
+        
+        conn.sendall(bytes(json.dumps(ack),'utf-8'))
+        conn.close()
+        
     def send_file(self,conn,data):
         '''sends a file to a client
         
         Parameters
 
-        conn      -- a TCP socket object used to connect to a client
+        conn      -- a TCP socket object used to connect to a client (or the client's Connection object)
         data      -- a dictionary object that contains information from a client
         
+        Over a connection the file is sent as binary frames between a FILE_BEGIN and a FILE_END message, otherwise it
+        follows a header line (see transport.pack_header). Both carry the 'seq' of the last operation the file
+        includes, the client drops the operations it receives up to that number since the file has them already.
         '''
         
-        filename = bpy.context.scene.server_filepath + "/" + data['filename'] + ".dae"
+        #only the snapshot and its companion files can be requested
+        extension = data.get('extension',utils.snapshot_extension())
+        if extension not in utils.SNAPSHOT_EXTENSIONS:
+            extension = utils.snapshot_extension()
+        filename = bpy.context.scene.server_filepath + "/" + data['filename'] + extension
         
+        #a client reloading the snapshot after falling behind gets the operations that follow it again
+        self.outbound.resume((data['ip_addr'],data['port']))
+        #make sure the snapshot includes every operation processed so far
+        if not self.snapshots.wait_clean():
+            print("Sending a snapshot that is not up to date")
         try:
-            #open the collada file for reading in binary mode
-            reply_file = open(filename,'rb')
-            #get a fragment (4096 bytes) of the file
-            file_part = reply_file.read(4096)
-            #keep getting fragments and send them as long as there are still bytes to read
-            while file_part:
-                print('sending part...')
-                conn.sendall(file_part)
-                file_part = reply_file.read(4096)
+            reply_file,seq = self.snapshots.open_snapshot(filename)
         except IOError:
             print("File not found")
+            reply_file,seq = None,None
+        
+        if isinstance(conn,transport.Connection):
+            conn.send_message({'action' : 'FILE_BEGIN','extension' : extension,'seq' : seq})
+            if reply_file is not None:
+                file_part = reply_file.read(transport.READ_SIZE)
+                while file_part:
+                    conn.send(file_part,transport.BINARY)
+                    file_part = reply_file.read(transport.READ_SIZE)
+                reply_file.close()
+            conn.send_message({'action' : 'FILE_END','extension' : extension})
+            return
+        
+        try:
+            conn.sendall(transport.pack_header({'seq' : seq}))
+            if reply_file is not None:
+                #get a fragment (4096 bytes) of the file
+                file_part = reply_file.read(4096)
+                #keep getting fragments and send them as long as there are still bytes to read
+                while file_part:
+                    print('sending part...')
+                    conn.sendall(file_part)
+                    file_part = reply_file.read(4096)
+        finally:
+            if reply_file is not None:
+                reply_file.close()
+            conn.close()
+        
+    def send_objects(self,conn,data):
+        '''sends the manifest of the binary snapshot (REQUEST_MANIFEST) or the records of some objects (REQUEST_OBJECTS)
+        
+        Parameters
+        conn      -- a TCP socket object used to connect to a client
+        data      -- a dictionary object that contains information from a client (and the requested 'ids')
+        
+        The manifest lists every object with its name, type, transform and bounding box, so a joining client can show
+        proxies right away and stream the meshes afterwards.
+        '''
+        
+        filename = bpy.context.scene.server_filepath + "/" + data['filename'] + snapshot.EXTENSION
+        if data['action'] == 'REQUEST_MANIFEST':
+            self.snapshots.wait_clean()
+            
+        try:
+            reader = binformat.SnapshotReader(filename)
+            try:
+                if data['action'] == 'REQUEST_MANIFEST':
+                    conn.sendall(bytes(json.dumps(reader.entries),'utf-8'))
+                else:
+                    requested = set(data['ids'])
+                    for entry in reader.entries:
+                        if entry['id'] in requested:
+                            conn.sendall(binformat.pack_object(entry,reader.record(entry)))
+            finally:
+                reader.close()
+        except (IOError,ValueError):
+            print("Snapshot not available for streaming")
             
         conn.close()
         
-    def send_data(self,data,receiver):
+    def send_data(self,data,receiver,reliable_flag=True):
         '''send data to a specific receiver
         
         Parameters
         data -- the data to send in bytes format
         receiver -- a tuple containing the ip address and port of the receiving end
+        reliable_flag -- a boolean value indicating if the data must be delivered (False for heartbeats and previews,
+                         which are superseded by the next ones anyway)
         '''
-    
-        s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        s.connect(receiver)
-        s.sendto(data,receiver)
-        s.close()
         
-    def process_operation(self):
-        '''performs the necessary processing of an operation on the server's instance of the collaborative session
+        #clients using the TCP transport get the data as a frame on their connection, batched with whatever else is queued
+        connection = self.connections.get(receiver)
+        if connection is not None:
+            connection.send(data)
+            return
+        
+        if reliable_flag and self.endpoint.has_peer(receiver):
+            self.endpoint.send(data,receiver)
+            return
         
+        self.servsock.sendto(data,receiver)
+        
+    def start_publisher(self):
+        '''opens the multicast group of the session when the first client asks for it
         
         Return Value
-        conflict_flag      -- a boolean value used to indicate the presence (True) or absence (False) of a conflicting operation (can also be None)
+        success_flag -- a boolean value indicating if operations can be published to the group (True) or not (False)
         '''
-        if not self.inqueue.empty():
-            data = self.inqueue.get()
-            op = data['operation']
+        
+        if self.publisher is None:
+            try:
+                self.publisher = multicast.Publisher(bpy.context.scene.multicast_group,bpy.context.scene.multicast_port,
+                                                     bpy.context.scene.multicast_interface)
+            except OSError:
+                print("Multicast is not available, the operations are sent to every client")
+                return False
+        return True
+        
+    def priority_overrides(self):
+        '''reads the operation classes set in the scene properties
+        
+        Return Value
+        overrides   -- a dict object mapping operation types to class names (empty if the property is not valid json)
+        '''
+        
+        try:
+            overrides = json.loads(bpy.context.scene.priority_classes)
+        except ValueError:
+            print("The operation classes are not valid json, the default classes are used")
+            return {}
+        if not isinstance(overrides,dict):
+            return {}
+        return overrides
+        
+    def publish_leases(self):
+        '''sends the current leases to every client, so they show who holds what and keep away from objects held by others'''
+        
+        data = {'action' : 'LEASES','holders' : self.leases.holders()}
+        message = outbound.Message('LEASES',bytes(json.dumps(data),'utf-8'))
+        for client in self.clients:
+            self.outbound.put(client,message)
+            
+    def reject(self,sender,op,rejected,reason='LEASED'):
+        '''tells a client that its operation was not allowed to edit some objects
+        
+        Parameters
+        sender      -- a tuple containing the ip address and port of the client
+        op          -- a dict object representing the operation as the client sent it
+        rejected    -- a list of the ids of the objects leased by other clients
+        reason      -- a string containing the reason ('LEASED', 'STALE' if the operation is too old to be transformed or
+                       'MISMATCH' if it is a mesh delta made on a mesh with another number of vertices)
+        
+        The client already applied the operation, so it reloads the session to undo the rejected part.
+        '''
+        
+        if reason in ('STALE'):
+            print("Rejected an operation of {0} made before the kept history".format(sender))
+        elif reason in ('MISMATCH'):
+            print("Rejected a mesh delta of {0} made on another number of vertices".format(sender))
+        else:
+            print("Rejected an operation of {0} on objects leased by other clients".format(sender))
+        data = {'action' : 'REJECT','ids' : rejected,'op_id' : op.get('op_id'),'reason' : reason}
+        self.outbound.put(sender,outbound.Message('REJECT',bytes(json.dumps(data),'utf-8'),data))
+        
+    def discard(self,sender,op):
+        '''tells a client that its operation addressed only objects deleted concurrently and was dropped
+        
+        Parameters
+        sender      -- a tuple containing the ip address and port of the client
+        op          -- a dict object representing the operation as the client sent it
+        
+        The client receives the delete as well, so nothing has to be undone, it only stops waiting for the operation.
+        '''
+        
+        data = {'action' : 'DISCARD','op_id' : op.get('op_id')}
+        self.outbound.put(sender,outbound.Message('DISCARD',bytes(json.dumps(data),'utf-8'),data))
+        
+    def notify_evicted(self,sender,data):
+        '''tells a client that is not a member that its data is refused and it has to subscribe again
+        
+        Parameters
+        sender      -- a tuple containing the ip address and port the data was sent from
+        data        -- a dict object containing the refused data
+        
+        Every refused operation is answered with its op id, so the client can send it again once it is back. Other
+        data is answered once per heartbeat interval.
+        '''
+        
+        now = time.time()
+        op_id = None
+        if data['action'] == 'SEND':
+            op_id = data['operation'].get('op_id')
+        if op_id is None and now - self.notified.get(sender,0.0) < bpy.context.scene.heartbeat_interval:
+            return
+        self.notified[sender] = now
+        print("Refused data from {0}, it is not subscribed".format(sender))
+        notice = {'action' : 'RESUBSCRIBE','op_id' : op_id}
+        try:
+            self.servsock.sendto(bytes(json.dumps(notice),'utf-8'),sender)
+        except OSError:
+            pass
             
-            #Operational Transformation goes here
-            target_obj = op['active_object']
-            if "add" in utils.format_op_name(op['name']):
-                op = self.transformer.add(op)
+    def drain(self,receiver):
+        '''checks without waiting if the data sent to a receiver left, so that its outbound queue grows while its link is slow
+        
+        Parameters
+        receiver -- a tuple containing the ip address and port of the receiving end
+        
+        Return Value
+        drained_flag -- a boolean value indicating if the data left (True) or is still being sent (False)
+        '''
+        
+        connection = self.connections.get(receiver)
+        if connection is not None:
+            return connection.flush(0)
+        elif self.endpoint.has_peer(receiver):
+            return self.endpoint.wait_room(receiver,0)
+        return True
             
-            self.execute_operation(op)
+    def heartbeat(self):
+        '''pings the clients every heartbeat interval and evicts the ones that stopped answering (called from the main thread)'''
+        
+        now = time.time()
+        if now - self.last_ping < bpy.context.scene.heartbeat_interval:
+            return
+        self.last_ping = now
+        
+        #senders that were told to subscribe again and went quiet are forgotten
+        for address,notified in list(self.notified.items()):
+            if now - notified > bpy.context.scene.heartbeat_timeout:
+                del self.notified[address]
+        
+        for client in self.clients.evict(bpy.context.scene.heartbeat_timeout):
+            self.interests.remove_client(client)
+            self.endpoint.remove_peer(client)
+            self.group_members.discard(client)
+            self.outbound.remove(client)
+            if self.leases.release_all(client):
+                self.publish_leases()
+            connection = self.connections.pop(client,None)
+            if connection is not None:
+                connection.close()
+            print("Evicted {0}".format(client))
+            
+        ping = {'action' : 'PING','time' : now}
+        if self.publisher is not None:
+            #group members notice a lost datagram at the end of the stream from the announced sequence number
+            ping['group_seq'] = self.publisher.seq
+        message = outbound.Message('PING',bytes(json.dumps(ping),'utf-8'),None,False)
+        for client in self.clients:
+            self.outbound.put(client,message)
+        bpy.context.scene.members = self.clients.to_json()
+        
+    def process_wave(self):
+        '''performs the necessary processing of a wave of operations on the server's instance of the collaborative session
+        
+        
+        Return Value
+        conflict_flag      -- a boolean value used to indicate the presence (True) or absence (False) of a conflicting operation (None if no operation was waiting)
+        
+        The operations of a wave address disjoint objects (see OperationScheduler.get_wave), so their transforms are
+        composed and written as one batch and none of them waits behind an operation it does not conflict with. The
+        vertices of their mesh deltas are moved concurrently in the worker pool. Everything else is applied one at a
+        time on the main thread, blender's data cannot be changed from other threads.
+        '''
+        wave = self.inqueue.get_wave(bpy.context.scene.wave_size)
+        if wave == []:
+            return None
+        
+        admitted = []
+        for data in wave:
+            op = self.admit_operation(data)
+            if op is not None:
+                #a client receives the operation if its interest covers the objects before or after it ran (e.g. moved out of a region, deleted)
+                admitted.append((data,op,self.interests.excluded(op)))
+                
+        batch = [op for data,op,excluded in admitted if self.dec.is_batchable(op)]
+        if batch != []:
+            self.dec.apply_batch(batch)
+        deltas = [op for data,op,excluded in admitted if transformer.op_kind(op) == 'mesh_delta']
+        if deltas != []:
+            self.dec.apply_mesh_deltas(deltas,self.pool)
+            
+        for data,op,excluded in admitted:
+            sender = (data['ip_addr'],data['port'])
+            if not self.dec.is_batchable(op) and transformer.op_kind(op) != 'mesh_delta':
+                self.transformer.prepare(op)
+                self.execute_operation(op)
+            self.transformer.update(op)
+            self.interests.update(op)
+            excluded &= self.interests.excluded(op)
             data['operation'] = op
+            self.sequencer.stamp(data)
+            #keep what the operation deleted, the operations made concurrently are transformed against it
+            self.transformer.record(op,data['seq'],sender)
+            #log the operation as it was applied before anything is sent, so a restart can replay it
+            self.oplog.append(data['seq'],data)
             
-            utils.save_state(bpy.context.scene.server_filepath,bpy.context.scene.session_name)
+            #the snapshot is written by the scheduler once changes settle, not after every operation
+            self.snapshots.mark_dirty(data['seq'])
             #utils.load_state(bpy.context.scene.server_filepath,bpy.context.scene.session_name)
             
-            if not self.outqueue.full():
-                self.outqueue.put(data)
+            self.outqueue.put((data,excluded))
                 
-            return True
+        return True
+        
+    def admit_operation(self,data):
+        '''resolves, filters and transforms a received operation before it is applied
+        
+        Parameters
+        data        -- a dict object containing the received operation
+        
+        Return Value
+        op          -- the operation to apply (None if nothing of it may be applied, its client was told why)
+        '''
+        
+        op = data['operation']
+        
+        #map the ids carried by the operation to the names of the objects in the server's scene
+        self.dec.resolve_targets(op)
+        
+        #objects leased by other clients are left out, most operations touch none and pass unchanged
+        sender = (data['ip_addr'],data['port'])
+        op,rejected = self.leases.filter(op,sender)
+        if rejected != []:
+            self.reject(sender,data['operation'],rejected)
+            if op is None:
+                return None
+        
+        #adjust the operation to the deletes its client had not applied when it was made
+        if self.transformer.stale(op):
+            self.reject(sender,data['operation'],[],'STALE')
+            return None
+        op = self.transformer.transform(op,sender)
+        if op is None:
+            self.discard(sender,data['operation'])
+            return None
+        #offsets made on other vertices would move the wrong ones, so the delta is neither applied nor sent on
+        if transformer.op_kind(op) == 'mesh_delta':
+            obj = bpy.data.objects.get(op['active_object'])
+            if obj is not None and obj.type == 'MESH' and utils.vertex_count(obj) != op['count']:
+                self.reject(sender,data['operation'],[op.get('active_id','')],'MISMATCH')
+                return None
+        if "add" in utils.format_op_name(op['name']):
+            op = self.transformer.add(op)
+        return op
+        
+    def replay(self,records):
+        '''re-applies logged operations to the server's scene after a restart
+        
+        Parameters
+        records     -- a list of (seq, data) tuples from the operation log, in order
+        '''
+        
+        for seq,data in records:
+            op = data['operation']
+            #the logged operations were already transformed, they only need to be executed again
+            self.dec.resolve_targets(op)
+            #an edit mode delete tags the indices before it executes, as in process_wave, so record can read what it removed
+            self.transformer.prepare(op)
+            self.execute_operation(op)
+            self.transformer.update(op)
+            self.transformer.record(op,seq,(data['ip_addr'],data['port']))
+            self.sequencer.seq = seq
+            self.snapshots.mark_dirty(seq)
+            
+        if records != []:
+            print("Replayed {0} operations up to {1}".format(len(records),self.sequencer.seq))
         
     def execute_operation(self,op):
         ''' execute the operation on the server's instance of the collaborative session
@@ -299,20 +925,19 @@ class StartServer(bpy.types.Operator):
         '''
         op_function = getattr(self.dec,utils.format_op_name(op['name']))
         op_function(op)
-        #utils.format_obj_names(".","_")
         
     def broadcast_operation(self,conflict_flag):
-        '''gets an operation from the outqueue and starts a thread for sending data to connected clients
+        '''gets an operation from the outqueue and puts it in the outbound queues of the connected clients
         
         Parameters
         conflict_flag     -- a boolean value that indicates the presence (True) or absence (False) of a conflicting operation
         '''
         if not self.outqueue.empty():
-            data_json = self.outqueue.get()
+            data_json,excluded = self.outqueue.get()
             sender = (data_json['ip_addr'],data_json['port'])
             data = bytes(json.dumps(data_json),'utf-8')
-            t = threading.Thread(target=self.client_thread,args=(data,sender,conflict_flag))
-            t.start()
+            #queuing does not block, every client's sender thread sends its own copies
+            self.client_thread(data,sender,conflict_flag,excluded)
             
                 
 class StopServer(bpy.types.Operator):
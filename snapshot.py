@@ -0,0 +1,294 @@
+import bpy
+import os
+import array
+from mathutils import Matrix
+from . import binformat
+from . import identity
+
+#the extension of binary snapshot files
+EXTENSION = ".clb"
+
+def remove_object(obj):
+    ''' removes an object from the scene and from the blend data, along with its mesh if nothing else uses it
+    
+    Parameters
+    obj          -- the blender object to remove
+    '''
+    
+    data = obj.data
+    if obj.name in bpy.context.scene.objects:
+        bpy.context.scene.objects.unlink(obj)
+    bpy.data.objects.remove(obj)
+    if data is not None and data.users == 0 and isinstance(data,bpy.types.Mesh):
+        bpy.data.meshes.remove(data)
+        
+def mesh_arrays(mesh):
+    ''' copies the geometry of a mesh into flat arrays
+    
+    Parameters
+    mesh         -- a blender mesh
+    
+    Return Value
+    arrays       -- a dict object with the arrays 'verts', 'edges', 'loops', 'loop_starts' and 'loop_totals'
+    '''
+    
+    arrays = {
+        'verts' : array.array('f',[0.0]) * (len(mesh.vertices) * 3),
+        'edges' : array.array('i',[0]) * (len(mesh.edges) * 2),
+        'loops' : array.array('i',[0]) * len(mesh.loops),
+        'loop_starts' : array.array('i',[0]) * len(mesh.polygons),
+        'loop_totals' : array.array('i',[0]) * len(mesh.polygons)
+    }
+    mesh.vertices.foreach_get('co',arrays['verts'])
+    mesh.edges.foreach_get('vertices',arrays['edges'])
+    mesh.loops.foreach_get('vertex_index',arrays['loops'])
+    mesh.polygons.foreach_get('loop_start',arrays['loop_starts'])
+    mesh.polygons.foreach_get('loop_total',arrays['loop_totals'])
+    return arrays
+
+def object_hash(obj,arrays=None):
+    ''' computes a hash of the content of an object (type, transform and mesh geometry)
+    
+    Parameters
+    obj          -- a blender object
+    arrays       -- (optional) the mesh arrays of the object, if they were already copied
+    
+    Return Value
+    digest       -- a string containing the hex digest of the content
+    '''
+    
+    matrix = [value for row in obj.matrix_world for value in row]
+    if obj.type != 'MESH':
+        return binformat.content_hash(obj.type,matrix)
+    if arrays is None:
+        arrays = mesh_arrays(obj.data)
+    return binformat.content_hash(obj.type,matrix,arrays['verts'],arrays['loops'],arrays['loop_totals'])
+
+def gather(obj,hashed=True):
+    ''' collects the toc entry and the mesh record of an object
+    
+    Parameters
+    obj          -- a blender object
+    hashed       -- a boolean value indicating if the content hash is computed here (True) or left to the writer (False)
+    
+    Return Value
+    entry        -- a dict object describing the object
+    record       -- a bytes object containing the packed mesh (None if the object is not a mesh)
+    '''
+    
+    corners = [tuple(corner) for corner in obj.bound_box]
+    entry = {
+        'id' : identity.get_id(obj),
+        'name' : obj.name,
+        'type' : obj.type,
+        'matrix' : [value for row in obj.matrix_world for value in row],
+        'bbox' : [[min(c[i] for c in corners) for i in range(3)],[max(c[i] for c in corners) for i in range(3)]]
+    }
+    
+    if obj.type == 'MESH':
+        arrays = mesh_arrays(obj.data)
+        if hashed:
+            entry['hash'] = object_hash(obj,arrays)
+        record = binformat.pack_mesh(arrays['verts'],arrays['edges'],arrays['loops'],arrays['loop_starts'],arrays['loop_totals'])
+    else:
+        if hashed:
+            entry['hash'] = object_hash(obj)
+        record = None
+        
+    return entry,record
+
+def save(path,name):
+    ''' writes the objects of the scene to a binary snapshot
+    
+    Parameters
+    path         -- a string that contains the filepath to the folder where the file will be saved
+    name         -- a string that contains the filename of the snapshot
+    '''
+    
+    entries,records = collect()
+    write(path,name,entries,records)
+    
+def collect(hashed=True):
+    ''' collects the toc entries and mesh records of the objects of the scene
+    
+    Parameters
+    hashed       -- a boolean value indicating if the content hashes are computed here (see gather)
+    
+    Return Value
+    entries      -- a list of dict objects describing the objects
+    records      -- a list of packed mesh records (None for objects without a mesh)
+    '''
+    
+    entries = []
+    records = []
+    for obj in bpy.context.scene.objects:
+        #objects that do not have an id yet get one here so that clients receive it
+        if identity.get_id(obj) == '':
+            obj[identity.ID_PROPERTY] = identity.new_id()
+        entry,record = gather(obj,hashed)
+        entries.append(entry)
+        records.append(record)
+    return entries,records
+
+def write(path,name,entries,records):
+    ''' writes collected entries and records to a binary snapshot (does not use bpy, so it can run in a thread)
+    
+    Parameters
+    path         -- a string that contains the filepath to the folder where the file will be saved
+    name         -- a string that contains the filename of the snapshot
+    entries      -- a list of dict objects describing the objects
+    records      -- a list of packed mesh records
+    '''
+    
+    output_file = open(path + "/" + name + EXTENSION,'wb')
+    binformat.write_snapshot(output_file,entries,records)
+    output_file.close()
+    
+def build_mesh(name,arrays):
+    ''' creates a mesh from the arrays of a snapshot record
+    
+    Parameters
+    name         -- a string containing the name of the mesh
+    arrays       -- a dict object with the arrays of the record (memoryviews are released afterwards)
+    
+    Return Value
+    mesh         -- the created blender mesh
+    '''
+    
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(arrays['verts']) // 3)
+    mesh.vertices.foreach_set('co',arrays['verts'])
+    mesh.edges.add(len(arrays['edges']) // 2)
+    mesh.edges.foreach_set('vertices',arrays['edges'])
+    mesh.loops.add(len(arrays['loops']))
+    mesh.loops.foreach_set('vertex_index',arrays['loops'])
+    mesh.polygons.add(len(arrays['loop_starts']))
+    mesh.polygons.foreach_set('loop_start',arrays['loop_starts'])
+    mesh.polygons.foreach_set('loop_total',arrays['loop_totals'])
+    mesh.update(calc_edges=True)
+    
+    for view in arrays.values():
+        view.release()
+    return mesh
+    
+def build_object(entry,arrays):
+    ''' creates an object (and its data) from a snapshot entry and links it to the scene
+    
+    Parameters
+    entry        -- a dict object from the toc of the snapshot
+    arrays       -- a dict object with the arrays of the mesh record of the object (None if it has no mesh)
+    
+    Return Value
+    obj          -- the created blender object
+    
+    Meshes, cameras and lamps are recreated (cameras and lamps with default settings); other types become empties.
+    '''
+    
+    if arrays is not None:
+        data = build_mesh(entry['name'],arrays)
+    elif entry['type'] == 'CAMERA':
+        data = bpy.data.cameras.new(entry['name'])
+    elif entry['type'] == 'LAMP':
+        data = bpy.data.lamps.new(entry['name'],'POINT')
+    else:
+        data = None
+        
+    obj = bpy.data.objects.new(entry['name'],data)
+    bpy.context.scene.objects.link(obj)
+    set_matrix(obj,entry)
+    if entry['id'] != '':
+        obj[identity.ID_PROPERTY] = entry['id']
+    return obj
+
+def set_matrix(obj,entry):
+    ''' sets the world matrix of an object from a snapshot entry'''
+    
+    matrix = entry['matrix']
+    obj.matrix_world = Matrix((matrix[0:4],matrix[4:8],matrix[8:12],matrix[12:16]))
+
+def load(path,name,mode='FULL'):
+    ''' loads a binary snapshot into the scene
+    
+    Parameters
+    path         -- a string that contains the filepath of the folder where the file is located
+    name         -- a string that contains the filename of the snapshot
+    mode         -- a string containing the load mode
+                 -- 'FULL' -> remove every object and build the whole snapshot
+                 -- 'DIFF' -> only add, remove or patch the objects that differ from the snapshot
+    
+    Return Value
+    load_flag    -- a boolean value used to indicate whether a file was loaded (True) or not (False)
+    '''
+    
+    filename = path + "/" + name + EXTENSION
+    if not os.path.isfile(filename):
+        return False
+    
+    if bpy.context.mode in ('EDIT_MESH'):
+        bpy.ops.object.editmode_toggle()
+        
+    reader = binformat.SnapshotReader(filename)
+    try:
+        if mode == 'DIFF':
+            diff(reader)
+        else:
+            for obj in list(bpy.context.scene.objects):
+                remove_object(obj)
+            for entry in reader.entries:
+                build_object(entry,reader.mesh(entry))
+    finally:
+        reader.close()
+        
+    return True
+
+def diff(reader,limit=None):
+    ''' applies a snapshot to the scene by changing only the objects that differ from it
+    
+    Parameters
+    reader       -- a SnapshotReader object of the snapshot
+    limit        -- (optional) the share of the objects of the snapshot that may be new or changed
+    
+    Return Value
+    diff_flag    -- a boolean value indicating whether the snapshot was applied (False if more objects than the limit
+                    allows differ, the scene is left untouched then)
+    
+    Objects are matched by id and compared by content hash; only the records of new or changed objects are read.
+    '''
+    
+    toc = {}
+    for entry in reader.entries:
+        if entry['id'] != '':
+            toc[entry['id']] = entry
+            
+    local = {}
+    removed = []
+    for obj in list(bpy.context.scene.objects):
+        obj_id = identity.get_id(obj)
+        if obj_id in toc:
+            local[obj_id] = obj
+        else:
+            removed.append(obj)
+            
+    changed = [entry for entry in reader.entries if entry['id'] not in local or object_hash(local[entry['id']]) != entry['hash']]
+    if limit is not None and len(changed) > len(reader.entries) * limit:
+        return False
+    
+    for obj in removed:
+        remove_object(obj)
+    for entry in changed:
+        obj = local.get(entry['id'])
+        if obj is None:
+            build_object(entry,reader.mesh(entry))
+            continue
+        arrays = reader.mesh(entry)
+        if arrays is not None and obj.type == 'MESH':
+            old_mesh = obj.data
+            obj.data = build_mesh(entry['name'],arrays)
+            if old_mesh.users == 0:
+                bpy.data.meshes.remove(old_mesh)
+        elif arrays is not None:
+            for view in arrays.values():
+                view.release()
+        set_matrix(obj,entry)
+        obj.name = entry['name']
+    return True
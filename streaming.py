@@ -0,0 +1,253 @@
+import bpy
+import json
+import socket
+import threading
+import time
+from . import binformat
+from . import snapshot
+from . import identity
+
+#the name of the custom property that marks an object as a proxy waiting for its data
+PROXY_PROPERTY = "collab_proxy"
+#the number of seconds the fetcher waits before the first retry when the server cannot be reached, doubled up to RETRY_MAX
+RETRY_DELAY = 0.5
+RETRY_MAX = 8.0
+
+class StreamLoader:
+    '''builds proxies from the snapshot manifest of the server and replaces them with full objects in the background
+    
+    Attributes
+    server_address  -- a tuple containing the ip address and port of the server
+    address         -- a tuple containing the ip address and port assigned to this client by the server
+    session         -- a string containing the name of the session
+    pending         -- a dict object that maps the ids of objects that are still proxies to their manifest entries
+    proxies         -- a dict object that maps the ids of pending objects to the names of their proxies
+    order           -- a list of ids of pending objects, most important first (updated on the main thread)
+    received        -- a list of (entry, record) tuples fetched but not yet built
+    lock            -- a threading.Lock object guarding order and received
+    batch_size      -- the number of objects requested from the server at a time
+    builds_per_tick -- the maximum number of objects built on the main thread per tick
+    running         -- a boolean value indicating if the fetching thread should keep running
+    '''
+    
+    def __init__(self,server_address,address,session,batch_size=8,builds_per_tick=4):
+        self.server_address = server_address
+        self.address = address
+        self.session = session
+        self.pending = {}
+        self.proxies = {}
+        self.order = []
+        self.received = []
+        self.lock = threading.Lock()
+        self.batch_size = batch_size
+        self.builds_per_tick = builds_per_tick
+        self.running = False
+        
+    def request(self,request):
+        '''sends a request to the server and reads the reply until the server closes the connection
+        
+        Parameters
+        request     -- a dict object containing the request
+        
+        Return Value
+        reply       -- a bytes object containing the whole reply
+        '''
+        
+        requester = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        requester.connect(self.server_address)
+        request['ip_addr'] = self.address[0]
+        request['port'] = self.address[1]
+        request['filename'] = self.session
+        requester.sendall(bytes(json.dumps(request),'utf-8'))
+        
+        parts = []
+        part = requester.recv(65536)
+        while part:
+            parts.append(part)
+            part = requester.recv(65536)
+        requester.close()
+        return b''.join(parts)
+    
+    def build_proxies(self):
+        '''clears the scene and creates one proxy per object of the manifest, so the scene is usable right away
+        
+        Return Value
+        load_flag   -- a boolean value indicating whether a manifest was received (True) or not (False)
+        '''
+        
+        try:
+            entries = json.loads(self.request({'action' : 'REQUEST_MANIFEST'}).decode('utf-8'))
+        except ValueError:
+            return False
+        
+        if bpy.context.mode in ('EDIT_MESH'):
+            bpy.ops.object.editmode_toggle()
+        for obj in list(bpy.context.scene.objects):
+            snapshot.remove_object(obj)
+            
+        for entry in entries:
+            #objects without a mesh are complete with their entry alone
+            if entry['type'] != 'MESH':
+                snapshot.build_object(entry,None)
+                continue
+            proxy = bpy.data.objects.new(entry['name'],None)
+            bpy.context.scene.objects.link(proxy)
+            snapshot.set_matrix(proxy,entry)
+            #draw the proxy as a box as large as the bounding box of the object
+            low,high = entry['bbox']
+            proxy.empty_draw_type = 'CUBE'
+            proxy.empty_draw_size = max(max(abs(low[i]),abs(high[i])) for i in range(3)) or 1.0
+            proxy[identity.ID_PROPERTY] = entry['id']
+            proxy[PROXY_PROPERTY] = 1
+            self.pending[entry['id']] = entry
+            self.proxies[entry['id']] = proxy.name
+            
+        self.order = list(self.pending.keys())
+        return True
+    
+    def start(self):
+        '''starts fetching the data of the proxies in the background'''
+        
+        self.running = True
+        fetcher = threading.Thread(target=self.fetch_thread,args=())
+        fetcher.start()
+        
+    def stop(self):
+        '''stops fetching (objects that are still proxies stay proxies)'''
+        self.running = False
+        
+    def fetch_thread(self):
+        '''a thread function that requests the most important pending objects from the server, one batch at a time'''
+        
+        requested = set()
+        delay = RETRY_DELAY
+        while self.running:
+            with self.lock:
+                batch = [obj_id for obj_id in self.order if obj_id not in requested][:self.batch_size]
+            if batch == []:
+                break
+            try:
+                reply = self.request({'action' : 'REQUEST_OBJECTS','ids' : batch})
+            except OSError:
+                #the batch stays pending and is requested again once the server answers
+                print("The server cannot be reached, streaming again in {0} seconds".format(delay))
+                self.wait(delay)
+                delay = min(delay * 2,RETRY_MAX)
+                continue
+            delay = RETRY_DELAY
+            requested.update(batch)
+            objects = binformat.unpack_objects(reply)
+            with self.lock:
+                self.received.extend(objects)
+        self.running = False
+        
+    def wait(self,delay):
+        '''sleeps for a number of seconds, waking up early if the loader is stopped'''
+        
+        end = time.time() + delay
+        while self.running and time.time() < end:
+            time.sleep(min(0.1,end - time.time()))
+            
+    def prioritize(self):
+        '''orders the pending objects: selected proxies first, then by distance to the center of the 3D view'''
+        
+        view_location = None
+        for area in bpy.context.screen.areas:
+            if area.type == 'VIEW_3D':
+                view_location = area.spaces.active.region_3d.view_location
+                break
+            
+        selected = set()
+        for obj in bpy.context.selected_objects:
+            if obj.get(PROXY_PROPERTY):
+                selected.add(identity.get_id(obj))
+                
+        priorities = []
+        for obj_id in self.pending:
+            obj = self.find_proxy(obj_id)
+            if obj is None:
+                continue
+            if view_location is not None:
+                distance = (obj.matrix_world.to_translation() - view_location).length
+            else:
+                distance = 0.0
+            priorities.append((obj_id not in selected,distance,obj_id))
+        priorities.sort()
+        
+        with self.lock:
+            self.order = [priority[2] for priority in priorities]
+            
+    def tick(self):
+        '''updates priorities and replaces a few proxies with their fetched objects (called from the main thread)
+        
+        Return Value
+        done_flag   -- a boolean value indicating if every proxy has been replaced (True) or not (False)
+        '''
+        
+        if self.pending == {}:
+            return True
+        self.prioritize()
+        
+        with self.lock:
+            ready = self.received[:self.builds_per_tick]
+            del self.received[:self.builds_per_tick]
+            
+        for entry,record in ready:
+            self.replace_proxy(entry,record)
+        
+        #ids that the server no longer has are dropped once the fetcher is done
+        if not self.running and self.received == []:
+            for obj_id in list(self.pending.keys()):
+                self.pending.pop(obj_id)
+        return self.pending == {}
+    
+    def find_proxy(self,obj_id):
+        '''gets the proxy of a pending object
+        
+        Parameters
+        obj_id      -- a string containing the id of the object
+        
+        Return Value
+        proxy       -- the proxy object (None if it was deleted)
+        '''
+        
+        proxy = bpy.data.objects.get(self.proxies.get(obj_id,''))
+        if proxy is not None and identity.get_id(proxy) == obj_id:
+            return proxy
+        
+        #the proxy was renamed, so it is looked up by id
+        for obj in bpy.context.scene.objects:
+            if identity.get_id(obj) == obj_id:
+                self.proxies[obj_id] = obj.name
+                return obj
+        return None
+    
+    def replace_proxy(self,entry,record):
+        '''replaces a proxy with the full object
+        
+        Parameters
+        entry       -- a dict object describing the object
+        record      -- a bytes object containing its mesh record
+        '''
+        
+        if self.pending.pop(entry['id'],None) is None:
+            return
+        
+        proxy = self.find_proxy(entry['id'])
+        self.proxies.pop(entry['id'],None)
+        if proxy is None:
+            #the proxy was deleted in the meantime
+            return
+        
+        #the proxy keeps any change made to it while it was loading (e.g. a move or a rename)
+        entry['name'] = proxy.name
+        entry['matrix'] = [value for row in proxy.matrix_world for value in row]
+        selected = proxy.select
+        snapshot.remove_object(proxy)
+        
+        if record != b'':
+            arrays = binformat.unpack_mesh(record)
+        else:
+            arrays = None
+        obj = snapshot.build_object(entry,arrays)
+        obj.select = selected
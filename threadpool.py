@@ -0,0 +1,78 @@
+'''a fixed number of worker threads taking tasks from a work queue
+
+This module does not depend on bpy. The server hands control requests (subscriptions, file requests, ...) and the
+sending of the clients' outbound queues to the pool, so no thread is created per request or per broadcast and the
+number of threads stays the same under load.
+'''
+
+import threading
+from collections import deque
+
+class ThreadPool:
+
+    '''
+    Attributes
+    size        -- the number of worker threads
+    max_pending -- the number of tasks that may wait, submit refuses more
+    tasks       -- a deque of (function, arguments) tuples waiting for a worker
+    condition   -- a threading.Condition object guarding the tasks, idle workers wait on it
+    running     -- a boolean value indicating if the workers should keep taking tasks
+    workers     -- a list of the worker Thread objects
+    '''
+
+    def __init__(self,size=8,max_pending=1024):
+        self.size = max(1,size)
+        self.max_pending = max_pending
+        self.tasks = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.workers = []
+        for i in range(self.size):
+            t = threading.Thread(target=self.worker_thread,args=(),daemon=True)
+            t.start()
+            self.workers.append(t)
+
+    def submit(self,function,*args):
+        '''queues a task, this never blocks
+
+        Parameters
+        function    -- the function to call on a worker thread
+        args        -- the arguments of the function
+
+        Return Value
+        queued_flag -- a boolean value indicating if the task was queued (True) or refused because the pool is
+                       stopped or too many tasks wait (False)
+        '''
+
+        with self.condition:
+            if not self.running or len(self.tasks) >= self.max_pending:
+                return False
+            self.tasks.append((function,args))
+            self.condition.notify()
+            return True
+
+    def pending(self):
+        '''gets the number of tasks waiting for a worker'''
+        return len(self.tasks)
+
+    def worker_thread(self):
+        '''runs the queued tasks until the pool is shut down (thread function)'''
+        while True:
+            with self.condition:
+                while self.tasks == deque() and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                function,args = self.tasks.popleft()
+            try:
+                function(*args)
+            except Exception as error:
+                #a failing task must not take its worker down with it
+                print("Task {0} failed: {1}".format(getattr(function,'__name__',function),error))
+
+    def shutdown(self):
+        '''stops the workers once their current tasks finish, the tasks still waiting are dropped'''
+        with self.condition:
+            self.running = False
+            self.tasks.clear()
+            self.condition.notify_all()
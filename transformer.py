@@ -1,6 +1,289 @@
 import bpy
+import bmesh
+import bisect
+from collections import deque
+from . import utils
+from . import registry
+from . import meshdelta
+
+#the element lists of an edit mode operation, in the order of the index layers
+ELEMENTS = ('verts','edges','faces')
+#an int layer numbering the elements of a mesh, the survivors of a delete still carry their old indices
+INDEX_LAYER = 'collab_index'
+#the number of effects kept to transform operations made before them
+HISTORY = 256
+
+def op_kind(op):
+    '''gets the method name of an operation (see utils.format_op_name)'''
+    return utils.format_op_name(op['name'])
+
+def remap_indices(indices,removed):
+    '''maps element indices across a delete, the elements after a removed one move down to close the gap
+    
+    Parameters
+    indices     -- a list of element indices from before the delete
+    removed     -- a sorted list of the indices of the removed elements
+    
+    Return Value
+    remapped    -- a list of the indices of the remaining elements after the delete (removed ones are left out)
+    '''
+    
+    if removed == []:
+        return list(indices)
+    removed_set = set(removed)
+    return [index - bisect.bisect_left(removed,index) for index in indices if index not in removed_set]
+
+def open_bmesh(obj):
+    '''gets a bmesh of a mesh object, the live one if the object is in edit mode'''
+    if obj.mode == 'EDIT':
+        return bmesh.from_edit_mesh(obj.data)
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    return bm
+
+def close_bmesh(obj,bm,changed_flag):
+    '''writes back (if changed) and frees a bmesh returned by open_bmesh'''
+    if obj.mode == 'EDIT':
+        if changed_flag:
+            bmesh.update_edit_mesh(obj.data)
+        return
+    if changed_flag:
+        bm.to_mesh(obj.data)
+    bm.free()
+
+def element_counts(obj):
+    '''gets the number of vertices, edges and faces of a mesh object as a tuple'''
+    bm = open_bmesh(obj)
+    counts = (len(bm.verts),len(bm.edges),len(bm.faces))
+    close_bmesh(obj,bm,False)
+    return counts
+
+def tag_indices(obj):
+    '''stores the index of every element of a mesh object in its index layer
+    
+    Return Value
+    counts      -- a tuple containing the number of vertices, edges and faces that were tagged
+    '''
+    
+    bm = open_bmesh(obj)
+    counts = []
+    for elements in (bm.verts,bm.edges,bm.faces):
+        layer = elements.layers.int.get(INDEX_LAYER)
+        if layer is None:
+            layer = elements.layers.int.new(INDEX_LAYER)
+        elements.index_update()
+        for element in elements:
+            element[layer] = element.index
+        counts.append(len(elements))
+    close_bmesh(obj,bm,True)
+    return tuple(counts)
+
+def read_removed(obj,counts,clear_flag=False):
+    '''finds the elements removed since a mesh object was tagged by tag_indices
+    
+    Parameters
+    obj         -- the tagged mesh object
+    counts      -- the tuple returned by tag_indices
+    clear_flag  -- a boolean value indicating if the index layer is removed afterwards
+    
+    Return Value
+    removed     -- a dict object mapping ELEMENTS to sorted lists of the tagged indices that no longer exist (None if
+                   the object was not tagged)
+    '''
+    
+    bm = open_bmesh(obj)
+    removed = {}
+    for key,elements,count in zip(ELEMENTS,(bm.verts,bm.edges,bm.faces),counts):
+        layer = elements.layers.int.get(INDEX_LAYER)
+        if layer is None:
+            removed = None
+            break
+        kept = set(element[layer] for element in elements)
+        removed[key] = [index for index in range(count) if index not in kept]
+        if clear_flag:
+            elements.layers.int.remove(layer)
+    close_bmesh(obj,bm,clear_flag)
+    return removed
+
+class Effect:
+
+    '''
+    What an executed operation did that changes how later operations address objects and elements
+    
+    Attributes
+    seq         -- the sequence number of the operation (None for a local operation the server has not ordered yet)
+    sender      -- a tuple containing the ip address and port of the client that sent the operation
+    op_id       -- the id the sending client gave to the operation
+    obj_id      -- the id of the object whose elements were removed ('' if it has none)
+    obj_name    -- the name of the object whose elements were removed ('' if no elements were removed)
+    removed     -- a dict object mapping ELEMENTS to sorted lists of the removed indices (None if no elements were removed)
+    deleted_ids -- a set object containing the ids of the deleted objects
+    deleted_names -- a set object containing the names of the deleted objects
+    '''
+    
+    def __init__(self,seq=None,sender=None,op_id=None):
+        self.seq = seq
+        self.sender = sender
+        self.op_id = op_id
+        self.obj_id = ''
+        self.obj_name = ''
+        self.removed = None
+        self.deleted_ids = set()
+        self.deleted_names = set()
+    
+    def empty(self):
+        return self.removed is None and self.deleted_names == set()
+    
+    def edits(self,op):
+        '''checks if an edit mode operation addresses the elements of the object this effect removed elements from'''
+        if self.removed is None or (op.get('mode') != 'EDIT_MESH' and op_kind(op) != 'mesh_delta'):
+            return False
+        if op.get('active_id','') != '' and self.obj_id != '':
+            return op['active_id'] == self.obj_id
+        return op.get('active_object') == self.obj_name
+    
+    def deletes(self,name,obj_id):
+        '''checks if this effect deleted an object (by id, names only stand in for objects without an id)'''
+        if obj_id != '':
+            return obj_id in self.deleted_ids
+        return name in self.deleted_names
+    
+    def transform(self,op):
+        '''adjusts an operation made without knowing this effect so that it addresses the same objects and elements
+        
+        Parameters
+        op          -- a dict object representing an operation concurrent with this effect
+        
+        Return Value
+        op          -- the transformed operation (None if everything it addressed was deleted)
+        '''
+        
+        kind = op_kind(op)
+        if self.edits(op) and kind == 'mesh_delta':
+            return meshdelta.remap(op,self.removed['verts'])
+        if self.edits(op):
+            op = dict(op)
+            for key in ELEMENTS:
+                op[key] = remap_indices(op.get(key,[]),self.removed[key])
+            return op
+        
+        if self.deleted_names == set():
+            return op
+        if kind.startswith('add'):
+            #an add only uses the selection to know what to deselect, it creates its object anyway
+            return op
+        
+        op = dict(op)
+        target_ids = op.get('target_ids') or []
+        if len(target_ids) != len(op['targets']):
+            target_ids = [''] * len(op['targets'])
+        targets = []
+        ids = []
+        for name,obj_id in zip(op['targets'],target_ids):
+            if self.deletes(name,obj_id):
+                continue
+            targets.append(name)
+            ids.append(obj_id)
+        
+        if self.deletes(op['active_object'],op.get('active_id','')):
+            #the elements of a deleted object cannot be edited, and an empty selection of objects does nothing
+            if op['mode'] != 'OBJECT' or targets == []:
+                return None
+            op['active_object'],op['active_id'] = targets[0],ids[0]
+        if targets == [] and op['targets'] != []:
+            return None
+        op['targets'] = targets
+        if 'target_ids' in op:
+            op['target_ids'] = ids
+        return op
+    
+    def include(self,other):
+        '''transforms this effect of a pending local operation to follow an effect ordered before it
+        
+        Parameters
+        other       -- an Effect object of a remote operation, its removed indices address the elements before this effect
+        
+        Return Value
+        other       -- an Effect object of the remote operation whose removed indices address the elements after this effect
+        
+        Both deletes removed indices of the same elements, so each one's indices are mapped across the other.
+        '''
+        
+        if self.removed is None or other.removed is None or self.obj_id != other.obj_id or self.obj_name != other.obj_name:
+            return other
+        followed = Effect(other.seq,other.sender,other.op_id)
+        followed.obj_id,followed.obj_name = other.obj_id,other.obj_name
+        followed.removed = dict((key,remap_indices(other.removed[key],self.removed[key])) for key in ELEMENTS)
+        self.removed = dict((key,remap_indices(self.removed[key],other.removed[key])) for key in ELEMENTS)
+        return followed
+
+def effect_of(op,removed=None,seq=None,sender=None):
+    '''gets the effect of an executed operation
+    
+    Parameters
+    op          -- a dict object representing the operation
+    removed     -- (optional) a dict object mapping ELEMENTS to the indices an edit mode delete removed, read from the
+                   operation if not given
+    seq         -- (optional) the sequence number the server gave to the operation
+    sender      -- (optional) a tuple containing the ip address and port of the client that sent the operation
+    
+    Return Value
+    effect      -- an Effect object
+    '''
+    
+    effect = Effect(seq,sender,op.get('op_id'))
+    kind = op_kind(op)
+    if kind == 'delete':
+        if op['mode'] == 'OBJECT':
+            target_ids = op.get('target_ids') or []
+            effect.deleted_ids = set(target_ids) - set([''])
+            effect.deleted_names = set(op['targets'])
+        else:
+            if removed is None:
+                removed = op.get('removed')
+            if removed is not None:
+                effect.obj_id = op.get('active_id','')
+                effect.obj_name = op['active_object']
+                effect.removed = removed
+    return effect
+
+def transform(op,effects):
+    '''transforms an operation against effects it did not know of, in their order
+    
+    Return Value
+    op          -- the transformed operation (None if nothing of it is left to apply)
+    '''
+    
+    for effect in effects:
+        op = effect.transform(op)
+        if op is None:
+            break
+    return op
 
 class Transformer:
+
+    '''
+    Attributes
+    names        -- a NameRegistry object that indexes the names of the objects in the server's scene
+    history      -- a deque of the Effect objects of the latest processed operations that had any, oldest first
+    floor        -- the sequence number up to which effects are no longer kept, earlier operations cannot be transformed
+    prepared     -- a tuple (kind, data) of what was captured before the current operation executed (None if nothing)
+    '''
+    
+    def __init__(self):
+        self.names = registry.NameRegistry()
+        self.history = deque()
+        self.floor = 0
+        self.prepared = None
+    
+    def load(self):
+        '''rebuilds the name index from the objects in the scene (e.g. after a snapshot is loaded)'''
+        self.names.rebuild(bpy.data.objects.keys())
+    
+    def start(self,seq):
+        '''forgets the effects, operations made before a sequence number (e.g. of a loaded checkpoint) cannot be transformed'''
+        self.history.clear()
+        self.floor = seq
     
     def add(self,op):
         '''transformation function for conflicting object names
@@ -14,20 +297,105 @@ class Transformer:
         
         '''
         
-        obj_name = op['active_object']
-        
-        if obj_name in bpy.data.objects:
-            #modify the name of the object
-            
-            obj_type = obj_name.split(".")[0]
-            new_name = obj_type
-            num_id = 1
-            while new_name in bpy.data.objects:
-                new_name = obj_type + "." + str(num_id).zfill(3)
-                num_id += 1
-
-            op['active_object'] = new_name
+        #get the requested name if it is free, otherwise the next free numbered name of the same type (e.g. Cube.004)
+        op['active_object'] = self.names.allocate(op['active_object'])
             
         return op
-            
-            
\ No newline at end of file
+    
+    def stale(self,op):
+        '''checks if an operation was made on a version older than the kept effects
+        
+        The version vector of an operation is its 'base_seq' (the last server operation its client had applied) and its
+        'op_id' (the number of operations its client sent before). Operations without a base are not transformed.
+        '''
+        
+        return op.get('base_seq') is not None and op['base_seq'] < self.floor
+    
+    def concurrent(self,op,sender):
+        '''lists the effects of the processed operations an operation was made without
+        
+        Parameters
+        op          -- a dict object representing a received operation
+        sender      -- a tuple containing the ip address and port of the client that sent it
+        
+        Return Value
+        effects     -- a list of Effect objects, oldest first
+        '''
+        
+        base_seq = op.get('base_seq')
+        if base_seq is None:
+            return []
+        op_id = op.get('op_id')
+        effects = []
+        for effect in self.history:
+            if effect.seq <= base_seq:
+                continue
+            #the sender's own operations are known to it, unless it made them after this one (the server reordered them)
+            if effect.sender == sender and (op_id is None or effect.op_id is None or effect.op_id < op_id):
+                continue
+            effects.append(effect)
+        return effects
+    
+    def transform(self,op,sender):
+        '''transforms a received operation against the processed operations its client did not know of
+        
+        Parameters
+        op          -- a dict object representing the operation with resolved targets
+        sender      -- a tuple containing the ip address and port of the client that sent it
+        
+        Return Value
+        op          -- the transformed operation (None if everything it addressed was deleted)
+        '''
+        
+        return transform(op,self.concurrent(op,sender))
+    
+    def prepare(self,op):
+        '''captures what is needed to find the effect of an operation, right before it executes
+        
+        Parameters
+        op           -- a dictionary object representing the operation about to execute
+        '''
+        
+        self.prepared = None
+        kind = op_kind(op)
+        if kind == 'delete' and op['mode'] == 'EDIT_MESH':
+            obj = bpy.data.objects.get(op['active_object'])
+            if obj is not None and obj.type == 'MESH':
+                self.prepared = ('INDICES',(obj,tag_indices(obj)))
+    
+    def record(self,op,seq,sender):
+        '''keeps the effect of an executed operation, so operations made without it can be transformed
+        
+        Parameters
+        op           -- a dictionary object representing the executed operation, an edit mode delete gets the indices it
+                        removed as 'removed' so clients can transform their pending operations the same way
+        seq          -- the sequence number given to the operation
+        sender       -- a tuple containing the ip address and port of the client that sent it
+        '''
+        
+        removed = None
+        if self.prepared is not None:
+            kind,data = self.prepared
+            self.prepared = None
+            if kind == 'INDICES':
+                obj,counts = data
+                removed = read_removed(obj,counts,True)
+                if removed is not None:
+                    op['removed'] = removed
+        
+        effect = effect_of(op,removed,seq,sender)
+        if effect.empty():
+            return
+        self.history.append(effect)
+        while len(self.history) > HISTORY:
+            self.floor = self.history.popleft().seq
+    
+    def update(self,op):
+        '''updates the name index with the effects of an executed operation
+        
+        Parameters
+        op           -- a dictionary object representing the executed operation
+        '''
+        
+        #only the names touched by the operation can have been added or removed
+        self.names.sync(op['targets'] + [op['active_object']],bpy.data.objects)
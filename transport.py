@@ -0,0 +1,200 @@
+'''a persistent TCP connection carrying length-prefixed frames
+
+This module does not depend on bpy. With the TCP transport a client keeps one connection to the server for the
+whole session, and operations, acknowledgements, heartbeats, control requests and file chunks all travel over it.
+
+A connection starts with the 4 bytes of HANDSHAKE sent by the client, then both sides exchange frames.
+
+Frame (little-endian)
+header     -- payload length (uint32), kind (uint8)
+payload    -- a utf-8 json message (MESSAGE) or raw bytes (BINARY, e.g. a chunk of a file)
+'''
+
+import json
+import socket
+import struct
+import threading
+
+HANDSHAKE = b'CLBT'
+FRAME = struct.Struct('<IB')
+MESSAGE = 0
+BINARY = 1
+#frames larger than this are treated as a corrupt stream
+MAX_FRAME = 1 << 26
+#the number of bytes read from the socket at a time
+READ_SIZE = 1 << 16
+
+def is_framed(first_byte):
+    '''checks if a new connection speaks the framed protocol, the one-shot requests are plain json and start with "{"'''
+    return first_byte == HANDSHAKE[:1]
+
+def pack_header(data):
+    '''encodes the header of a one-shot file reply, a line of json sent before the file'''
+    return bytes(json.dumps(data) + "\n",'utf-8')
+
+def read_header(sock):
+    '''reads the header of a one-shot file reply
+
+    Parameters
+    sock        -- the connected TCP socket object the reply arrives on
+
+    Return Value
+    header      -- a dict object containing the header (empty if the connection closed before a whole line arrived)
+    rest        -- a bytes object containing the part of the file received along with the header
+    '''
+
+    received = b''
+    while b'\n' not in received:
+        part = sock.recv(READ_SIZE)
+        if not part:
+            return {},received
+        received += part
+    line,rest = received.split(b'\n',1)
+    return json.loads(line.decode('utf-8')),rest
+
+class Connection:
+
+    '''
+    Attributes
+    sock        -- the connected TCP socket object (Nagle's algorithm disabled)
+    outgoing    -- a list of frames waiting to be written
+    condition   -- a threading.Condition object guarding the outgoing frames
+    buffer      -- a bytearray of received bytes that do not form a whole frame yet
+    closed      -- a boolean value indicating if the connection was closed
+    writing     -- a boolean value indicating if the writer is sending a batch
+    writer      -- a Thread object that writes the outgoing frames, everything queued since its last write goes out
+                   in a single send
+
+    The side that opened the connection (initiate=True) sends the handshake.
+    '''
+
+    def __init__(self,sock,initiate=False):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        self.outgoing = []
+        if initiate:
+            self.outgoing.append(HANDSHAKE)
+        self.condition = threading.Condition()
+        self.buffer = bytearray()
+        self.closed = False
+        self.writing = False
+        self.writer = threading.Thread(target=self.write_thread,args=(),daemon=True)
+        self.writer.start()
+
+    def send(self,payload,kind=MESSAGE):
+        '''queues a frame for writing
+
+        Parameters
+        payload     -- a bytes object
+        kind        -- the kind of the frame (MESSAGE or BINARY)
+        '''
+
+        with self.condition:
+            if self.closed:
+                return
+            self.outgoing.append(FRAME.pack(len(payload),kind))
+            self.outgoing.append(payload)
+            self.condition.notify()
+
+    def send_message(self,data):
+        '''queues a json message'''
+        self.send(bytes(json.dumps(data),'utf-8'))
+
+    def sendall(self,data):
+        '''queues an encoded json message, so a connection can answer where a one-shot socket answered before'''
+        self.send(data)
+
+    def write_thread(self):
+        '''writes the queued frames in batches until the connection is closed (thread function)'''
+        while True:
+            with self.condition:
+                while self.outgoing == [] and not self.closed:
+                    self.condition.wait()
+                if self.outgoing == [] and self.closed:
+                    return
+                batch = b''.join(self.outgoing)
+                self.outgoing = []
+                self.writing = True
+            try:
+                self.sock.sendall(batch)
+            except OSError:
+                self.close()
+                return
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def flush(self,timeout=5.0):
+        '''waits until the queued frames are written
+        
+        Return Value
+        flushed_flag -- a boolean value indicating if everything was written (True) or the wait timed out (False)
+        '''
+        with self.condition:
+            return self.condition.wait_for(lambda: (self.outgoing == [] and not self.writing) or self.closed,timeout)
+
+    def accept(self):
+        '''reads the handshake of the other side
+
+        Return Value
+        valid_flag  -- a boolean value indicating if the connection started with the handshake (True) or not (False)
+        '''
+
+        while len(self.buffer) < len(HANDSHAKE):
+            chunk = self.sock.recv(READ_SIZE)
+            if not chunk:
+                return False
+            self.buffer.extend(chunk)
+        valid_flag = bytes(self.buffer[:len(HANDSHAKE)]) == HANDSHAKE
+        del self.buffer[:len(HANDSHAKE)]
+        return valid_flag
+
+    def receive(self):
+        '''reads the next frame
+
+        Return Value
+        frame       -- a tuple (kind, payload), None if the connection was closed or the stream is corrupt
+        '''
+
+        while True:
+            if len(self.buffer) >= FRAME.size:
+                length,kind = FRAME.unpack_from(self.buffer,0)
+                if length > MAX_FRAME:
+                    return None
+                if len(self.buffer) >= FRAME.size + length:
+                    payload = bytes(self.buffer[FRAME.size:FRAME.size + length])
+                    del self.buffer[:FRAME.size + length]
+                    return kind,payload
+            chunk = self.sock.recv(READ_SIZE)
+            if not chunk:
+                return None
+            self.buffer.extend(chunk)
+
+    def receive_message(self):
+        '''reads the next json message, skipping stray binary frames
+
+        Return Value
+        data        -- a dict object, None if the connection was closed
+        '''
+
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return None
+            kind,payload = frame
+            if kind == MESSAGE:
+                return json.loads(payload.decode('utf-8'))
+
+    def close(self):
+        '''stops the writer and closes the socket'''
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -1,5 +1,6 @@
 import bpy
 import socket
+import json
 
 class CollaborationPanel(bpy.types.Panel):
     
@@ -34,6 +35,45 @@ class CollaborationPanel(bpy.types.Panel):
             #a number field that updates bpy.context.scene.server_port 
             row.prop(bpy.context.scene,"server_port",text="Port")
             row = layout.row()
+            row.prop(sceneprops,"sync_interval",text="Sync Interval")
+            row = layout.row()
+            row.prop(sceneprops,"load_mode",text="Loading")
+            row = layout.row()
+            row.prop(sceneprops,"join_mode",text="Join")
+            row = layout.row()
+            row.prop(sceneprops,"transport",text="Transport")
+            row = layout.row()
+            row.prop(sceneprops,"live_preview",text="Live Preview")
+            if sceneprops.live_preview == True:
+                row.prop(sceneprops,"preview_rate",text="Rate")
+            row = layout.row()
+            row.prop(sceneprops,"interest_mode",text="Interest")
+            if sceneprops.interest_mode == "CUSTOM":
+                row = layout.row()
+                #a button that calls bpy.ops.development.follow_selection()
+                row.operator("development.follow_selection")
+                row = layout.row()
+                row.prop(sceneprops,"interest_collections",text="Groups")
+                row = layout.row()
+                row.prop(sceneprops,"interest_use_region",text="Region")
+                if sceneprops.interest_use_region == True:
+                    row = layout.row()
+                    row.prop(sceneprops,"interest_min",text="Min")
+                    row.prop(sceneprops,"interest_max",text="Max")
+            row = layout.row()
+            row.prop(sceneprops,"lease_renew",text="Lease Renewal")
+            if bpy.context.scene.modal_flag == True:
+                try:
+                    held = json.loads(sceneprops.leases)
+                except ValueError:
+                    held = []
+                box = layout.box()
+                box.label(text="EDITING : " + str(len(held)))
+                for lease in held:
+                    row = box.row()
+                    row.label(text=lease['name'])
+                    row.label(text=lease['holder'])
+            row = layout.row()
             #a button that calls bpy.ops.development.start_session()
             row.operator("development.start_session")
             row = layout.row()
@@ -56,6 +96,62 @@ class CollaborationPanel(bpy.types.Panel):
             row = layout.row()
             row.prop(sceneprops,"server_filepath",text="Filepath")
             row = layout.row()
+            row.prop(sceneprops,"sequencing",text="Order Operations")
+            row = layout.row()
+            row.prop(sceneprops,"snapshot_format",text="Snapshot")
+            row = layout.row()
+            row.prop(sceneprops,"snapshot_quiet",text="Quiet Period")
+            row.prop(sceneprops,"snapshot_max_interval",text="Max Interval")
+            row = layout.row()
+            row.prop(sceneprops,"worker_processes",text="Workers")
+            row.prop(sceneprops,"worker_threads",text="Threads")
+            row = layout.row()
+            row.prop(sceneprops,"heartbeat_interval",text="Heartbeat")
+            row.prop(sceneprops,"heartbeat_timeout",text="Timeout")
+            row = layout.row()
+            row.prop(sceneprops,"outbound_length",text="Max Queue")
+            row.prop(sceneprops,"outbound_lag",text="Max Lag")
+            row = layout.row()
+            row.prop(sceneprops,"multicast_group",text="Group")
+            row.prop(sceneprops,"multicast_port",text="Port")
+            row = layout.row()
+            row.prop(sceneprops,"multicast_interface",text="Interface")
+            row = layout.row()
+            row.prop(sceneprops,"priority_classes",text="Classes")
+            row.prop(sceneprops,"wave_size",text="Wave Size")
+            row = layout.row()
+            row.prop(sceneprops,"priority_max_wait",text="Max Wait")
+            row.prop(sceneprops,"process_budget",text="Budget (ms)")
+            row = layout.row()
+            row.prop(sceneprops,"lease_duration",text="Lease Duration")
+            if bpy.context.scene.modal_flag == True:
+                try:
+                    members = json.loads(sceneprops.members)
+                except ValueError:
+                    members = []
+                box = layout.box()
+                box.label(text="MEMBERS : " + str(len(members)))
+                for member in members:
+                    row = box.row()
+                    row.label(text=member['address'])
+                    if member['rtt'] is None:
+                        row.label(text="-")
+                    else:
+                        row.label(text="{0} ms".format(member['rtt']))
+                try:
+                    classes = json.loads(sceneprops.queue_metrics)
+                except ValueError:
+                    classes = []
+                box = layout.box()
+                box.label(text="OPERATION QUEUE")
+                for metrics in classes:
+                    row = box.row()
+                    row.label(text=metrics['class'])
+                    row.label(text="{0} waiting".format(metrics['queued']))
+                    row.label(text="{0} ms avg".format(metrics['mean_wait']))
+            row = layout.row()
+            row.prop(sceneprops,"sync_interval",text="Sync Interval")
+            row = layout.row()
             #a button that calls bpy.ops.development.start_server()
             row.operator("development.start_server")
             row = layout.row()
@@ -1,6 +1,21 @@
 import os
+import json
 import bpy
 import bmesh
+from array import array
+from . import identity
+from . import snapshot
+from . import binformat
+from . import meshdelta
+
+#the extension of the file that stores the ids and names of the objects in a snapshot
+MANIFEST_EXTENSION = ".ids.json"
+#the extensions of the files that make up a snapshot (these are the only files a client can request)
+SNAPSHOT_EXTENSIONS = (".dae",MANIFEST_EXTENSION,snapshot.EXTENSION)
+#the suffix added to the name of a snapshot while it is being written
+TEMP_SUFFIX = ".tmp"
+#the share of the objects of a snapshot that may be new or changed for a diff load, above it the snapshot is loaded in full
+DIFF_LIMIT = 0.5
     
 def format_file_path(pathname):
     '''formats a path name to replace backslashes with forward slashes
@@ -63,52 +78,239 @@ def create_file(path,name):
     output_file.close()
     
 
-def save_state(path,name):
-    ''' exports the current state of the scene to a collada (.dae) file 
+def snapshot_extension(fmt=None):
+    ''' gets the extension of the snapshot file of a format
+    
+    Parameters
+    fmt          -- a string containing the snapshot format ('DAE','BINARY'), None uses the snapshot_format property
+    
+    Return Value
+    extension    -- a string containing the extension (e.g. '.dae')
+    '''
+    
+    if fmt is None:
+        fmt = bpy.context.scene.snapshot_format
+    if fmt == 'BINARY':
+        return snapshot.EXTENSION
+    return ".dae"
+
+def save_state(path,name,fmt=None):
+    ''' exports the current state of the scene to a collada (.dae) file or a binary snapshot
     
     Parameters
     path         -- a string that contains the filepath to the folder where the file will be saved
     name         -- a string that contains the filename of the file to save
+    fmt          -- a string containing the snapshot format ('DAE','BINARY'), None uses the snapshot_format property
     '''
     
     if not os.path.isdir(path):
         create_directory(path) 
-    filename = path + "/" + name
+    if fmt is None:
+        fmt = bpy.context.scene.snapshot_format
+        
+    #the files are written under a temporary name and then renamed, so a reader never sees a half-written file
+    temp_name = name + TEMP_SUFFIX
+    write_state(path,temp_name,fmt)
+    commit_files(path,temp_name,name,snapshot_files(fmt))
+    
+def write_state(path,name,fmt):
+    ''' writes the files of a snapshot directly under the given name
+    
+    Parameters
+    path         -- a string that contains the filepath to the folder where the files will be saved
+    name         -- a string that contains the filename of the files
+    fmt          -- a string containing the snapshot format ('DAE','BINARY')
+    '''
+    
+    if fmt == 'BINARY':
+        snapshot.save(path,name)
+    else:
+        bpy.ops.wm.collada_export(filepath=path + "/" + name + ".dae",triangulate=False)
+        save_manifest(path,name)
+        #the binary records let a diff load build only the objects that changed instead of importing the whole file
+        snapshot.save(path,name)
+        
+def snapshot_files(fmt):
+    ''' gets the extensions of the files that make up a snapshot
+    
+    Parameters
+    fmt          -- a string containing the snapshot format ('DAE','BINARY')
+    
+    Return Value
+    extensions   -- a tuple of extensions
+    '''
     
-    bpy.ops.wm.collada_export(filepath=filename,triangulate=False)
+    if fmt == 'BINARY':
+        return (snapshot.EXTENSION,)
+    return (".dae",MANIFEST_EXTENSION,snapshot.EXTENSION)
         
-def load_state(path,name):
-    ''' imports a scene from a collada(.dae) file 
+def commit_files(path,temp_name,name,extensions):
+    ''' atomically replaces the files of a snapshot with the ones written under a temporary name
+    
+    Parameters
+    path         -- a string that contains the filepath to the folder of the files
+    temp_name    -- a string that contains the temporary filename
+    name         -- a string that contains the final filename
+    extensions   -- a tuple of the extensions of the files to rename
+    '''
+    
+    for extension in extensions:
+        os.replace(path + "/" + temp_name + extension,path + "/" + name + extension)
+    
+def save_manifest(path,name):
+    ''' writes the ids and names of all objects to a manifest file that accompanies a snapshot
+    
+    Parameters
+    path         -- a string that contains the filepath to the folder where the file will be saved
+    name         -- a string that contains the filename of the snapshot
+    '''
+    
+    if not os.path.isdir(path):
+        create_directory(path)
+        
+    manifest = {}
+    for obj in bpy.data.objects:
+        obj_id = identity.get_id(obj)
+        #objects that do not have an id yet (e.g. from an older snapshot) get one here
+        if obj_id == '':
+            obj_id = identity.new_id()
+            obj[identity.ID_PROPERTY] = obj_id
+        manifest[obj_id] = {'name' : obj.name, 'hash' : snapshot.object_hash(obj)}
+        
+    output_file = open(path + "/" + name + MANIFEST_EXTENSION,'w')
+    json.dump(manifest,output_file)
+    output_file.close()
+    
+def load_manifest(path,name):
+    ''' reads the manifest that accompanies a snapshot
+    
+    Parameters
+    path         -- a string that contains the filepath of the folder where the manifest is located
+    name         -- a string that contains the filename of the snapshot
+    
+    Return Value
+    manifest     -- a dict object that maps object ids to their entries (empty if there is no valid manifest)
+    '''
+    
+    try:
+        manifest_file = open(path + "/" + name + MANIFEST_EXTENSION,'r')
+        manifest = json.load(manifest_file)
+        manifest_file.close()
+    except (IOError,ValueError):
+        manifest = {}
+        
+    return manifest
+
+def restore_names(path,name,imported_objects):
+    ''' restores the names and ids of imported objects using the manifest of a snapshot
+    
+    Parameters
+    path              -- a string that contains the filepath of the folder where the manifest is located
+    name              -- a string that contains the filename of the snapshot
+    imported_objects  -- a list of the objects created by the import
+    
+    The collada exporter replaces '.' with '_' in object names. Objects found in the manifest get back their exact
+    name and id; the others (or all of them if there is no manifest) fall back to replacing '_' with '.'.
+    '''
+    
+    manifest = load_manifest(path,name)
+        
+    #index the manifest by the names the objects have after a collada round trip
+    exported = {}
+    for obj_id,entry in manifest.items():
+        exported[entry['name'].replace(".","_")] = (obj_id,entry['name'])
+        
+    for obj in imported_objects:
+        if obj.name in exported:
+            obj_id,original_name = exported[obj.name]
+            obj.name = original_name
+            obj[identity.ID_PROPERTY] = obj_id
+        else:
+            obj.name = obj.name.replace("_",".")
+        
+def load_state(path,name,mode=None,fmt=None):
+    ''' imports a scene from a collada(.dae) file or a binary snapshot
     
     Parameters
     path         -- a string that contains the filepath of the folder where the file will be loaded
     name         -- a string that contains the filename of the collada file to load
+    mode         -- a string containing the load mode (None uses the load_mode property of the scene)
+                 -- 'FULL' -> clear the scene and import everything
+                 -- 'DIFF' -> only add, remove or patch the objects that differ from the snapshot
+    fmt          -- a string containing the snapshot format ('DAE','BINARY'), None uses the snapshot_format property
     
     Return Value
     load_flag    -- a boolean value used to indicate whether a file was loaded (True) or not (False)
     '''
     filename = path + "/" + name + ".dae"
-    if os.path.isfile(filename):
+    if mode is None:
+        mode = bpy.context.scene.load_mode
+    if fmt is None:
+        fmt = bpy.context.scene.snapshot_format
+        
+    if fmt == 'BINARY':
+        load_flag = snapshot.load(path,name,mode)
+    elif os.path.isfile(filename) and mode == 'DIFF':
+        if bpy.context.mode in ('EDIT_MESH'):
+            bpy.ops.object.editmode_toggle()
+        load_flag = diff_state(path,name)
+        #without the mesh records there is nothing to diff against, so the full load is used
+        if not load_flag:
+            load_flag = load_state(path,name,'FULL',fmt)
+    elif os.path.isfile(filename):
         #clear the scene to remove objects that are not part of the state to load
         if bpy.context.mode in ('EDIT_MESH'):
             #move to object mode to properly select all objects
             bpy.ops.object.editmode_toggle()
         bpy.ops.object.select_all(action='SELECT')
         bpy.ops.object.delete()
+        existing = set(bpy.data.objects.keys())
         bpy.ops.wm.collada_import(filepath=filename)
-        format_obj_names("_",".")
+        imported = [obj for obj in bpy.data.objects if obj.name not in existing]
+        restore_names(path,name,imported)
         load_flag = True
     else:
         load_flag = False
         
     return load_flag
         
-def check_file(path,name):
+def diff_state(path,name):
+    ''' applies a snapshot to the current scene by changing only the objects that differ from it
+    
+    Parameters
+    path         -- a string that contains the filepath of the folder where the snapshot is located
+    name         -- a string that contains the filename of the snapshot
+    
+    Return Value
+    load_flag    -- a boolean value indicating whether the snapshot was applied (False if it has no mesh records or too
+                    many objects changed, a full load is used then)
+    
+    A collada snapshot is written along with the binary records of its objects (see write_state). Objects are matched
+    by id and compared by content hash, and only the records of the new or changed objects are read and built, so
+    nothing is imported. Local objects that are not in the snapshot are removed once the diff is known to apply.
+    '''
+    
+    filename = path + "/" + name + snapshot.EXTENSION
+    if not os.path.isfile(filename):
+        return False
+    try:
+        reader = binformat.SnapshotReader(filename)
+    except (OSError,ValueError):
+        #an older server has no records to send, the received file is empty
+        return False
+    try:
+        load_flag = snapshot.diff(reader,DIFF_LIMIT)
+    finally:
+        reader.close()
+    return load_flag
+
+def check_file(path,name,extension=None):
     '''checks if a file exists
     
     Parameters
     path        -- a string containing the filepath of the folder where the file is located
     name        -- a string containing the filename of the file to check
+    extension   -- a string containing the extension of the file (None uses the extension of the snapshot format)
     
     Return Value
     exist_flag  -- a boolean value used to indicate a file's existence 
@@ -117,7 +319,9 @@ def check_file(path,name):
                 
     '''
     
-    filename = path + "/" + name + ".dae"
+    if extension is None:
+        extension = snapshot_extension()
+    filename = path + "/" + name + extension
     if os.path.isfile(filename):
         exist_flag = True
     elif not os.path.isfile(filename):
@@ -176,78 +380,6 @@ def get_obj_names(target_objects):
         
     return obj_names
 
-def get_obj_index(name,mode,collection):
-    '''gets the index of a particular object in the scene
-    
-    Parameters
-    name           -- the name of the object or type of object (e.g. Cube, Sphere, Monkey)
-    mode           -- an integer value representing the mode of traversal (0 -> from index 0..n-1, 1 -> from index n-1..0)
-    collection     -- an array of objects to traverse
-    
-    Return Value
-    index          -- the integer index of the object
-    '''
-    
-    n = len(collection)
-    
-    for i in range(0,n):
-        if name in collection[i].name and mode == 0:
-            index = i
-            return index
-        elif name in collection[n-1-i].name and mode == 1:
-            index = n-1-i
-            return index
-        
-
-def format_obj_names(remove_char,replace_char):
-
-    '''converts certain charcters to a specified replacement character
-    
-    Parameters
-    remove_char       -- the character to remove
-    replace_char      -- the character that will replace the removed character
- 
-    '''
-    
-    for obj in bpy.data.objects:
-        while remove_char in obj.name:
-            obj.name = obj.name.replace(remove_char,replace_char)
-
-def shift_name(name,concat_char,distance,max_num):
-    '''shifts numbered object names (e.g. Cube.001) by a certain increment/decrement
-    
-    Parameters
-    name          -- the original name (string) of the object
-    concat_car    -- character to use when concatenating two strings
-    distance      -- an int value that indicates how far to increment/decrement
-    max_num       -- the maximum number that can be attached to the name
-    
-    Return value
-    shifted_name  -- the shifted name (string)
-    '''
-    
-    #ASSUMPTION: the name consists of only two parts {"Cube","001"} separated by '.'
-    split_name = name.split(".")
-    try:
-        #convert the number_part (str) into an int
-        number_part = int(split_name[1])
-        #increment/decrement by the distance
-        number_part += distance
-    #this error will be raised in cases where there is no number part (e.g. "Cube","Sphere")
-    except IndexError:
-        #set to the max num (e.g Cube becomes Cube.003)
-        number_part = max_num
-        
-    if number_part != 0:
-        #convert the number part (int) to a string with leading zeroes (e.g. 5 becomes "005")
-        number_part = str(number_part).zfill(3)
-        #concatenate back with the concat_char instead of '.'
-        shifted_name = split_name[0] + concat_char + number_part
-    elif number_part == 0:
-        shifted_name = split_name[0]
-
-    return shifted_name
-            
 def get_internals(active_object,select_mode={'vertex_select':True,'edge_select':True,'face_select':True}):
     '''gets the set of selected vertices, edges and faces
     
@@ -298,19 +430,55 @@ def create_bmesh(object_name):
     mesh = bmesh.from_edit_mesh(bpy.data.objects[object_name].data)
     return mesh
 
-def lock_object_selection(excluded_objects,flag):
-    '''locks (or unlocks) all objects from selection, excluding specified objecs
+def get_coords(obj):
+    '''gets the local vertex coordinates of a mesh object, including the changes of an edit mode in progress
     
     Parameters
-    excluded_objects        --a list containing the names of objects not to lock
-    flag                    -- a boolean value representing lock (True) and unlock (False)
+    obj              -- a mesh object
+    
+    Return Value
+    coords           -- an array('f') of vertex coordinates (3 per vertex)
     '''
     
-    for obj in bpy.data.objects:
-        if obj.name not in excluded_objects:
-            obj.hide_select = flag
-            
-            
+    if obj.mode == 'EDIT':
+        #the mesh data only gets the edit mode changes when it is written back
+        obj.update_from_editmode()
+    coords = array('f',[0.0]) * (3 * len(obj.data.vertices))
+    obj.data.vertices.foreach_get('co',coords)
+    return coords
+
+def move_vertices(obj,indices,deltas):
+    '''moves some vertices of a mesh object by offsets in local coordinates
+    
+    Parameters
+    obj              -- a mesh object
+    indices          -- an array('I') of the indices of the vertices to move
+    deltas           -- an array('f') of their offsets (3 per vertex)
+    '''
+    
+    if obj.mode == 'EDIT':
+        #only the moved vertices are touched in the edit mesh
+        bm = bmesh.from_edit_mesh(obj.data)
+        bm.verts.ensure_lookup_table()
+        for n,index in enumerate(indices):
+            co = bm.verts[index].co
+            co.x += deltas[3 * n]
+            co.y += deltas[3 * n + 1]
+            co.z += deltas[3 * n + 2]
+        bmesh.update_edit_mesh(obj.data,False,False)
+    else:
+        #outside of edit mode the coordinates are read and written in bulk
+        coords = get_coords(obj)
+        meshdelta.apply_changes(coords,indices,deltas)
+        obj.data.vertices.foreach_set('co',coords)
+        obj.data.update()
+        
+def vertex_count(obj):
+    '''gets the number of vertices of a mesh object, counting the edit mesh in edit mode'''
+    if obj.mode == 'EDIT':
+        return len(bmesh.from_edit_mesh(obj.data).verts)
+    return len(obj.data.vertices)
+
 def op_equivalent(op1,op2):
     '''checks if two operations are equivalent
     
@@ -329,6 +497,42 @@ def op_equivalent(op1,op2):
         
     return equivalence
 
+def get_pivot():
+    '''gets the pivot point setting of the 3D view and the location of the 3D cursor
+    
+    Return Value
+    pivot_point -- a string containing the pivot point setting ('MEDIAN_POINT' if there is no 3D view)
+    cursor      -- a list containing the coordinates of the 3D cursor
+    '''
+    
+    pivot_point = 'MEDIAN_POINT'
+    #there is no screen when blender runs in the background
+    areas = bpy.context.screen.areas if bpy.context.screen is not None else []
+    for area in areas:
+        if area.type == 'VIEW_3D':
+            pivot_point = area.spaces.active.pivot_point
+            break
+    return pivot_point,list(bpy.context.scene.cursor_location)
+
+def set_pivot(pivot_point,cursor):
+    '''changes the pivot point setting of the 3D views and the location of the 3D cursor
+    
+    Parameters
+    pivot_point -- a string containing the pivot point setting
+    cursor      -- a list containing the coordinates of the 3D cursor
+    
+    Return Value
+    previous    -- a tuple (pivot point, cursor) of the settings before the change, to put them back afterwards
+    '''
+    
+    previous = get_pivot()
+    areas = bpy.context.screen.areas if bpy.context.screen is not None else []
+    for area in areas:
+        if area.type == 'VIEW_3D':
+            area.spaces.active.pivot_point = pivot_point
+    bpy.context.scene.cursor_location = cursor
+    return previous
+
 def get_select_mode():
     
     mode = {}
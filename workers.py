@@ -0,0 +1,86 @@
+import bpy
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor,Future
+
+#the folder of the add-on that holds the job module
+JOBS_FOLDER = "jobs"
+
+def load_jobs():
+    '''imports the job module as a top-level module, so that worker processes can import it without bpy
+
+    Return Value
+    jobs        -- the collab_jobs module
+
+    Only the jobs folder is put on sys.path. It holds collab_jobs alone, so the modules of the add-on (utils, server,
+    client...) never become importable as top-level modules and cannot shadow other packages.
+    '''
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),JOBS_FOLDER)
+    if folder not in sys.path:
+        sys.path.append(folder)
+    import collab_jobs
+    return collab_jobs
+
+class WorkerPool:
+
+    '''
+    Runs CPU-heavy jobs that do not need bpy (hashing, snapshot writing, log compaction) in worker processes,
+    so they do not compete with the main thread for the interpreter lock. Without worker processes (e.g. they
+    cannot be started on this platform) jobs run in the calling thread.
+
+    Attributes
+    jobs        -- the collab_jobs module
+    executor    -- a ProcessPoolExecutor object (None if worker processes are not available)
+    '''
+
+    def __init__(self,max_workers=None):
+        self.jobs = load_jobs()
+        self.executor = None
+        if max_workers == 0:
+            return
+        #blender's own executable cannot run the workers when processes are spawned (e.g. on windows)
+        python = getattr(bpy.app,'binary_path_python','')
+        if python:
+            multiprocessing.set_executable(python)
+        try:
+            self.executor = ProcessPoolExecutor(max_workers)
+        except (OSError,NotImplementedError):
+            print("Worker processes are not available, jobs run in the server process")
+
+    def submit(self,job,*args):
+        '''starts a job
+
+        Parameters
+        job         -- a string containing the name of a function in collab_jobs
+        args        -- the arguments of the function (they are pickled to the worker)
+
+        Return Value
+        future      -- a Future object holding the result of the job
+        '''
+
+        if self.executor is not None:
+            try:
+                return self.executor.submit(getattr(self.jobs,job),*args)
+            except RuntimeError:
+                #a worker died and the pool is broken, the remaining jobs run in the server process
+                print("Worker pool is broken, jobs run in the server process")
+                self.executor = None
+
+        future = Future()
+        try:
+            future.set_result(getattr(self.jobs,job)(*args))
+        except OSError as error:
+            future.set_exception(error)
+        return future
+
+    def run(self,job,*args):
+        '''runs a job and waits for its result (used from background threads)'''
+        return self.submit(job,*args).result()
+
+    def shutdown(self):
+        '''waits for the running jobs and stops the worker processes'''
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None